@@ -0,0 +1,231 @@
+"""Loopback benchmarks of receiving json+binary frames.
+
+By default, a thread serves envelope-like frames on localhost as fast as it can, and the
+link receives and decodes them, either with copies (recv_until/recv) or with views into
+the receive buffer (recv_until_view/recv_view, as SocketClient does).
+
+With --end-to-end, SocketClient streams from MockStreamingServer instead, first as fast as
+possible for throughput and then at --update-rate for latency.
+
+With --headers, frame headers captured from MockStreamingServer are decoded as in the
+original SocketClient and as it does now, with the stdlib json and with orjson. Run from the
+root of the repository with
+
+    PYTHONPATH=src python -m benchmarks.json_client_benchmark [--end-to-end | --headers]
+"""
+
+import argparse
+import json
+import socket
+import sys
+import threading
+from time import perf_counter, time
+
+import numpy as np
+
+from acconeer.exptool import configs
+from acconeer.exptool.clients import links
+from acconeer.exptool.clients.json import client as json_client
+from acconeer.exptool.clients.json.client import SocketClient
+from acconeer.exptool.clients.mock.server import MockStreamingServer
+
+
+def get_frame(sequence_number, payload):
+    header = {
+        "status": "ok",
+        "result_info": [{"sequence_number": sequence_number, "data_saturated": False}],
+        "payload_size": len(payload),
+    }
+    return json.dumps(header, separators=(",", ":")).encode("ascii") + b"\n" + payload
+
+
+def serve(server_sock, num_frames, payload):
+    conn, _ = server_sock.accept()
+    with conn:
+        frames = [get_frame(i, payload) for i in range(num_frames)]
+        batch_size = 100
+        for i in range(0, num_frames, batch_size):
+            conn.sendall(b"".join(frames[i : i + batch_size]))
+
+        # Wait for the client to close the connection
+        conn.recv(1)
+
+
+def run(num_frames, num_depths, use_views):
+    payload = np.arange(num_depths, dtype=">u2").tobytes()
+
+    server_sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_sock.bind(("127.0.0.1", 0))
+    server_sock.listen(1)
+    port = server_sock.getsockname()[1]
+
+    server = threading.Thread(target=serve, args=(server_sock, num_frames, payload))
+    server.start()
+
+    link = links.SocketLink("127.0.0.1")
+    link._PORT = port
+    link.connect()
+
+    if use_views:
+        recv_until, recv = link.recv_until_view, link.recv_view
+    else:
+        recv_until, recv = link.recv_until, link.recv
+
+    t0 = perf_counter()
+    for _ in range(num_frames):
+        header = json.loads(str(recv_until(b"\n"), "ascii"))
+        payload = recv(header["payload_size"])
+        np.frombuffer(payload, dtype=">u2").astype("float")
+
+    elapsed = perf_counter() - t0
+
+    link.disconnect()
+    server.join()
+    server_sock.close()
+
+    return num_frames / elapsed, link.bytes_copied / num_frames
+
+
+def run_end_to_end(num_frames, update_rate, range_interval):
+    """Stream from MockStreamingServer, get frames/s and latencies (s) of the frames."""
+    server = MockStreamingServer("127.0.0.1", 0, update_rate=update_rate, timestamps=True)
+    server.start_thread()
+
+    config = configs.EnvelopeServiceConfig()
+    config.range_interval = range_interval
+    config.update_rate = None
+
+    client = SocketClient("127.0.0.1")
+    client._link._PORT = server.port
+    client.start_session(config)
+
+    latencies = np.empty(num_frames)
+    t0 = perf_counter()
+    for i in range(num_frames):
+        info, _ = client.get_next()
+        latencies[i] = time() - info["server_time"]
+
+    elapsed = perf_counter() - t0
+
+    client.disconnect()
+    server.stop_thread()
+
+    return num_frames / elapsed, latencies
+
+
+def end_to_end_main(args):
+    range_interval = [0.2, 0.2 + args.num_depths * 0.485e-3]
+
+    frame_rate, _ = run_end_to_end(args.num_frames, 0, range_interval)
+    print("throughput {:9.0f} frames/s".format(frame_rate))
+
+    num_frames = min(args.num_frames, int(10 * args.update_rate))
+    _, latencies = run_end_to_end(num_frames, args.update_rate, range_interval)
+    print(
+        "latency at {:g} Hz: median {:.3f} ms, p99 {:.3f} ms, max {:.3f} ms".format(
+            args.update_rate, *(1e3 * np.percentile(latencies, [50, 99, 100]))
+        )
+    )
+
+
+def capture_headers(num_frames, num_sensors):
+    server = MockStreamingServer("127.0.0.1", 0, update_rate=0)
+    server.start_thread()
+
+    config = configs.EnvelopeServiceConfig()
+    config.sensor = list(range(1, num_sensors + 1))
+    config.update_rate = None
+
+    client = SocketClient("127.0.0.1")
+    client._link._PORT = server.port
+    client.start_session(config)
+
+    headers = []
+    for _ in range(num_frames):
+        packed = client._link.recv_until(b"\n")
+        headers.append(bytes(packed))
+        client._link.recv_view(json.loads(packed)["payload_size"])
+
+    client.disconnect()
+    server.stop_thread()
+
+    return headers
+
+
+def decode_header_legacy(packed):
+    header = json.loads(str(packed, "ascii"))
+
+    raw_infos = header["result_info"]
+    mapped_infos = [{} for _ in raw_infos]
+
+    for (raw_info, mapped_info) in zip(raw_infos, mapped_infos):
+        for raw_key, val in raw_info.items():
+            mapped_key = json_client.DATA_HEADER_TO_INFO_KEY_REMAP.get(raw_key, raw_key)
+
+            if mapped_key is None:
+                continue
+
+            mapped_info[mapped_key] = val
+
+    return header, mapped_infos
+
+
+def headers_main(args):
+    headers = capture_headers(args.num_frames, args.num_sensors)
+    print("{} headers, {} sensor(s), e.g. {}".format(len(headers), args.num_sensors, headers[0]))
+
+    client = SocketClient("127.0.0.1", squeeze=False)
+
+    def decode_header(packed):
+        header = json_client.loads_header(packed)
+        return header, client._decode_stream_header(header)
+
+    orjson = json_client.orjson
+    variants = [("legacy", decode_header_legacy, None), ("json", decode_header, None)]
+    if orjson is not None:
+        variants.append(("orjson", decode_header, orjson))
+    else:
+        print("orjson is not installed")
+
+    for name, fun, backend in variants:
+        json_client.orjson = backend
+        assert fun(headers[0]) == decode_header_legacy(headers[0])
+
+        t0 = perf_counter()
+        for packed in headers:
+            fun(packed)
+
+        elapsed = perf_counter() - t0
+        print("{:<7} {:6.2f} us per header".format(name, 1e6 * elapsed / len(headers)))
+
+    json_client.orjson = orjson
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-n", "--num-frames", type=int, default=100000)
+    parser.add_argument("-d", "--num-depths", type=int, default=1238)
+    parser.add_argument("--end-to-end", action="store_true")
+    parser.add_argument("--update-rate", type=float, default=100)
+    parser.add_argument("--headers", action="store_true")
+    parser.add_argument("--num-sensors", type=int, default=1)
+    args = parser.parse_args()
+
+    if args.end_to_end:
+        end_to_end_main(args)
+        sys.exit()
+
+    if args.headers:
+        headers_main(args)
+        sys.exit()
+
+    frame_size = len(get_frame(0, bytes(2 * args.num_depths)))
+    print("{} frames of {} bytes".format(args.num_frames, frame_size))
+
+    for use_views in (False, True):
+        frame_rate, bytes_copied = run(args.num_frames, args.num_depths, use_views)
+        print(
+            "{:<7} {:9.0f} frames/s, {:8.1f} bytes copied per frame".format(
+                "views" if use_views else "copies", frame_rate, bytes_copied
+            )
+        )
@@ -0,0 +1,175 @@
+"""Benchmarks of the envelope Processor in client/processing.py.
+
+The CFAR threshold of a sweep is calculated with a loop over the depth indexes as before,
+with the windows of all depth indexes gathered at once (calculate_cfar_threshold), and into
+the cached buffers of Processor (calculate_threshold), one-sided and two-sided. Run from
+the root of the repository with
+
+    PYTHONPATH=src:client python -m benchmarks.processor_benchmark [--data-length 1651]
+
+With --merge, hundreds of candidate peaks are merged with the loop counting the neighbors of
+every peak in each round as before, and with Processor.merge_peaks as now.
+
+With --batch, blocks of sweeps are processed with Processor.process one sweep at a time, and
+with Processor.process_batch, for both threshold types.
+"""
+
+import argparse
+import sys
+from time import perf_counter
+
+import numpy as np
+
+import acconeer.exptool as et
+from processing import PEAK_MERGE_LIMIT_M, Processor, ProcessingConfiguration
+from tests.test_processor import calculate_cfar_threshold_legacy, merge_peaks_legacy
+
+
+def get_processor(data_length, threshold_type, cfar_one_sided=False, nbr_average=5):
+    sensor_config = et.configs.EnvelopeServiceConfig()
+    sensor_config.update_rate = 10
+    session_info = {
+        "range_start_m": 0.2,
+        "range_length_m": data_length * 0.484e-3,
+        "data_length": data_length,
+    }
+
+    processing_config = ProcessingConfiguration()
+    processing_config.threshold_type = threshold_type
+    processing_config.cfar_one_sided = cfar_one_sided
+    processing_config.nbr_average = nbr_average
+
+    return Processor(sensor_config, processing_config, session_info)
+
+
+def get_sweep(data_length, seed=0):
+    rng = np.random.default_rng(seed)
+    depths = np.arange(data_length)
+    peaks = sum(a * np.exp(-(((depths - d) / 40) ** 2)) for a, d in [(3000, 300), (1500, 900)])
+    return peaks + rng.normal(200, 20, data_length)
+
+
+def time_per_call(fun, num_calls):
+    t0 = perf_counter()
+    for _ in range(num_calls):
+        fun()
+
+    return (perf_counter() - t0) / num_calls
+
+
+def cfar_main(args):
+    sweep = get_sweep(args.data_length)
+    print("CFAR threshold of a sweep with data_length {}".format(args.data_length))
+
+    for one_sided in (False, True):
+        processor = get_processor(
+            args.data_length, ProcessingConfiguration.ThresholdType.CFAR, one_sided
+        )
+        cfar_args = (sweep, processor.idx_cfar_pts, processor.cfar_sensitivity, one_sided)
+
+        variants = [
+            ("loop", lambda: calculate_cfar_threshold_legacy(*cfar_args)),
+            ("gathered", lambda: processor.calculate_cfar_threshold(*cfar_args)),
+            ("cached", lambda: processor.calculate_threshold(sweep)),
+        ]
+
+        expected = calculate_cfar_threshold_legacy(*cfar_args)
+        for name, fun in variants:
+            np.testing.assert_array_equal(fun(), expected)
+
+            num_calls = 20 if name == "loop" else args.num_calls
+            print(
+                "{:<10} {:<8} {:9.1f} us".format(
+                    "one-sided" if one_sided else "two-sided",
+                    name,
+                    1e6 * time_per_call(fun, num_calls),
+                )
+            )
+
+
+def merge_main(args):
+    processor = get_processor(args.data_length, ProcessingConfiguration.ThresholdType.CFAR)
+    merge_max_range = np.round(PEAK_MERGE_LIMIT_M / processor.dr)
+    rng = np.random.default_rng(0)
+
+    print(
+        "Merging candidate peaks within {:g} of {} depths".format(
+            merge_max_range, args.data_length
+        )
+    )
+
+    for num_peaks in [100, 300, 1000]:
+        peaks = sorted(rng.choice(args.data_length, num_peaks, replace=False).tolist())
+
+        variants = [
+            ("loop", lambda: merge_peaks_legacy(peaks, merge_max_range)),
+            ("heap", lambda: processor.merge_peaks(peaks, merge_max_range)),
+        ]
+
+        expected = merge_peaks_legacy(peaks, merge_max_range)
+        for name, fun in variants:
+            assert fun() == expected
+
+            num_calls = 1 if name == "loop" else 20
+            print(
+                "{:5} peaks {:<5} {:9.2f} ms".format(
+                    num_peaks, name, 1e3 * time_per_call(fun, num_calls)
+                )
+            )
+
+
+def batch_main(args):
+    rng = np.random.default_rng(0)
+    sweeps = get_sweep(args.data_length) + rng.normal(0, 20, (args.batch_size, args.data_length))
+    infos = [{}] * args.batch_size
+    print(
+        "Processing blocks of {} sweeps with data_length {}".format(
+            args.batch_size, args.data_length
+        )
+    )
+
+    for threshold_type in ProcessingConfiguration.ThresholdType:
+        if threshold_type is ProcessingConfiguration.ThresholdType.RECORDED:
+            continue
+
+        for nbr_average in [1, 5]:
+            processor = get_processor(args.data_length, threshold_type, nbr_average=nbr_average)
+            batch_processor = get_processor(
+                args.data_length, threshold_type, nbr_average=nbr_average
+            )
+
+            def process():
+                for sweep, info in zip(sweeps, infos):
+                    processor.process(sweep, info)
+
+            t_process = time_per_call(process, 5)
+            t_batch = time_per_call(lambda: batch_processor.process_batch(sweeps, infos), 5)
+            print(
+                "{:<6} nbr_average {}  process {:7.2f} ms  batch {:7.2f} ms  {:4.1f}x".format(
+                    threshold_type.name,
+                    nbr_average,
+                    1e3 * t_process,
+                    1e3 * t_batch,
+                    t_process / t_batch,
+                )
+            )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-d", "--data-length", type=int, default=1651)
+    parser.add_argument("-n", "--num-calls", type=int, default=1000)
+    parser.add_argument("-b", "--batch-size", type=int, default=100)
+    parser.add_argument("--merge", action="store_true")
+    parser.add_argument("--batch", action="store_true")
+    args = parser.parse_args()
+
+    if args.batch:
+        batch_main(args)
+        sys.exit()
+
+    if args.merge:
+        merge_main(args)
+        sys.exit()
+
+    cfar_main(args)
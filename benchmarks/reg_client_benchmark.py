@@ -0,0 +1,734 @@
+"""Benchmark of register transactions over UART, against a stand-in for the module.
+
+The stand-in link answers register and buffer requests as the module would, with the
+transfer time of the bytes at the given baudrate, a processing time per request, and a fixed
+latency each time the host sends and then waits for a response, as with the latency timer of
+USB serial adapters. Session setup, supported modes and polled frames are timed with all
+requests sent back-to-back (pipelined), and one at a time as before. Run from the root of
+the repository with
+
+    PYTHONPATH=src python -m benchmarks.reg_client_benchmark [--baudrate 115200] [--latency 1e-3]
+
+With --decode, the unpacking and decoding of streamed frames in UARTClient is timed, as
+before (copying parsing and a linear search for the registers) and as it is now (parsing
+without copies and indexed registers).
+
+With --serial-reader, the serial reader process of SerialProcessLink is measured against
+a pty pair, polling every 2.5 ms as before and blocking on the serial port as now: its CPU
+usage while idle and the latency of frames written to the pty at a steady rate.
+
+With --transport, the throughput of the reader processes is measured, with frames passed
+through a multiprocessing queue as before and through a shared memory ring buffer as now.
+UART frames are streamed through a pty pair to SerialProcessLink, and SPI frames are
+produced by a process and read by the main process as SPIClient does. SPIClient is then
+also streamed from end to end, with a fake FT4222 device.
+
+With --polling, frames are polled from PollingUARTClient and SPIClient with DATA_READY set
+as the module would, periodically at --update-rate or on call. The status is read back to
+back as before and scheduled by DataReadyPoller as now: the status reads per frame, the
+latency until DATA_READY is seen (UART) and the CPU usage of the SPI process.
+
+With --bulk, the SPI transfers per frame are counted, with a write and a read per request
+as by default, and in full duplex (SPIClient(_full_duplex=True)), each request sent while
+the response to the one before is read.
+"""
+
+import argparse
+import multiprocessing as mp
+import os
+import queue
+import struct
+import threading
+import tty
+from time import perf_counter, process_time, sleep
+
+import numpy as np
+import serial
+
+from acconeer.exptool import configs, libft4222
+from acconeer.exptool.clients import links
+from acconeer.exptool.clients.reg import client as reg_client
+from acconeer.exptool.clients.reg import protocol, regmap
+from acconeer.exptool.clients.reg.client import (
+    PollingUARTClient,
+    RegBaseClient,
+    SPIClient,
+    SPICommProcess,
+    UARTClient,
+)
+from acconeer.exptool.clients.reg.polling import DataReadyPoller
+from acconeer.exptool.modes import Mode, get_mode
+from tests.stand_ins import DataReadyTiming, FakeFT4222Device, ModuleStandInLink
+
+
+def get_client(args, pipelined):
+    client = PollingUARTClient(None)
+    client._link = ModuleStandInLink(args.baudrate, args.latency)
+
+    if not pipelined:
+        # One request at a time, as before pipelining
+        client._transact_regs = RegBaseClient._transact_regs.__get__(client)
+
+    client._connected = True
+    return client
+
+
+def get_next_one_by_one(client):
+    """Get a polled frame as PollingUARTClient did before pipelining."""
+    client._write_reg("main_control", "clear_status")
+    client._read_reg("status")
+    client._read_buf_raw()
+
+    for reg in regmap.get_data_info_regs(client._config.mode):
+        k = regmap.STRIPPED_NAME_TO_INFO_REMAP.get(reg.stripped_name, reg.stripped_name)
+
+        if k is not None:
+            client._read_reg(reg)
+
+
+def get_reg_legacy(value, mode=None):
+    """Look up a register as regmap.get_reg did before indexing."""
+    if isinstance(value, regmap.Register):
+        return value
+
+    mode = get_mode(mode)
+    matches = []
+
+    for reg in regmap.REGISTERS:
+        if isinstance(value, int):
+            match = reg.addr == value
+        else:
+            match = value in (reg.full_name, reg.stripped_name)
+
+        if match and (mode is None or reg.modes is None or mode in reg.modes):
+            matches.append(reg)
+
+    if len(matches) != 1:
+        raise ValueError("unknown or ambiguous reg: {}".format(value))
+
+    return matches[0]
+
+
+def unpack_stream_data_segment_legacy(segment):
+    """Unpack the segment of a stream data packet as protocol did before, with copies."""
+    result_info = None
+    buffer = None
+    rest = segment
+    while len(rest) > 0:
+        part_type = rest[0]
+        data_start_index = 1 + protocol.LEN_FIELD_SIZE
+        part_len = int.from_bytes(rest[1:data_start_index], protocol.BO)
+        data_end_index = data_start_index + part_len
+        part_data = rest[data_start_index:data_end_index]
+        rest = rest[data_end_index:]
+
+        if part_type == protocol.STREAM_RESULT_INFO:
+            s = protocol.ADDR_SIZE + protocol.REG_SIZE
+            result_info = []
+            for i in range(part_len // s):
+                addr = part_data[s * i]
+                enc_val = part_data[s * i + 1 : s * (i + 1)]
+                result_info.append(protocol.RegVal(addr, enc_val))
+        elif part_type == protocol.STREAM_BUFFER:
+            buffer = part_data
+
+    return protocol.StreamData(result_info, buffer)
+
+
+def decode_result_info_legacy(result_info, mode):
+    """Decode the result info of a streamed frame as UARTClient did before indexing."""
+    info = {}
+    for addr, enc_val in result_info:
+        reg = get_reg_legacy(addr, mode)
+        val = reg.decode(enc_val)
+        k = reg.stripped_name
+        k = regmap.STRIPPED_NAME_TO_INFO_REMAP.get(k, k)
+
+        if k is None:
+            continue
+
+        info[k] = val
+
+    return info
+
+
+def recv_frame_legacy(buf, mode):
+    """Get (info, buffer) from a received stream packet as UARTClient did before."""
+    packet = buf[:-1]
+    stream_data = unpack_stream_data_segment_legacy(packet[1:])
+    return decode_result_info_legacy(stream_data.result_info, mode), stream_data.buffer
+
+
+def get_stream_packet(result_info, buffer):
+    """Pack a stream packet, followed by the end marker, as received by UARTClient."""
+    buf = bytearray([protocol.STREAM_PACKET])
+    buf.extend(protocol.pack_stream_data_segment(result_info, buffer))
+    buf.append(protocol.END_MARKER)
+    return buf
+
+
+def decode_main(args):
+    num_frames = 100 * args.num_frames
+    print("stream packets with a buffer of {} bytes".format(args.buffer_size))
+
+    for mode in Mode:
+        result_info = [
+            protocol.RegVal(reg.addr, bytes(protocol.REG_SIZE))
+            for reg in regmap.get_data_info_regs(mode)
+        ]
+        buf = get_stream_packet(result_info, bytes(args.buffer_size))
+
+        client = UARTClient(None)
+        client._mode = mode
+        client._recv_packet = lambda allow_recovery_skip=False: protocol.unpack_packet(
+            memoryview(buf)[:-1]
+        )
+
+        info, buffer = client._recv_frame()
+        legacy_info, legacy_buffer = recv_frame_legacy(buf, mode)
+        assert info == legacy_info and buffer == legacy_buffer
+
+        t0 = perf_counter()
+        for _ in range(num_frames):
+            recv_frame_legacy(buf, mode)
+
+        t1 = perf_counter()
+        for _ in range(num_frames):
+            client._recv_frame()
+
+        t2 = perf_counter()
+
+        print(
+            "{:<11} {} info regs, before {:6.2f} us, now {:6.2f} us per frame".format(
+                mode.name,
+                len(result_info),
+                1e6 * (t1 - t0) / num_frames,
+                1e6 * (t2 - t1) / num_frames,
+            )
+        )
+
+
+class QueueSerialProcessLink(links.SerialProcessLink):
+    """SerialProcessLink as it was before the ring buffer, passing data through a queue."""
+
+    def connect(self):
+        self._recv_queue = mp.Queue()
+        self._flow_event = mp.Event()
+        args = (self._port, self._recv_queue, self._flow_event)
+        self._process = mp.Process(target=queue_serial_process_program, args=args, daemon=True)
+        self._process.start()
+        self._flow_event.wait(self._timeout)
+        self._buf = bytearray()
+
+    def recv(self, num_bytes):
+        while len(self._buf) < num_bytes:
+            try:
+                self._buf.extend(self._recv_queue.get(timeout=self._timeout))
+            except queue.Empty:
+                raise links.LinkError("recv timeout")
+
+        data = self._buf[:num_bytes]
+        self._buf = self._buf[num_bytes:]
+        return data
+
+    def recv_view(self, num_bytes):
+        return memoryview(self.recv(num_bytes))
+
+    def disconnect(self):
+        self._flow_event.clear()
+        self._process.join(1)
+
+
+def queue_serial_process_program(port, recv_q, flow_event):
+    ser = serial.Serial(port=port, timeout=0, exclusive=True)
+    flow_event.set()
+    while flow_event.is_set():
+        received = bytearray()
+        while True:
+            data = bytearray(ser.read(4096))
+            if len(data) == 0:
+                break
+            received.extend(data)
+        if len(received) > 0:
+            recv_q.put(received)
+
+        sleep(0.0025)
+
+    ser.close()
+
+
+class PollingSerialProcessLink(links.SerialProcessLink):
+    """SerialProcessLink as it was before blocking on the serial port, polling instead."""
+
+    def connect(self):
+        self._ring = links.SharedRingBuffer()
+        self._flow_event = mp.Event()
+        args = (self._port, self._ring, self._flow_event)
+        self._process = mp.Process(target=polling_serial_process_program, args=args, daemon=True)
+        self._process.start()
+        self._flow_event.wait(self._timeout)
+
+    def disconnect(self):
+        self._flow_event.clear()
+        self._process.join(1)
+        self._ring.close()
+        self._ring.unlink()
+
+
+def polling_serial_process_program(port, ring, flow_event):
+    ser = serial.Serial(port=port, timeout=0, exclusive=True)
+    flow_event.set()
+    while flow_event.is_set():
+        while True:
+            data = ser.read(4096)
+            if len(data) == 0:
+                break
+
+            ring.write(data)
+
+        sleep(0.0025)
+
+    ring.close()
+    ser.close()
+
+
+def get_process_cpu_time(pid):
+    """Get the CPU time (s) used so far by a process, from /proc (Linux only)."""
+    with open("/proc/{}/stat".format(pid)) as f:
+        fields = f.read().rsplit(")", 1)[1].split()
+
+    utime, stime = int(fields[11]), int(fields[12])
+    return (utime + stime) / os.sysconf("SC_CLK_TCK")
+
+
+def run_serial_reader(link_cls, idle_time, num_frames, frame_interval, buffer_size):
+    """Get the idle CPU usage of the reader process (%) and the frame latencies (s)."""
+    mode = Mode.ENVELOPE
+    frame = get_stream_packet(*get_info_and_buffer(mode, buffer_size))
+    frame[:0] = bytes([protocol.START_MARKER]) + (len(frame) - 2).to_bytes(
+        protocol.LEN_FIELD_SIZE, protocol.BO
+    )
+    timestamp_index = len(frame) - 1 - buffer_size  # at the start of the buffer
+
+    master, slave = os.openpty()
+    tty.setraw(slave)
+
+    client = UARTClient(os.ttyname(slave))
+    client._mode = mode
+    client._link = link_cls(os.ttyname(slave))
+    client._link.connect()
+
+    pid = client._link._process.pid
+    cpu_time = get_process_cpu_time(pid)
+    sleep(idle_time)
+    idle_cpu = 100 * (get_process_cpu_time(pid) - cpu_time) / idle_time
+
+    def write():
+        for _ in range(num_frames):
+            struct.pack_into("<d", frame, timestamp_index, perf_counter())
+            os.write(master, frame)
+            sleep(frame_interval)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+
+    latencies = np.empty(num_frames)
+    for i in range(num_frames):
+        _, buffer = client._recv_frame()
+        latencies[i] = perf_counter() - struct.unpack_from("<d", buffer)[0]
+
+    del buffer  # a view into the ring buffer of the link
+    writer.join()
+    client._link.disconnect()
+    os.close(master)
+    os.close(slave)
+
+    return idle_cpu, latencies
+
+
+def serial_reader_main(args):
+    num_frames = 10 * args.num_frames
+    frame_interval = 0.01
+    print(
+        "{} frames of {} bytes, one every {:g} ms".format(
+            num_frames, args.buffer_size, 1e3 * frame_interval
+        )
+    )
+
+    link_classes = [("polling", PollingSerialProcessLink), ("blocking", links.SerialProcessLink)]
+
+    for name, link_cls in link_classes:
+        idle_cpu, latencies = run_serial_reader(
+            link_cls, 2.0, num_frames, frame_interval, args.buffer_size
+        )
+        print(
+            "{:<8} idle CPU {:4.1f} %, latency median {:.3f} ms, p99 {:.3f} ms".format(
+                name, idle_cpu, *(1e3 * np.percentile(latencies, [50, 99]))
+            )
+        )
+
+
+def get_info_and_buffer(mode, buffer_size):
+    result_info = [
+        protocol.RegVal(reg.addr, bytes(protocol.REG_SIZE))
+        for reg in regmap.get_data_info_regs(mode)
+    ]
+    return result_info, bytes(buffer_size)
+
+
+def run_uart_transport(link_cls, num_frames, buffer_size):
+    """Stream UART frames through a pty pair to the link, and get frames/s."""
+    mode = Mode.ENVELOPE
+    frame = get_stream_packet(*get_info_and_buffer(mode, buffer_size))
+    frame[:0] = bytes([protocol.START_MARKER]) + (len(frame) - 2).to_bytes(
+        protocol.LEN_FIELD_SIZE, protocol.BO
+    )
+
+    master, slave = os.openpty()
+    tty.setraw(slave)
+
+    client = UARTClient(os.ttyname(slave))
+    client._mode = mode
+    client._link = link_cls(os.ttyname(slave))
+    client._link.connect()
+
+    def write():
+        for _ in range(num_frames):
+            os.write(master, frame)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+
+    t0, c0 = perf_counter(), process_time()
+    for _ in range(num_frames):
+        client._recv_frame()
+
+    elapsed, cpu_time = perf_counter() - t0, process_time() - c0
+
+    writer.join()
+    client._link.disconnect()
+    os.close(master)
+    os.close(slave)
+
+    # The CPU time includes the writer thread
+    return num_frames / elapsed, cpu_time / num_frames
+
+
+def produce_spi_frames_legacy(data_q, num_frames, info, buffer):
+    for _ in range(num_frames):
+        data_q.put(("get_next", (info, buffer)))
+
+
+def produce_spi_frames(ring, num_frames, segment):
+    for _ in range(num_frames):
+        ring.write_record(segment)
+
+
+def run_spi_transport(use_ring, num_frames, buffer_size):
+    """Pass SPI frames from a process to the main process, and get frames/s."""
+    mode = Mode.ENVELOPE
+    result_info, buffer = get_info_and_buffer(mode, buffer_size)
+
+    client = SPIClient()
+    client._mode = mode
+
+    if use_ring:
+        ring = links.SharedRingBuffer()
+        segment = protocol.pack_stream_data_segment(result_info, buffer)
+        args = (ring, num_frames, segment)
+        producer = mp.Process(target=produce_spi_frames, args=args)
+    else:
+        data_q = mp.Queue()
+        info = client._decode_result_info(np.array(result_info, protocol.RESULT_INFO_DTYPE))
+        args = (data_q, num_frames, info, buffer)
+        producer = mp.Process(target=produce_spi_frames_legacy, args=args)
+
+    producer.start()
+
+    t0, c0 = perf_counter(), process_time()
+    for _ in range(num_frames):
+        if use_ring:
+            stream_data = protocol.unpack_stream_data_segment(ring.read_record_view())
+            client._decode_result_info(stream_data.result_info)
+        else:
+            data_q.get()
+
+    elapsed, cpu_time = perf_counter() - t0, process_time() - c0
+
+    producer.join()
+
+    if use_ring:
+        del stream_data  # a view into the ring
+        ring.close()
+        ring.unlink()
+
+    return num_frames / elapsed, cpu_time / num_frames
+
+
+def run_spi_end_to_end(num_frames, buffer_size):
+    """Stream from SPIClient with a fake FT4222 device, and get frames/s."""
+    device_cls = libft4222.Device
+    libft4222.Device = lambda: FakeFT4222Device(Mode.ENVELOPE, buffer_size // 2)
+
+    try:
+        client = SPIClient()
+        client.start_session(configs.EnvelopeServiceConfig())
+    finally:
+        libft4222.Device = device_cls
+
+    t0 = perf_counter()
+    for _ in range(num_frames):
+        client.get_next()
+
+    elapsed = perf_counter() - t0
+
+    client.disconnect()
+
+    return num_frames / elapsed
+
+
+def transport_main(args):
+    num_frames = 100 * args.num_frames
+    print("{} frames with a buffer of {} bytes".format(num_frames, args.buffer_size))
+
+    print("(CPU time of the main process per frame, with the pty writer thread for UART)")
+
+    for name, link_cls in [("queue", QueueSerialProcessLink), ("ring", links.SerialProcessLink)]:
+        frame_rate, cpu_time = run_uart_transport(link_cls, num_frames, args.buffer_size)
+        print(
+            "UART over pty, {:<5} {:8.0f} frames/s, {:6.1f} MB/s, {:6.1f} us CPU".format(
+                name, frame_rate, 1e-6 * frame_rate * args.buffer_size, 1e6 * cpu_time
+            )
+        )
+
+    for use_ring in (False, True):
+        frame_rate, cpu_time = run_spi_transport(use_ring, num_frames, args.buffer_size)
+        print(
+            "SPI frames,    {:<5} {:8.0f} frames/s, {:6.1f} MB/s, {:6.1f} us CPU".format(
+                "ring" if use_ring else "queue",
+                frame_rate,
+                1e-6 * frame_rate * args.buffer_size,
+                1e6 * cpu_time,
+            )
+        )
+
+    frame_rate = run_spi_end_to_end(num_frames, args.buffer_size)
+    print("SPIClient with a fake FT4222 device {:8.0f} frames/s".format(frame_rate))
+
+
+class BusyPoller(DataReadyPoller):
+    """Reads the status back to back, as before the poller."""
+
+    MIN_INTERVAL = 0.0
+    MAX_INTERVAL = 0.0
+
+    def __init__(self, update_rate=None, periodic=True):
+        super().__init__(None, periodic)
+
+    def _get_typical_time(self):
+        return None
+
+
+def run_uart_polling(args, timing, adaptive, num_frames):
+    """Poll frames from PollingUARTClient, and get the status reads per frame and the
+    latencies (s) from DATA_READY being set until it is seen.
+    """
+    client = PollingUARTClient(None, measure_on_call=timing.period is None)
+    client._link = ModuleStandInLink(args.baudrate, args.latency, timing=timing)
+    client._connected = True
+
+    config = configs.EnvelopeServiceConfig()
+    config.update_rate = None if timing.period is None else 1 / timing.period
+    client._setup_session(config)
+    client._start_session()
+    client._streaming_started = True
+
+    if not adaptive:
+        client._poller = BusyPoller()
+
+    for _ in range(num_frames):
+        client.get_next()
+
+    return client.status_reads_per_frame, np.array(timing.latencies)
+
+
+def run_spi_polling(update_rate, adaptive, num_frames):
+    """Poll frames from SPIClient with a fake FT4222 device, and get the status reads per
+    frame and the CPU usage of the SPI process (%).
+    """
+    timing = DataReadyTiming(1 / update_rate)
+    device_cls = libft4222.Device
+    poller_cls = reg_client.DataReadyPoller
+    libft4222.Device = lambda: FakeFT4222Device(Mode.ENVELOPE, timing=timing)
+
+    if not adaptive:
+        reg_client.DataReadyPoller = BusyPoller
+
+    try:
+        client = SPIClient()
+        config = configs.EnvelopeServiceConfig()
+        config.update_rate = update_rate
+        client.start_session(config)
+    finally:
+        libft4222.Device = device_cls
+        reg_client.DataReadyPoller = poller_cls
+
+    pid = client._proc.pid
+    cpu_time = get_process_cpu_time(pid)
+    t0 = perf_counter()
+
+    for _ in range(num_frames):
+        client.get_next()
+
+    cpu_usage = 100 * (get_process_cpu_time(pid) - cpu_time) / (perf_counter() - t0)
+    status_reads_per_frame = client.status_reads_per_frame
+    client.disconnect()
+
+    return status_reads_per_frame, cpu_usage
+
+
+def polling_main(args):
+    num_frames = 5 * args.num_frames
+    period = 1 / args.update_rate
+    measure_time = 5e-3
+    print(
+        "{} frames, {} baud, {:g} ms latency, {:g} Hz or measured on call in {:g} ms".format(
+            num_frames, args.baudrate, 1e3 * args.latency, args.update_rate, 1e3 * measure_time
+        )
+    )
+
+    for adaptive in (False, True):
+        for name, timing in [
+            ("periodic", DataReadyTiming(period)),
+            ("on call", DataReadyTiming(measure_time=measure_time)),
+        ]:
+            status_reads, latencies = run_uart_polling(args, timing, adaptive, num_frames)
+            print(
+                "UART {:<8} {:<8} {:5.1f} status reads/frame, "
+                "latency median {:.2f} ms, p99 {:.2f} ms".format(
+                    "adaptive" if adaptive else "busy",
+                    name,
+                    status_reads,
+                    *(1e3 * np.percentile(latencies, [50, 99])),
+                )
+            )
+
+    for adaptive in (False, True):
+        status_reads, cpu_usage = run_spi_polling(args.update_rate, adaptive, num_frames)
+        print(
+            "SPI  {:<8} {:<8} {:5.1f} status reads/frame, SPI process CPU {:.0f} %".format(
+                "adaptive" if adaptive else "busy", "periodic", status_reads, cpu_usage
+            )
+        )
+
+
+def run_spi_bulk(full_duplex, num_frames, buffer_size, transfer_time):
+    """Get frames from SPICommProcess, run in this process with a fake FT4222 device, and get
+    the transfers and the time (s) per frame.
+    """
+    mode = Mode.ENVELOPE
+    device = FakeFT4222Device(mode, buffer_size // 2, transfer_time=transfer_time)
+    proc = SPICommProcess(None, None, None, mp.Array("q", 2), full_duplex)
+    proc.dev = device
+    proc.update_state(mode, None, buffer_size)
+    proc.write_reg("main_control", "create", do_log=False)
+    proc.write_reg("main_control", "activate", do_log=False)
+
+    num_transfers = device.num_transfers
+    t0 = perf_counter()
+
+    for _ in range(num_frames):
+        proc.get_next()
+
+    elapsed = perf_counter() - t0
+    return (device.num_transfers - num_transfers) / num_frames, elapsed / num_frames
+
+
+def bulk_main(args):
+    num_frames = 10 * args.num_frames
+    transfer_time = 0.2e-3
+    print(
+        "{} frames of {} bytes, {:g} ms per SPI transfer".format(
+            num_frames, args.buffer_size, 1e3 * transfer_time
+        )
+    )
+
+    for full_duplex in (False, True):
+        transfers, frame_time = run_spi_bulk(
+            full_duplex, num_frames, args.buffer_size, transfer_time
+        )
+        print(
+            "SPI {:<11} {:4.1f} transfers/frame, {:5.2f} ms/frame".format(
+                "full duplex" if full_duplex else "one by one", transfers, 1e3 * frame_time
+            )
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--baudrate", type=int, default=115200)
+    parser.add_argument("--latency", type=float, default=1e-3, help="per send (s)")
+    parser.add_argument("-n", "--num-frames", type=int, default=20)
+    parser.add_argument("--decode", action="store_true")
+    parser.add_argument("--transport", action="store_true")
+    parser.add_argument("--serial-reader", action="store_true")
+    parser.add_argument("--polling", action="store_true")
+    parser.add_argument("--bulk", action="store_true")
+    parser.add_argument("--update-rate", type=float, default=50.0, help="for --polling (Hz)")
+    parser.add_argument("--buffer-size", type=int, default=8192, help="of frames (B)")
+    args = parser.parse_args()
+
+    if args.decode:
+        decode_main(args)
+        return
+
+    if args.transport:
+        transport_main(args)
+        return
+
+    if args.serial_reader:
+        serial_reader_main(args)
+        return
+
+    if args.polling:
+        polling_main(args)
+        return
+
+    if args.bulk:
+        bulk_main(args)
+        return
+
+    print("{} baud, {:g} ms latency".format(args.baudrate, 1e3 * args.latency))
+
+    config = configs.EnvelopeServiceConfig()
+
+    for pipelined in (False, True):
+        client = get_client(args, pipelined)
+
+        t0 = perf_counter()
+        client._get_supported_modes()
+        t1 = perf_counter()
+        client._setup_session(config)
+        t2 = perf_counter()
+
+        client._streaming_started = True
+        for _ in range(args.num_frames):
+            if pipelined:
+                client.get_next()
+            else:
+                get_next_one_by_one(client)
+
+        frame_time = (perf_counter() - t2) / args.num_frames
+
+        print(
+            "{:<11} supported modes {:6.1f} ms, setup {:6.1f} ms, polled frame {:6.1f} ms".format(
+                "pipelined" if pipelined else "one by one",
+                1e3 * (t1 - t0),
+                1e3 * (t2 - t1),
+                1e3 * frame_time,
+            )
+        )
+
+
+if __name__ == "__main__":
+    main()
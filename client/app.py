@@ -44,8 +44,6 @@ def start(get_interval, params):
     app_get_interval = get_interval
     app_params = params
 
-    client = et.SocketClient(params["ip_a"]) # Raspberry Pi uses socket client
-    
     config = et.configs.EnvelopeServiceConfig()
     sensor_config = get_sensor_config(config, params)
     sensor_config.running_average_factor = 0    # use averaging in detector instead
@@ -59,6 +57,15 @@ def start(get_interval, params):
                 setattr(processing_config, k, v)
     nbr_avg = processing_config.nbr_average
 
+    # Raspberry Pi uses socket client. Sweeps are read in the background so that the server
+    # is drained between GETs, and only the newest nbr_avg sweeps are kept for the next GET.
+    # They are processed before the next GET, so they can be copied into the same array.
+    client = et.PrefetchClient(
+        et.SocketClient(params["ip_a"]),
+        queue_size=max(round(nbr_avg), 1),
+        reuse_output=True,
+    )
+
     # Set up session with created config
     connected = False
     tic = time.time()
@@ -85,23 +92,23 @@ def start(get_interval, params):
 def get(counter):
     global app_get_interval, app_params
 
-    infos = []
-
-    # Grab a measurement here - averaged over nbr_avg sweeps for noise reduction
-    for _ in range(round(nbr_avg)):
-        info, sweep = client.get_next()
-        infos += [info]
-        plot_data = processor.process(sweep, info)
-
-        # found_peaks is either None or list of indexes sorted by the chosen peak sorting method
-        if plot_data["found_peaks"]:
-            peaks = np.take(processor.r, plot_data["found_peaks"]) * 100.0
-            # processor.r is the sweep's range depths, created by
+    # Grab a measurement here - nbr_avg sweeps in one go, averaged for noise reduction
+    infos, sweeps = client.get_next_batch(round(nbr_avg))
+    # Only the found peaks are needed here, which process_batch gets for all averaged sweeps
+    # completed within the batch at once
+    result = processor.process_batch(sweeps, infos)
+
+    # main_peak_dist is NaN where no peaks were found, else the distance of the first of the
+    # found peaks, sorted by the chosen peak sorting method
+    for distance in result["main_peak_dist"]:
+        if not np.isnan(distance):
+            # The distances are taken from processor.r, the sweep's range depths, created by
             # numpy.linspace(range_start, range_end, num_depths)
             # where num_depths = Processor.session_info["data_length"]
-            
-            publish_data({"distance": peaks[0]}, DEVICE_NAME)
-            logging.info(f"{time.ctime()[4:-5]}. Get {counter}: {peaks[0]} cm")
+            peak = distance * 100.0
+
+            publish_data({"distance": peak}, DEVICE_NAME)
+            logging.info(f"{time.ctime()[4:-5]}. Get {counter}: {peak} cm")
 
     saturated = any([i.get("data_saturated", False) for i in infos])
     data_quality_warning = any([j.get("data_quality_warning", False) for j in infos])
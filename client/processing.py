@@ -1,5 +1,7 @@
+import heapq
 import warnings
-from copy import copy
+from bisect import bisect_left, bisect_right, insort
+from collections import namedtuple
 from enum import Enum
 
 import numpy as np
@@ -8,6 +10,9 @@ import acconeer.exptool as et
 
 PEAK_MERGE_LIMIT_M = 0.005
 
+# Result of Processor.process_lean, found_peaks are sorted as in Processor.process
+ProcessingResult = namedtuple("ProcessingResult", ["sweep_index", "found_peaks", "distances"])
+
 class Processor:
     """Detector class, which does all the processing."""
     def __init__(self, sensor_config, processing_config, session_info):
@@ -16,8 +21,10 @@ class Processor:
         self.f = sensor_config.update_rate
 
         num_depths = self.session_info["data_length"]
+        self.num_depths = num_depths
 
         self.current_mean_sweep = np.zeros(num_depths)
+        self.weighted_sweep = np.empty(num_depths)
         self.last_mean_sweep = np.full(num_depths, np.nan)
         self.sweeps_since_mean = 0
 
@@ -26,6 +33,7 @@ class Processor:
         self.dr = self.r[1] - self.r[0]
         self.sweep_index = 0
 
+        self.threshold_cache_key = None
         self.update_processing_config(processing_config)
 
     def update_processing_config(self, processing_config):
@@ -46,22 +54,60 @@ class Processor:
         self.cfar_one_sided = processing_config.cfar_one_sided
         self.cfar_sensitivity = processing_config.cfar_sensitivity
 
-    def calculate_cfar_threshold(self, sweep, idx_cfar_pts, alpha, one_side):
+        self.update_threshold_cache()
 
-        threshold = np.full(sweep.shape, np.nan)
+    def update_threshold_cache(self):
+        """Precompute the threshold, or what is needed to calculate it.
+
+        Only redone when a parameter that the cached arrays depend on has changed.
+        """
+        key = (
+            self.threshold_type,
+            self.fixed_threshold_level,
+            tuple(self.idx_cfar_pts),
+            self.cfar_one_sided,
+            self.num_depths,
+        )
 
+        if key == self.threshold_cache_key:
+            return
+
+        self.threshold_cache_key = key
+
+        if self.threshold_type is ProcessingConfiguration.ThresholdType.FIXED:
+            self.fixed_threshold = np.full(self.num_depths, float(self.fixed_threshold_level))
+            self.fixed_threshold.flags.writeable = False
+        elif self.threshold_type is ProcessingConfiguration.ThresholdType.CFAR:
+            idxs, self.cfar_window_idxs = self.get_cfar_windows(
+                self.num_depths, self.idx_cfar_pts, self.cfar_one_sided
+            )
+            self.cfar_windows = np.empty(self.cfar_window_idxs.shape)
+            self.cfar_threshold_span = slice(idxs[0], idxs[-1] + 1) if idxs.size > 0 else slice(0)
+            self.cfar_threshold = np.full(self.num_depths, np.nan)
+            self.cfar_threshold_view = self.cfar_threshold.view()
+            self.cfar_threshold_view.flags.writeable = False
+
+    def get_cfar_windows(self, num_depths, idx_cfar_pts, one_side):
+        """Get the depth indexes with a CFAR threshold, and the window indexes for each."""
         start_idx = np.max(idx_cfar_pts)
         if one_side:
             rel_indexes = -idx_cfar_pts
-            end_idx = sweep.size
+            end_idx = num_depths
         else:
             rel_indexes = np.concatenate((-idx_cfar_pts, +idx_cfar_pts), axis=0)
-            end_idx = sweep.size - start_idx
+            end_idx = num_depths - start_idx
 
-        for idx in np.arange(start_idx, end_idx):
-            threshold[int(idx)] = (
-                1.0 / (alpha + 1e-10) * np.mean(sweep[(idx + rel_indexes).astype(int)])
-            )
+        idxs = np.arange(start_idx, end_idx)
+        return idxs.astype(int), (idxs[:, None] + rel_indexes).astype(int)
+
+    def calculate_cfar_threshold(self, sweep, idx_cfar_pts, alpha, one_side):
+
+        threshold = np.full(sweep.shape, np.nan)
+
+        # Gather the windows of all depth indexes at once, one row per index. Each row keeps
+        # the element order of the window, so the means equal those of a per-index loop.
+        idxs, window_idxs = self.get_cfar_windows(sweep.size, idx_cfar_pts, one_side)
+        threshold[idxs] = 1.0 / (alpha + 1e-10) * np.mean(sweep[window_idxs], axis=1)
 
         return threshold
 
@@ -70,99 +116,109 @@ class Processor:
         if threshold is None or np.all(np.isnan(threshold)):
             return []
 
-        found_peaks = []
+        return self.find_peaks_batch(sweep[None, :], threshold[None, :])[0]
+
+    def find_peaks_batch(self, sweeps, thresholds):
+        """Find peaks in each row of sweeps, using the same row of thresholds."""
+        num_sweeps, N = sweeps.shape
+        if num_sweeps == 0:
+            return []
+
+        thresholds = np.broadcast_to(thresholds, sweeps.shape)
+        depth_idxs = np.arange(N)
 
         # Note: at least 3 samples above threshold are required to form a peak
 
-        d = 1
-        N = len(sweep)
-        while d < (N - 1):
-            # Skip to when threshold starts, applicable only for CFAR
-            if np.isnan(threshold[d - 1]):
-                d += 1
-                continue
+        # Only search where the threshold is defined. For CFAR, it is NaN at both ends.
+        defined = ~np.isnan(thresholds)
+        start = np.argmax(defined, axis=1)
+        undefined_after_start = ~defined & (depth_idxs >= start[:, None])
+        end = np.where(
+            undefined_after_start.any(axis=1), np.argmax(undefined_after_start, axis=1), N
+        )
 
-            # Break when threshold ends, applicable only for CFAR
-            if np.isnan(threshold[d + 1]):
-                break
+        # The last point of the sweep can never be a peak, nor close a plateau
+        n = np.minimum(end, N - 1)
 
-            # At this point, threshold is defined (not NaN)
+        # Pad each row with one point below threshold, so that every plateau ends in its row
+        s = np.zeros((num_sweeps, N + 1))
+        s[:, :N] = sweeps
+        above = np.zeros((num_sweeps, N + 1), dtype=bool)
+        above[:, :N] = (sweeps > thresholds) & (depth_idxs < n[:, None])
 
-            # If the current point is not over threshold, the next will not be
-            # a peak because 3 adjacent samples above the threshold is needed
-            if sweep[d] <= threshold[d]:
-                d += 2
-                continue
+        # A peak can start at d if both d - 1 and d are over threshold, and d is the larger
+        is_start = np.zeros((num_sweeps, N + 1), dtype=bool)
+        is_start[:, 1:] = above[:, :-1] & above[:, 1:] & (s[:, :-1] < s[:, 1:])
+        peak_starts = np.flatnonzero(is_start)
 
-            # Continue if previous point is not over threshold, for the same reason
-            if sweep[d - 1] <= threshold[d - 1]:
-                d += 1
-                continue
+        # A peak is either a single point, or a plateau consisting of several equal
+        # points, all over their threshold. The closest neighboring points on each side of
+        # the point/plateau must have a lower value and also be over their threshold.
+        on_plateau = np.zeros((num_sweeps, N + 1), dtype=bool)
+        on_plateau[:, 1:] = above[:, 1:] & (s[:, 1:] == s[:, :-1])
+        off_plateau = np.flatnonzero(~on_plateau)
+        d_upper = off_plateau[np.searchsorted(off_plateau, peak_starts, side="right")]
 
-            # Continue if this point isn't larger than the previous
-            if sweep[d - 1] >= sweep[d]:
-                d += 1
-                continue
+        s = s.ravel()
+        is_peak = above.ravel()[d_upper] & (s[d_upper] < s[peak_starts])
+        peak_starts = peak_starts[is_peak]
+        delta = d_upper[is_peak] - peak_starts
 
-            # A peak is either a single point, or a plateau consisting of several equal
-            # points, all over their threshold. The closest neighbouring points on each
-            # side of the point/plateau must have a lower value and also be over their
-            # threshold. The next step is to decide if the following point(s) are a peak:
-
-            d_upper = d + 1
-            while True:
-                # If out of range or on last point
-                if (d_upper) >= (N - 1):
-                    break
-
-                # If no threshold value for index d_upper
-                if np.isnan(threshold[d_upper]):
-                    break
-
-                # If d_upper below threshold
-                if sweep[d_upper] <= threshold[d_upper]:
-                    break
-                
-                # Comparing d_upper with d
-                if sweep[d_upper] > sweep[d]:
-                    break
-                elif sweep[d_upper] < sweep[d]:
-                    delta = d_upper - d
-                    found_peaks.append(d + int(np.ceil((delta - 1) / 2.0)))
-                    break
-                else:  # equal
-                    d_upper += 1
-
-            d = d_upper
+        # The middle of a plateau, rounding towards its upper end
+        peaks = peak_starts + delta // 2
 
-        return found_peaks
+        rows, peaks = np.divmod(peaks, N + 1)
+        split_idxs = np.cumsum(np.bincount(rows, minlength=num_sweeps))[:-1]
+        return [p.tolist() for p in np.split(peaks, split_idxs)]
 
     def merge_peaks(self, peak_indexes, merge_max_range):
-        merged_peaks = copy(peak_indexes)
+        """Merge peaks closer than merge_max_range to each other into their mean.
 
-        while True:
-            num_neighbours = np.zeros(len(merged_peaks))  # number of neighbours
-            for i, p in enumerate(merged_peaks):
-                num_neighbours[i] = np.sum(np.abs(np.array(merged_peaks) - p) < merge_max_range)
+        The peak indexes must be in increasing order, as given by find_peaks. Ties between
+        peaks with the same number of neighbors go to the first one, so unsorted peak
+        indexes would not be merged as they were before. Returns the merged peaks, sorted.
+        """
+        merged_peaks = sorted(peak_indexes)
 
-            # Find arg of first peak with max number of neighbours
-            peak_i = np.argmax(num_neighbours)
+        def count_neighbors(peak):
+            # Number of peaks closer than merge_max_range, the peak itself included
+            return bisect_left(merged_peaks, peak + merge_max_range) - bisect_right(
+                merged_peaks, peak - merge_max_range
+            )
 
-            if num_neighbours[peak_i] <= 1:
-                break
+        num_neighbors = {p: count_neighbors(p) for p in merged_peaks}
 
-            peak = merged_peaks[peak_i]
+        # Most neighbors first, ties going to the first peak. Entries are never updated in
+        # place, so those not matching num_neighbors are outdated and skipped.
+        heap = [(-n, p) for p, n in num_neighbors.items()]
+        heapq.heapify(heap)
 
-            remove_mask = np.abs(np.array(merged_peaks) - peak) < merge_max_range   # the mask/condition
-            peaks_to_remove = np.array(merged_peaks)[remove_mask]
+        while heap:
+            n, peak = heapq.heappop(heap)
 
+            if num_neighbors.get(peak) != -n:
+                continue
+
+            if -n <= 1:
+                break
+
+            i_first = bisect_right(merged_peaks, peak - merge_max_range)
+            i_last = bisect_left(merged_peaks, peak + merge_max_range)
+            peaks_to_remove = merged_peaks[i_first:i_last]
+
+            del merged_peaks[i_first:i_last]
             for p in peaks_to_remove:
-                merged_peaks.remove(p)
+                del num_neighbors[p]
 
             # Add back mean peak
-            merged_peaks.append(int(round(np.mean(peaks_to_remove))))
+            insort(merged_peaks, int(round(np.mean(peaks_to_remove))))
 
-            merged_peaks.sort()
+            # Only peaks within twice the merge range are affected by the merge
+            i_first = bisect_right(merged_peaks, peak - 2 * merge_max_range)
+            i_last = bisect_left(merged_peaks, peak + 2 * merge_max_range)
+            for p in merged_peaks[i_first:i_last]:
+                num_neighbors[p] = count_neighbors(p)
+                heapq.heappush(heap, (-num_neighbors[p], p))
 
         return merged_peaks
 
@@ -184,6 +240,183 @@ class Processor:
 
         return [peak_indexes[i] for i in quantity_to_sort.argsort()]
 
+    def update_mean_sweep(self, sweep):
+        # Average envelope sweeps, written to handle varying nbr_average. The sweep is
+        # weighted in float64, so that float32 or uint16 sweeps give the same mean.
+        weight = 1.0 / (1.0 + self.sweeps_since_mean)
+        np.multiply(sweep, weight, out=self.weighted_sweep, dtype=float)
+        self.current_mean_sweep *= 1.0 - weight
+        self.current_mean_sweep += self.weighted_sweep
+        self.sweeps_since_mean += 1
+
+    def calculate_threshold(self, mean_sweep):
+        """Get the threshold for mean_sweep.
+
+        Returns a read-only array from the threshold cache. For CFAR, it is overwritten by
+        the next call.
+        """
+        if self.threshold_type is ProcessingConfiguration.ThresholdType.FIXED:
+            return self.fixed_threshold
+        elif self.threshold_type is ProcessingConfiguration.ThresholdType.CFAR:
+            # Same calculation as calculate_cfar_threshold, but into the cached arrays. The
+            # indexes are known to be valid, and mode="clip" avoids a temporary buffer.
+            np.take(mean_sweep, self.cfar_window_idxs, out=self.cfar_windows, mode="clip")
+            threshold = self.cfar_threshold[self.cfar_threshold_span]
+            np.mean(self.cfar_windows, axis=1, out=threshold)
+            threshold *= 1.0 / (self.cfar_sensitivity + 1e-10)
+            return self.cfar_threshold_view
+        else:
+            print("Unknown thresholding method")
+            return None
+
+    def calculate_thresholds(self, mean_sweeps):
+        """Get the thresholds for each row of mean_sweeps, as a new array.
+
+        Same as calling calculate_threshold for each row, but done for several rows at once.
+        """
+        if self.threshold_type is ProcessingConfiguration.ThresholdType.FIXED:
+            return np.broadcast_to(self.fixed_threshold, mean_sweeps.shape)
+        elif self.threshold_type is ProcessingConfiguration.ThresholdType.CFAR:
+            # Row by row through the cached buffers, which is both faster than gathering
+            # the windows for all rows at once and gives the exact same result
+            thresholds = np.empty(mean_sweeps.shape)
+            for threshold, mean_sweep in zip(thresholds, mean_sweeps):
+                threshold[:] = self.calculate_threshold(mean_sweep)
+
+            return thresholds
+        else:
+            print("Unknown thresholding method")
+            return None
+
+    def detect_peaks(self, mean_sweep, threshold):
+        # First peak-finding, then peak-merging, finally peak sorting.
+        found_peaks = self.find_peaks(mean_sweep, threshold)
+        if len(found_peaks) > 1:
+            found_peaks = self.merge_peaks(found_peaks, np.round(PEAK_MERGE_LIMIT_M / self.dr))
+            found_peaks = self.sort_peaks(found_peaks, mean_sweep)
+
+        return found_peaks
+
+    def process_lean(self, data):
+        """Cheaper alternative to process, for when only the found peaks are needed.
+
+        Only the running mean is updated for each sweep. Returns None, or a
+        ProcessingResult when a new averaged sweep has been processed.
+        """
+        self.update_mean_sweep(data)
+
+        result = None
+
+        if self.sweeps_since_mean >= self.nbr_average:
+            self.sweeps_since_mean = 0
+
+            self.last_mean_sweep = self.current_mean_sweep.copy()
+            self.current_mean_sweep *= 0
+
+            threshold = self.calculate_threshold(self.last_mean_sweep)
+            found_peaks = self.detect_peaks(self.last_mean_sweep, threshold)
+            result = ProcessingResult(
+                sweep_index=self.sweep_index,
+                found_peaks=found_peaks,
+                distances=self.r[found_peaks],
+            )
+
+        self.sweep_index += 1
+
+        return result
+
+    def process_batch(self, sweeps, infos=None):
+        """Process a block of sweeps, with shape (n_sweeps, n_depths), all at once.
+
+        The result, and the state of the processor afterwards, is the same as if process
+        had been called for each sweep. Returns a dict of columns, with one row per averaged
+        sweep completed within the block. The found peaks of all averaged sweeps are
+        concatenated in found_peaks, num_found_peaks tells how many belong to each.
+
+        The gain over process is mostly in the averaging and the threshold, so it is largest
+        with nbr_average > 1. Merging and sorting the peaks is still done per averaged sweep.
+        """
+        if infos is None:
+            warnings.warn(
+                "To leave out infos or set to None is deprecated",
+                DeprecationWarning,
+                stacklevel=2,
+            )
+
+        sweeps = np.asarray(sweeps)
+        num_sweeps = len(sweeps)
+        sweeps_per_mean = max(int(np.ceil(self.nbr_average)), 1)
+
+        mean_sweeps = []
+        mean_sweep_idxs = []
+
+        # First finish the current mean sweep, if one was started before this block
+        i = 0
+        while self.sweeps_since_mean > 0 and i < num_sweeps:
+            self.update_mean_sweep(sweeps[i])
+            i += 1
+
+            if self.sweeps_since_mean >= self.nbr_average:
+                self.sweeps_since_mean = 0
+                mean_sweeps.append(self.current_mean_sweep.copy())
+                mean_sweep_idxs.append(i - 1)
+                self.current_mean_sweep *= 0
+
+        # Then, the same running mean as update_mean_sweep for all full blocks of sweeps
+        num_means = (num_sweeps - i) // sweeps_per_mean
+        block = sweeps[i : i + num_means * sweeps_per_mean]
+        block = block.reshape((num_means, sweeps_per_mean, self.num_depths))
+
+        block_means = np.zeros((num_means, self.num_depths))
+        weighted_block = np.empty_like(block_means)
+        for k in range(sweeps_per_mean):
+            weight = 1.0 / (1.0 + k)
+            np.multiply(block[:, k], weight, out=weighted_block, dtype=float)
+            block_means *= 1.0 - weight
+            block_means += weighted_block
+
+        mean_sweeps = np.concatenate([np.reshape(mean_sweeps, (-1, self.num_depths)), block_means])
+        mean_sweep_idxs.extend(i + sweeps_per_mean * np.arange(1, num_means + 1) - 1)
+        i += num_means * sweeps_per_mean
+
+        # Finally, start a new mean sweep with what is left
+        for sweep in sweeps[i:]:
+            self.update_mean_sweep(sweep)
+
+        thresholds = self.calculate_thresholds(mean_sweeps)
+
+        if thresholds is None:
+            found_peaks = [[] for _ in mean_sweeps]
+        else:
+            found_peaks = self.find_peaks_batch(mean_sweeps, thresholds)
+
+        for j, peaks in enumerate(found_peaks):
+            if len(peaks) > 1:
+                peaks = self.merge_peaks(peaks, np.round(PEAK_MERGE_LIMIT_M / self.dr))
+                found_peaks[j] = self.sort_peaks(peaks, mean_sweeps[j])
+
+        num_found_peaks = np.array([len(peaks) for peaks in found_peaks], dtype=int)
+        flat_found_peaks = np.array([p for peaks in found_peaks for p in peaks], dtype=int)
+        main_peak_dist = np.full(len(mean_sweeps), np.nan)
+        main_peak_dist[num_found_peaks > 0] = self.r[[p[0] for p in found_peaks if p]]
+
+        sweep_idxs = self.sweep_index + np.array(mean_sweep_idxs, dtype=int)
+
+        if len(mean_sweeps) > 0:
+            self.last_mean_sweep = mean_sweeps[-1].copy()
+
+        self.sweep_index += num_sweeps
+
+        return {
+            "sweep_index": sweep_idxs,
+            "last_mean_sweep": mean_sweeps,
+            "threshold": thresholds,
+            "found_peaks": flat_found_peaks,
+            "num_found_peaks": num_found_peaks,
+            "found_peaks_dist": self.r[flat_found_peaks],
+            "main_peak_dist": main_peak_dist,
+        }
+
     def process(self, data, data_info=None):
         """Function is called every frame and should return 
         the struct out_data, which contains all processed data.
@@ -197,23 +430,8 @@ class Processor:
 
         sweep = data
 
-        # Average envelope sweeps, written to handle varying nbr_average
-        weight = 1.0 / (1.0 + self.sweeps_since_mean)
-        self.current_mean_sweep = weight * sweep + (1.0 - weight) * self.current_mean_sweep
-        self.sweeps_since_mean += 1
-
-        # Determining threshold
-        if self.threshold_type is ProcessingConfiguration.ThresholdType.FIXED:
-            threshold = self.fixed_threshold_level * np.ones(sweep.size)
-        elif self.threshold_type is ProcessingConfiguration.ThresholdType.CFAR:
-            threshold = self.calculate_cfar_threshold(
-                self.current_mean_sweep,
-                self.idx_cfar_pts,
-                self.cfar_sensitivity,
-                self.cfar_one_sided,
-            )
-        else:
-            print("Unknown thresholding method")
+        self.update_mean_sweep(sweep)
+        threshold = self.calculate_threshold(self.current_mean_sweep)
 
         found_peaks = None
 
@@ -223,12 +441,10 @@ class Processor:
             self.last_mean_sweep = self.current_mean_sweep.copy()
             self.current_mean_sweep *= 0
 
-            # First peak-finding, then peak-merging, finally peak sorting.
-            found_peaks = self.find_peaks(self.last_mean_sweep, threshold)
-            if len(found_peaks) > 1:
-                found_peaks = self.merge_peaks(found_peaks, np.round(PEAK_MERGE_LIMIT_M / self.dr))
-                found_peaks = self.sort_peaks(found_peaks, self.last_mean_sweep)
+            found_peaks = self.detect_peaks(self.last_mean_sweep, threshold)
 
+        # The threshold is a read-only array from the threshold cache, not a copy. For CFAR,
+        # it is overwritten by the next call.
         out_data = {
             "sweep": sweep,
             "last_mean_sweep": self.last_mean_sweep,
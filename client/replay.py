@@ -0,0 +1,269 @@
+"""Replay recorded envelope sessions through Processor, to tune detection offline.
+
+Recordings (.h5 or .npz, see acconeer.exptool.recording) are processed in a process pool,
+and a result table (CSV, one row per averaged sweep) is written for each recording and
+set of processing parameters, along with a summary.csv of all of them.
+
+    python replay.py site_a.h5 site_b.h5 -o results
+    python replay.py site_a.h5 -o results --param threshold_type=CFAR \\
+        --grid cfar_sensitivity=0.2,0.5 cfar_guard_cm=6,12 peak_sorting_type=CLOSEST,STRONGEST
+
+Parameter values are parsed as JSON when possible (numbers, true/false), otherwise kept as
+strings, which is how enum parameters are given by member name.
+"""
+
+import argparse
+import csv
+import itertools
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+import acconeer.exptool as et
+from processing import Processor, ProcessingConfiguration
+
+TABLE_COLUMNS = [
+    "sweep_index",
+    "sample_time",
+    "num_found_peaks",
+    "main_peak_dist_m",
+    "found_peaks_dist_m",
+]
+
+SUMMARY_COLUMNS = [
+    "recording",
+    "params",
+    "table",
+    "frames",
+    "frames_with_peaks",
+    "main_peak_dist_mean_m",
+    "main_peak_dist_std_m",
+    "elapsed_s",
+]
+
+
+def get_processing_config(params):
+    """Create a processing config with the defaults, overridden by params."""
+    processing_config = ProcessingConfiguration()
+    for k, v in params.items():
+        if not hasattr(processing_config, k):
+            raise ValueError("Unknown processing parameter '{}'".format(k))
+
+        setattr(processing_config, k, v)
+
+    return processing_config
+
+
+def expand_grid(grid):
+    """Get one dict of parameters for each combination of the values in grid."""
+    keys = list(grid.keys())
+    return [dict(zip(keys, values)) for values in itertools.product(*grid.values())]
+
+
+def replay_record(record, params, sensor_index=0):
+    """Run a Processor with the given parameters over all sweeps of record.
+
+    Returns a dict of columns as in TABLE_COLUMNS, where found_peaks_dist_m is a list of
+    arrays, one per averaged sweep.
+    """
+    if record.mode != et.Mode.ENVELOPE:
+        raise ValueError("Only envelope recordings can be replayed, got {}".format(record.mode))
+
+    processor = Processor(
+        record.sensor_config, get_processing_config(params), record.session_info
+    )
+
+    sweeps = np.asarray(record.data)[:, sensor_index]
+    infos = [data_info[sensor_index] for data_info in record.data_info]
+    result = processor.process_batch(sweeps, infos)
+
+    sweep_idxs = result["sweep_index"]
+    if record.sample_times is not None and len(record.sample_times) == len(sweeps):
+        sample_times = np.asarray(record.sample_times)[sweep_idxs]
+    else:
+        sample_times = np.full(len(sweep_idxs), np.nan)
+
+    split_idxs = np.cumsum(result["num_found_peaks"])[:-1]
+
+    return {
+        "sweep_index": sweep_idxs,
+        "sample_time": sample_times,
+        "num_found_peaks": result["num_found_peaks"],
+        "main_peak_dist_m": result["main_peak_dist"],
+        "found_peaks_dist_m": np.split(result["found_peaks_dist"], split_idxs),
+    }
+
+
+def write_table(filename, table):
+    with open(filename, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(TABLE_COLUMNS)
+
+        for row in zip(*(table[k] for k in TABLE_COLUMNS)):
+            *values, dists = row
+            writer.writerow(values + [" ".join("{:.4f}".format(d) for d in dists)])
+
+
+def replay_job(filename, param_sets, out_filenames, sensor_index=0):
+    """Replay one recording with each of param_sets. Runs in a worker process.
+
+    The recording is only loaded once, however many parameter sets there are.
+    """
+    record = et.recording.load(filename)
+
+    summaries = []
+    for params, out_filename in zip(param_sets, out_filenames):
+        tic = time.time()
+        table = replay_record(record, params, sensor_index)
+        write_table(out_filename, table)
+        toc = time.time()
+
+        main_peak_dist = table["main_peak_dist_m"]
+        found = ~np.isnan(main_peak_dist)
+        summaries.append({
+            "recording": filename,
+            "params": json.dumps(params),
+            "table": out_filename,
+            "frames": len(main_peak_dist),
+            "frames_with_peaks": int(np.count_nonzero(found)),
+            "main_peak_dist_mean_m": np.mean(main_peak_dist[found]) if found.any() else np.nan,
+            "main_peak_dist_std_m": np.std(main_peak_dist[found]) if found.any() else np.nan,
+            "elapsed_s": toc - tic,
+        })
+
+    return summaries
+
+
+def get_table_names(filenames):
+    """Get a name for the result tables of each recording, unique among filenames.
+
+    The file stem is used, unless recordings in different directories share it. Those are
+    prefixed by the directories that tell them apart, a_site and b_site for a/site.h5 and
+    b/site.h5.
+    """
+    paths = [os.path.splitext(os.path.abspath(filename))[0] for filename in filenames]
+    names = [os.path.basename(path) for path in paths]
+
+    for name in set(names):
+        idxs = [i for i, n in enumerate(names) if n == name]
+        if len(idxs) > 1:
+            common_dir = os.path.commonpath([os.path.dirname(paths[i]) for i in idxs])
+            for i in idxs:
+                names[i] = os.path.relpath(paths[i], common_dir).replace(os.sep, "_")
+
+    for name in set(names):
+        same_name = [filename for filename, n in zip(filenames, names) if n == name]
+        if len(same_name) > 1:
+            raise ValueError("Recordings {} would share result tables".format(same_name))
+
+    return names
+
+
+def get_jobs(filenames, param_sets, out_dir, num_workers):
+    """Split the work into jobs of one recording and one or more parameter sets.
+
+    With at least as many recordings as workers, each job takes all parameter sets of one
+    recording. Otherwise the parameter sets are spread out so that all workers get a job.
+    The result tables are named by get_table_names.
+    """
+    chunks_per_file = min(max(-(-num_workers // len(filenames)), 1), len(param_sets))
+    chunk_size = -(-len(param_sets) // chunks_per_file)
+
+    jobs = []
+    for filename, stem in zip(filenames, get_table_names(filenames)):
+        if len(param_sets) == 1:
+            out_filenames = [os.path.join(out_dir, stem + ".csv")]
+        else:
+            out_filenames = [
+                os.path.join(out_dir, "{}_p{:03d}.csv".format(stem, i))
+                for i in range(len(param_sets))
+            ]
+
+        for i in range(0, len(param_sets), chunk_size):
+            jobs.append(
+                (filename, param_sets[i : i + chunk_size], out_filenames[i : i + chunk_size])
+            )
+
+    return jobs
+
+
+def run(filenames, param_sets, out_dir, num_workers=None, sensor_index=0):
+    """Replay all recordings with all parameter sets, return the summary rows."""
+    num_workers = num_workers or os.cpu_count() or 1
+    os.makedirs(out_dir, exist_ok=True)
+
+    jobs = get_jobs(filenames, param_sets, out_dir, num_workers)
+    logging.info(f"Replaying {len(filenames)} recording(s) with {len(param_sets)} parameter "
+                 f"set(s), as {len(jobs)} job(s) on {num_workers} worker(s)")
+
+    summaries = []
+    with ProcessPoolExecutor(max_workers=num_workers) as executor:
+        futures = {
+            executor.submit(replay_job, *job, sensor_index=sensor_index): job for job in jobs
+        }
+
+        for future in as_completed(futures):
+            filename = futures[future][0]
+            try:
+                summaries.extend(future.result())
+            except Exception:
+                logging.exception(f"Failed to replay {filename}")
+            else:
+                logging.info(f"Done with {filename}")
+
+    summaries.sort(key=lambda s: s["table"])
+
+    with open(os.path.join(out_dir, "summary.csv"), "w", newline="") as f:
+        writer = csv.DictWriter(f, fieldnames=SUMMARY_COLUMNS)
+        writer.writeheader()
+        writer.writerows(summaries)
+
+    return summaries
+
+
+def parse_value(s):
+    try:
+        return json.loads(s)
+    except ValueError:
+        return s
+
+
+def parse_assignment(s):
+    key, sep, value = s.partition("=")
+    if not sep:
+        raise argparse.ArgumentTypeError("Expected key=value, got '{}'".format(s))
+
+    return key, value
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay recordings through the Processor")
+    parser.add_argument("recordings", nargs="+", help="recorded sessions, .h5 or .npz")
+    parser.add_argument("-o", "--out-dir", default="replay", help="where to write results")
+    parser.add_argument(
+        "--param", nargs="+", default=[], type=parse_assignment, metavar="KEY=VALUE",
+        help="processing parameter used for all runs",
+    )
+    parser.add_argument(
+        "--grid", nargs="+", default=[], type=parse_assignment, metavar="KEY=V1,V2,...",
+        help="processing parameter to sweep, all combinations are run",
+    )
+    parser.add_argument("-j", "--workers", type=int, default=None)
+    parser.add_argument("--sensor-index", type=int, default=0)
+    args = parser.parse_args()
+
+    logging.basicConfig(format="[%(asctime)s] %(levelname)s: %(message)s", level=logging.INFO)
+
+    base_params = {k: parse_value(v) for k, v in args.param}
+    grid = {k: [parse_value(v) for v in values.split(",")] for k, values in args.grid}
+    param_sets = [dict(base_params, **params) for params in expand_grid(grid)]
+
+    # Fail early on bad parameters, rather than in every worker
+    for params in param_sets:
+        get_processing_config(params)
+
+    run(args.recordings, param_sets, args.out_dir, args.workers, args.sensor_index)
@@ -4,7 +4,15 @@ SDK_VERSION = "2.8.2"
 
 
 from . import clients, configs, recording, utils
-from .clients import MockClient, PollingUARTClient, SocketClient, SPIClient, UARTClient
+from .clients import (
+    AsyncSocketClient,
+    MockClient,
+    PollingUARTClient,
+    PrefetchClient,
+    SocketClient,
+    SPIClient,
+    UARTClient,
+)
 from .configs import (
     EnvelopeServiceConfig,
     IQServiceConfig,
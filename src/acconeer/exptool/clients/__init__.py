@@ -1,5 +1,7 @@
+from .json.async_client import AsyncSocketClient
 from .json.client import SocketClient
 from .mock.client import MockClient
+from .prefetch import PrefetchClient
 from .reg.client import PollingUARTClient, SPIClient, UARTClient
 
 
@@ -8,5 +10,7 @@ __all__ = [
     "SPIClient",
     "PollingUARTClient",
     "SocketClient",
+    "AsyncSocketClient",
     "MockClient",
+    "PrefetchClient",
 ]
@@ -1,7 +1,10 @@
 import abc
+import functools
 import logging
 from distutils.version import StrictVersion
 
+import numpy as np
+
 from acconeer.exptool import SDK_VERSION, modes
 from acconeer.exptool.structs import configbase
 
@@ -9,10 +12,41 @@ from acconeer.exptool.structs import configbase
 log = logging.getLogger(__name__)
 
 
-class BaseClient(abc.ABC):
+class DataDecodingMixin:
+    """Decoding of raw frame data into the output arrays of a client.
+
+    Expects the squeeze, dtype and reuse_output attributes, and _out and _reused_outs as
+    set up by BaseClient.
+    """
+
+    def _get_output_array(self, shape, dtype):
+        """Get a new array, or with reuse_output, the array owned by the client for the shape."""
+        if not self.reuse_output:
+            return np.empty(shape, dtype)
+
+        out = self._reused_outs.get(shape)
+        if out is None or out.dtype != dtype:
+            out = self._reused_outs[shape] = np.empty(shape, dtype)
+
+        return out
+
+    def _decode_data(self, raw, shape, iq=False):
+        """Decode the raw data of a frame into the output array, see decode_data."""
+        out = self._out
+
+        if out is None and self.reuse_output:
+            out_shape = shape + (2,) if iq and self.dtype is None else shape
+            out = self._get_output_array(out_shape, get_decoded_dtype(raw.dtype, self.dtype, iq))
+
+        return decode_data(raw, shape, self.dtype, out, iq)
+
+
+class BaseClient(DataDecodingMixin, abc.ABC):
     @abc.abstractmethod
     def __init__(self, **kwargs):
         self.squeeze = kwargs.pop("squeeze", True)
+        self.dtype = kwargs.pop("dtype", "float")  # None to keep the raw dtype of the data
+        self.reuse_output = kwargs.pop("reuse_output", False)
 
         if kwargs:
             a_key = next(iter(kwargs.keys()))
@@ -23,6 +57,9 @@ class BaseClient(abc.ABC):
         self._streaming_started = False
         self.supported_modes = None
 
+        self._out = None
+        self._reused_outs = {}  # by shape, with reuse_output
+
     def connect(self):
         if self._connected:
             raise ClientError("already connected")
@@ -34,15 +71,7 @@ class BaseClient(abc.ABC):
             info = {}
 
         if not info.get("mock"):
-            try:
-                log.info("reported version: {}".format(info["version_str"]))
-
-                if info["strict_version"] < StrictVersion(SDK_VERSION):
-                    log.warning("old server version - please upgrade server")
-                elif info["strict_version"] > StrictVersion(SDK_VERSION):
-                    log.warning("new server version - please upgrade client")
-            except KeyError:
-                log.warning("could not read software version (might be too old)")
+            check_server_version(info)
 
         self.supported_modes = self._get_supported_modes()
 
@@ -81,11 +110,51 @@ class BaseClient(abc.ABC):
         self._streaming_started = True
         return ret
 
-    def get_next(self):
+    def get_next(self, out=None):
+        """Get the info and data of the next frame.
+
+        If out is given, the data is written into it, cast to its dtype. Otherwise, with
+        reuse_output, the data is written into an array owned by the client, which is
+        overwritten by the next frame.
+        """
         if not self._streaming_started:
             raise ClientError("must be streaming to get next")
 
-        return self._get_next()
+        self._out = out
+        try:
+            info, data = self._get_next()
+        finally:
+            self._out = None
+
+        if out is not None and data is not out:
+            np.copyto(out, data, casting="same_kind")
+            data = out
+
+        return info, data
+
+    def get_next_batch(self, n, out=None):
+        """Get the infos and data of the next n frames.
+
+        Returns a list with the info of each frame, as given by get_next, and the data of
+        all frames stacked along a new first axis. out and reuse_output work as in get_next.
+        """
+        if not self._streaming_started:
+            raise ClientError("must be streaming to get next")
+
+        if n < 1:
+            raise ValueError("n must be at least 1")
+
+        self._out = out
+        try:
+            infos, data = self._get_next_batch(n)
+        finally:
+            self._out = None
+
+        if out is not None and data is not out:
+            np.copyto(out, data, casting="same_kind")
+            data = out
+
+        return infos, data
 
     def stop_session(self):
         if not self._streaming_started:
@@ -106,22 +175,33 @@ class BaseClient(abc.ABC):
         self.supported_modes = None
 
     def _check_config(self, config):
-        try:
-            alerts = config.check()
-        except AttributeError:
-            return
-
-        try:
-            error_alert = next(a for a in alerts if a.severity == configbase.Severity.ERROR)
-        except StopIteration:
-            return
-
-        msg = "error in config: {}: {}".format(error_alert.param, error_alert.msg)
-        raise IllegalConfigError(msg)
+        check_config(config)
 
     def _get_supported_modes(self):
         return set(modes.Mode)
 
+    def _get_next_batch(self, n):
+        # Frame by frame, decoded straight into the rows of the batch. Override in clients
+        # which can receive and decode several frames at once.
+        batch = self._out
+        infos = []
+
+        for i in range(n):
+            row = None if batch is None else batch[i]
+            self._out = row
+            info, data = self._get_next()
+
+            if batch is None:
+                batch = self._get_output_array((n,) + data.shape, data.dtype)
+                row = batch[i]
+
+            if data is not row:
+                np.copyto(row, data, casting="same_kind")
+
+            infos.append(info)
+
+        return infos, batch
+
     @abc.abstractmethod
     def _connect(self):
         pass
@@ -159,6 +239,77 @@ class SessionSetupError(ClientError):
     pass
 
 
+def check_server_version(info: dict):
+    try:
+        log.info("reported version: {}".format(info["version_str"]))
+
+        if info["strict_version"] < StrictVersion(SDK_VERSION):
+            log.warning("old server version - please upgrade server")
+        elif info["strict_version"] > StrictVersion(SDK_VERSION):
+            log.warning("new server version - please upgrade client")
+    except KeyError:
+        log.warning("could not read software version (might be too old)")
+
+
+def check_config(config):
+    """Raise IllegalConfigError if the config has an error alert."""
+    try:
+        alerts = config.check()
+    except AttributeError:
+        return
+
+    try:
+        error_alert = next(a for a in alerts if a.severity == configbase.Severity.ERROR)
+    except StopIteration:
+        return
+
+    msg = "error in config: {}: {}".format(error_alert.param, error_alert.msg)
+    raise IllegalConfigError(msg)
+
+
+@functools.lru_cache()
+def get_decoded_dtype(raw_dtype, dtype="float", iq=False):
+    if dtype is None:
+        return np.dtype(raw_dtype).newbyteorder("=")
+
+    dtype = np.dtype(dtype)
+
+    if iq or np.dtype(raw_dtype).kind == "c":
+        return np.result_type(dtype, np.complex64)
+
+    return dtype
+
+
+def decode_data(raw, shape, dtype="float", out=None, iq=False):
+    """Decode the raw data of a frame, e.g. as given by np.frombuffer, to the given shape.
+
+    The data is cast to dtype, or kept as is if dtype is None. Interleaved IQ data is
+    decoded as complex, or kept interleaved in an extra last axis if dtype is None. If out
+    is given, the data is written into it rather than into a new array, cast to its dtype.
+    """
+    if iq and (dtype is None if out is None else out.dtype.kind != "c"):
+        shape = shape + (2,)
+        iq = False
+
+    if out is None:
+        out = np.empty(shape, get_decoded_dtype(raw.dtype, dtype, iq))
+    elif out.shape != shape:
+        raise ValueError("out has shape {}, expected {}".format(out.shape, shape))
+
+    if not iq:
+        np.copyto(out, raw if raw.shape == shape else raw.reshape(shape), casting="same_kind")
+    elif out.flags.c_contiguous:
+        # Copy all at once into the real and imaginary parts, interleaved as in raw
+        pairs = out.view(out.real.dtype).reshape(shape + (2,))
+        np.copyto(pairs, raw.reshape(shape + (2,)), casting="same_kind")
+    else:
+        raw = raw.reshape(shape + (2,))
+        np.copyto(out.real, raw[..., 0], casting="same_kind")
+        np.copyto(out.imag, raw[..., 1], casting="same_kind")
+
+    return out
+
+
 def decode_version_str(version: str) -> dict:
     if "-" in version:
         strict_version = StrictVersion(version.split("-")[0])
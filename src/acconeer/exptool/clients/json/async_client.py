@@ -0,0 +1,315 @@
+import asyncio
+import json
+import logging
+
+import numpy as np
+
+from acconeer.exptool import modes
+from acconeer.exptool.clients import base, links
+from acconeer.exptool.clients.base import (
+    ClientError,
+    SessionSetupError,
+    check_server_version,
+    decode_version_str,
+)
+from acconeer.exptool.clients.json.client import (
+    StreamDecodingMixin,
+    get_session_info_for_header,
+    loads_header,
+)
+
+
+log = logging.getLogger(__name__)
+
+
+class AsyncSocketClient(StreamDecodingMixin):
+    """asyncio version of SocketClient, for the same streaming server.
+
+    connect, setup_session, start_session, get_next, stop_session and disconnect are
+    coroutines, but otherwise work as in SocketClient. While streaming, the client can be
+    iterated over with async for, giving (info, data) for each frame:
+
+        async with AsyncSocketClient(host) as client:
+            session_info = await client.start_session(config)
+            async for info, data in client:
+                ...
+
+    Several clients can stream concurrently in the same event loop.
+    """
+
+    PORT = links.SocketLink._PORT
+    DEFAULT_TIMEOUT = links.SocketLink.DEFAULT_TIMEOUT
+
+    def __init__(self, host, **kwargs):
+        self.squeeze = kwargs.pop("squeeze", True)
+        self.dtype = kwargs.pop("dtype", "float")
+        self.reuse_output = kwargs.pop("reuse_output", False)
+
+        if kwargs:
+            a_key = next(iter(kwargs.keys()))
+            raise TypeError("Got unexpected keyword argument ({})".format(a_key))
+
+        self._host = host
+        self._reader = None
+        self._writer = None
+        self.timeout = self.DEFAULT_TIMEOUT
+
+        self._connected = False
+        self._session_setup_done = False
+        self._streaming_started = False
+        self.supported_modes = None
+
+        self._session_cmd = None
+        self._session_ready = False
+        self._init_stream_decoding()
+        self._out = None
+        self._reused_outs = {}
+
+    async def __aenter__(self):
+        if not self._connected:
+            await self.connect()
+
+        return self
+
+    async def __aexit__(self, *exc_info):
+        if self._connected:
+            await self.disconnect()
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        if not self._streaming_started:
+            raise StopAsyncIteration
+
+        return await self.get_next()
+
+    async def connect(self):
+        if self._connected:
+            raise ClientError("already connected")
+
+        try:
+            self._reader, self._writer = await asyncio.wait_for(
+                asyncio.open_connection(self._host, self.PORT), self.timeout
+            )
+        except (OSError, asyncio.TimeoutError) as e:
+            raise links.LinkError("failed to connect") from e
+
+        try:
+            info = await self._handshake()
+        except BaseException:
+            await self._close_writer()
+            raise
+
+        self._connected = True
+        check_server_version(info)
+        self.supported_modes = set(modes.Mode)
+
+        return info
+
+    async def setup_session(self, config, check_config=True):
+        if check_config:
+            base.check_config(config)
+
+        if self._streaming_started:
+            raise ClientError("can't setup session while streaming")
+
+        if not self._connected:
+            await self.connect()
+
+        if check_config and config.mode not in self.supported_modes:
+            raise ClientError("Unsupported mode")
+
+        self._session_cmd = self._get_session_cmd(config)
+        info = await self._init_session()
+
+        if "update_rate" in self._session_cmd:
+            self.timeout = 1 / self._session_cmd["update_rate"] + self.DEFAULT_TIMEOUT
+        else:
+            self.timeout = self.DEFAULT_TIMEOUT
+
+        log.debug("setup session")
+
+        self._session_setup_done = True
+        return info
+
+    async def start_session(self, config=None, check_config=True):
+        if self._streaming_started:
+            raise ClientError("already streaming")
+
+        if config is None:
+            ret = None
+        else:
+            ret = await self.setup_session(config, check_config=check_config)
+
+        if not self._session_setup_done:
+            raise ClientError("session needs to be set up before starting stream")
+
+        if not self._session_ready:
+            await self._init_session()
+
+        await self._send_cmd({"cmd": "start_streaming"})
+        header, _ = await self._recv_frame()
+        if header["status"] != "start":
+            raise ClientError
+
+        log.debug("started streaming")
+
+        self._streaming_started = True
+        return ret
+
+    async def get_next(self, out=None):
+        if not self._streaming_started:
+            raise ClientError("must be streaming to get next")
+
+        header, payload = await self._recv_frame()
+        self._check_stream_status(header)
+
+        info = self._decode_stream_header(header)
+
+        self._out = out
+        try:
+            data = self._decode_stream_payload(payload)
+        finally:
+            self._out = None
+
+        # Data which is not decoded into out, as in the fallback for unknown modes, is copied
+        if out is not None and data is not out:
+            np.copyto(out, data, casting="same_kind")
+            data = out
+
+        return info, data
+
+    async def stop_session(self):
+        if not self._streaming_started:
+            raise ClientError("not streaming")
+
+        await self._send_cmd({"cmd": "stop_streaming"})
+
+        loop = asyncio.get_running_loop()
+        t0 = loop.time()
+        while loop.time() - t0 < self.timeout:
+            header, _ = await self._recv_frame()
+            status = header["status"]
+            if status == "end":
+                break
+            elif status == "ok":  # got streaming data
+                continue
+            else:
+                raise ClientError
+        else:
+            raise ClientError
+
+        self.timeout = self.DEFAULT_TIMEOUT
+        self._session_ready = False
+        self._streaming_started = False
+
+        log.debug("stopped streaming")
+
+    async def disconnect(self):
+        if not self._connected:
+            raise ClientError("not connected")
+
+        if self._streaming_started:
+            await self.stop_session()
+
+        await self._close_writer()
+
+        self._session_cmd = None
+        self._session_ready = False
+        self._connected = False
+        self.supported_modes = None
+
+        log.debug("disconnected")
+
+    async def _handshake(self):
+        info = {}
+
+        await self._send_cmd({"cmd": "get_version"})
+
+        try:
+            header, _ = await self._recv_frame()
+        except links.LinkError as e:
+            raise ClientError("no response from server") from e
+
+        log.debug("connected and got a response")
+
+        if header["status"] != "ok":
+            raise ClientError("server error while connecting")
+
+        msg = header["message"].lower()
+        log.info("version msg: {}".format(msg))
+
+        startstr = "server version v"
+        if msg.startswith(startstr):
+            server_version_str = msg[len(startstr) :].strip()
+            info.update(decode_version_str(server_version_str))
+
+            await self._send_cmd({"cmd": "get_board_sensor_count"})
+            header, _ = await self._recv_frame()
+            info["board_sensor_count"] = int(header["message"])
+        else:
+            log.warning("server version unknown")
+
+        return info
+
+    async def _init_session(self, retry=True):
+        if self._session_cmd is None:
+            raise ClientError
+
+        await self._send_cmd(self._session_cmd)
+        header, _ = await self._recv_frame()
+
+        if header["status"] == "error":
+            if retry:
+                return await self._init_session(retry=False)
+            else:
+                raise SessionSetupError
+        elif header["status"] != "ok":
+            raise ClientError("got unexpected header")
+
+        log.debug("session initialized")
+
+        self._session_ready = True
+        info = get_session_info_for_header(header)
+        return info
+
+    async def _close_writer(self):
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except OSError:
+            pass
+
+        self._reader = None
+        self._writer = None
+
+    async def _send_cmd(self, cmd_dict):
+        cmd_dict["api_version"] = 3
+        s = json.dumps(cmd_dict, separators=(",", ":"))
+        self._writer.write(bytearray(s + "\n", "ascii"))
+
+        try:
+            await self._writer.drain()
+        except OSError as e:
+            raise links.LinkError from e
+
+    async def _recv_frame(self):
+        try:
+            return await asyncio.wait_for(self.__recv_frame(), self.timeout)
+        except asyncio.TimeoutError as e:
+            raise links.LinkError("recv timeout") from e
+        except (OSError, asyncio.IncompleteReadError, asyncio.LimitOverrunError) as e:
+            raise links.LinkError from e
+
+    async def __recv_frame(self):
+        packed = await self._reader.readuntil(b"\n")
+        header = loads_header(packed)
+        payload_len = header["payload_size"]
+
+        if payload_len > 0:
+            payload = await self._reader.readexactly(payload_len)
+        else:
+            payload = None
+
+        return header, payload
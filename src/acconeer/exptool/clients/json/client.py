@@ -10,16 +10,141 @@ from acconeer.exptool.clients import links
 from acconeer.exptool.clients.base import (
     BaseClient,
     ClientError,
+    DataDecodingMixin,
     SessionSetupError,
     decode_version_str,
 )
 from acconeer.exptool.modes import Mode, get_mode
 
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
 log = logging.getLogger(__name__)
 
 
-class SocketClient(BaseClient):
+class StreamDecodingMixin(DataDecodingMixin):
+    """Session commands and frame decoding, shared by SocketClient and AsyncSocketClient."""
+
+    def _init_stream_decoding(self):
+        self._mode = None
+        self._sweeps_per_frame = None
+        self._num_sensors = None
+        self._info_raw_keys = None
+        self._info_key_pairs = None
+        self._payload_size = None
+        self._payload_layout = None
+
+    def _get_session_cmd(self, config):
+        if isinstance(config, dict):
+            cmd = deepcopy(config)
+            log.warning("setup with raw dict config - you're on your own")
+        else:
+            cmd = get_dict_for_config(config)
+
+        try:
+            self._mode = get_mode(cmd["cmd"].lower().replace("_data", ""))
+        except ValueError:
+            self._mode = None
+
+        self._sweeps_per_frame = cmd.get("sweeps_per_frame", 16)
+        self._num_sensors = len(cmd["sensors"])
+        self._payload_size = None
+
+        cmd["output_format"] = "json+binary"
+
+        return cmd
+
+    def _decode_stream_header(self, header):
+        raw_infos = header["result_info"]
+
+        # The infos are parsed anew for each frame, so they can be used as they are unless
+        # keys need to be remapped
+        if not DATA_HEADER_TO_INFO_KEY_REMAP:
+            mapped_infos = raw_infos
+        else:
+            mapped_infos = [self._remap_info_keys(raw_info) for raw_info in raw_infos]
+
+        if self.squeeze and len(mapped_infos) == 1:
+            return mapped_infos[0]
+        else:
+            return mapped_infos
+
+    def _remap_info_keys(self, raw_info):
+        # The keys are the same from frame to frame, so the mapping is only looked up anew
+        # when they change
+        raw_keys = tuple(raw_info)
+        if raw_keys != self._info_raw_keys:
+            self._info_raw_keys = raw_keys
+            self._info_key_pairs = [
+                (raw_key, DATA_HEADER_TO_INFO_KEY_REMAP.get(raw_key, raw_key))
+                for raw_key in raw_keys
+            ]
+
+        return {
+            mapped_key: raw_info[raw_key]
+            for raw_key, mapped_key in self._info_key_pairs
+            if mapped_key is not None
+        }
+
+    def _check_stream_status(self, header):
+        status = header["status"]
+        if status == "end":
+            raise ClientError("session ended")
+        elif status != "ok":
+            raise ClientError("server error")
+
+    def _decode_stream_payload(self, payload, num_frames=None):
+        """Decode a payload, or with num_frames, that many payloads one after the other."""
+        if not payload:
+            return None
+
+        frame_shape = () if num_frames is None else (num_frames,)
+        payload_size = len(payload) // (num_frames or 1)
+
+        # The layout of the payload is the same from frame to frame, so it is only worked out
+        # anew when the size changes
+        if payload_size != self._payload_size:
+            self._payload_size = payload_size
+            self._payload_layout = self._get_payload_layout(payload_size)
+
+        raw_dtype, shape, iq = self._payload_layout
+        raw = np.frombuffer(payload, dtype=raw_dtype)
+
+        if shape is None:  # Fallback, copied as the payload is a view into the receive buffer
+            data = raw.copy()
+
+            if not (self.squeeze and self._num_sensors == 1):
+                data = data.reshape(frame_shape + (self._num_sensors, -1))
+            elif num_frames is not None:
+                data = data.reshape((num_frames, -1))
+
+            return data
+
+        # Decoding copies out of the payload, so the data stays valid after the next frame
+        return self._decode_data(raw, frame_shape + shape, iq)
+
+    def _get_payload_layout(self, payload_size):
+        """Get the raw dtype, the decoded shape, and whether it is IQ data, for a payload."""
+        num_sensors = self._num_sensors
+        sensor_shape = () if self.squeeze and num_sensors == 1 else (num_sensors,)
+        num_points = payload_size // 2 // num_sensors
+
+        if self._mode == Mode.IQ:
+            return np.dtype(">i2"), sensor_shape + (num_points // 2,), True
+        elif self._mode == Mode.SPARSE:
+            spf = self._sweeps_per_frame
+            return np.dtype(">u2"), sensor_shape + (spf, num_points // spf), False
+        elif self._mode in (Mode.ENVELOPE, Mode.POWER_BINS):
+            return np.dtype(">u2"), sensor_shape + (num_points,), False
+        else:
+            return np.dtype(">u2"), None, False
+
+
+class SocketClient(StreamDecodingMixin, BaseClient):
     def __init__(self, host, **kwargs):
         super().__init__(**kwargs)
 
@@ -27,9 +152,8 @@ class SocketClient(BaseClient):
 
         self._session_cmd = None
         self._session_ready = False
-        self._mode = None
-        self._sweeps_per_frame = None
-        self._num_sensors = None
+        self._init_stream_decoding()
+        self._batch_buf = bytearray()
 
     def _connect(self):
         info = {}
@@ -67,21 +191,7 @@ class SocketClient(BaseClient):
         return info
 
     def _setup_session(self, config):
-        if isinstance(config, dict):
-            cmd = deepcopy(config)
-            log.warning("setup with raw dict config - you're on your own")
-        else:
-            cmd = get_dict_for_config(config)
-
-        try:
-            self._mode = get_mode(cmd["cmd"].lower().replace("_data", ""))
-        except ValueError:
-            self._mode = None
-
-        self._sweeps_per_frame = cmd.get("sweeps_per_frame", 16)
-        self._num_sensors = len(cmd["sensors"])
-
-        cmd["output_format"] = "json+binary"
+        cmd = self._get_session_cmd(config)
 
         self._session_cmd = cmd
         info = self._init_session()
@@ -109,17 +219,37 @@ class SocketClient(BaseClient):
 
     def _get_next(self):
         header, payload = self._recv_frame()
-
-        status = header["status"]
-        if status == "end":
-            raise ClientError("session ended")
-        elif status != "ok":
-            raise ClientError("server error")
+        self._check_stream_status(header)
 
         info = self._decode_stream_header(header)
         data = self._decode_stream_payload(payload)
         return info, data
 
+    def _get_next_batch(self, n):
+        # The payloads are views into the receive buffer, so they are copied one after the
+        # other into a buffer of their own, and then decoded all at once
+        infos = []
+        payload_size = None
+
+        for i in range(n):
+            header, payload = self._recv_frame()
+            self._check_stream_status(header)
+            infos.append(self._decode_stream_header(header))
+
+            if payload_size is None:
+                payload_size = len(payload) if payload else 0
+
+                if len(self._batch_buf) != n * payload_size:
+                    self._batch_buf = bytearray(n * payload_size)
+            elif (len(payload) if payload else 0) != payload_size:
+                raise ClientError("payload size changed within batch")
+
+            if payload_size:
+                self._batch_buf[i * payload_size : (i + 1) * payload_size] = payload
+
+        data = self._decode_stream_payload(self._batch_buf, num_frames=n)
+        return infos, data
+
     def _stop_session(self):
         cmd = {"cmd": "stop_streaming"}
         self._send_cmd(cmd)
@@ -179,63 +309,26 @@ class SocketClient(BaseClient):
         self._link.send(packed)
 
     def _recv_frame(self):
-        packed = self._link.recv_until(b"\n")
-        header = json.loads(str(packed, "ascii"))
+        # The header and payload are views into the receive buffer of the link, only valid
+        # until the next frame is received
+        packed = self._link.recv_until_view(b"\n")
+        header = loads_header(packed)
         payload_len = header["payload_size"]
 
         if payload_len > 0:
-            payload = self._link.recv(payload_len)
+            payload = self._link.recv_view(payload_len)
         else:
             payload = None
 
         return header, payload
 
-    def _decode_stream_header(self, header):
-        raw_infos = header["result_info"]
-        mapped_infos = [{} for _ in raw_infos]
-
-        for (raw_info, mapped_info) in zip(raw_infos, mapped_infos):
-            for raw_key, val in raw_info.items():
-                mapped_key = DATA_HEADER_TO_INFO_KEY_REMAP.get(raw_key, raw_key)
-
-                if mapped_key is None:
-                    continue
-
-                mapped_info[mapped_key] = val
-
-        if self.squeeze and len(mapped_infos) == 1:
-            return mapped_infos[0]
-        else:
-            return mapped_infos
-
-    def _decode_stream_payload(self, payload):
-        if not payload:
-            return None
-
-        squeeze = self.squeeze and self._num_sensors == 1
-
-        if self._mode == Mode.SPARSE:
-            data = np.frombuffer(payload, dtype=">u2").astype("float")
-
-            if squeeze:
-                shape = (self._sweeps_per_frame, -1)
-            else:
-                shape = (self._num_sensors, self._sweeps_per_frame, -1)
-
-            return data.reshape(shape)
-
-        if self._mode == Mode.IQ:
-            data = np.frombuffer(payload, dtype=">i2").astype("float")
-            data = data.reshape((-1, 2)).view(dtype="complex").flatten()
-        elif self._mode in (Mode.ENVELOPE, Mode.POWER_BINS):
-            data = np.frombuffer(payload, dtype=">u2").astype("float")
-        else:  # Fallback
-            data = np.frombuffer(payload, dtype=">u2")
 
-        if not squeeze:
-            data = data.reshape((self._num_sensors, -1))
+def loads_header(packed):
+    """Parse a JSON frame header, with orjson if it is installed."""
+    if orjson is not None:
+        return orjson.loads(packed)
 
-        return data
+    return json.loads(str(packed, "ascii"))
 
 
 def get_dict_for_config(config):
@@ -1,11 +1,14 @@
 import logging
 import multiprocessing as mp
 import platform
-import queue
+import re
+import selectors
 import signal
 import socket
+import struct
 import traceback
 from abc import ABCMeta, abstractmethod
+from multiprocessing import shared_memory
 from time import sleep, time
 
 import serial
@@ -39,6 +42,13 @@ class BaseLink(metaclass=ABCMeta):
     def recv_until(self, bs):
         pass
 
+    def recv_view(self, num_bytes):
+        """Like recv, but possibly get a memoryview into a receive buffer rather than a copy.
+
+        The view is only valid until the next call to any of the recv methods.
+        """
+        return memoryview(self.recv(num_bytes))
+
     @abstractmethod
     def send(self, data):
         pass
@@ -62,6 +72,8 @@ class BaseLink(metaclass=ABCMeta):
 
 class SocketLink(BaseLink):
     _CHUNK_SIZE = 4096
+    _INITIAL_BUFFER_SIZE = 2 ** 16
+    _BUFFER_FRAMES = 8
     _PORT = 6110
 
     def __init__(self, host=None):
@@ -69,6 +81,7 @@ class SocketLink(BaseLink):
         self._host = host
         self._sock = None
         self._buf = None
+        self.bytes_copied = 0
 
     def _update_timeout(self):
         if self._sock is not None:
@@ -84,44 +97,59 @@ class SocketLink(BaseLink):
             self._sock = None
             raise LinkError("failed to connect") from e
 
-        self._buf = bytearray()
+        # Received data is read straight into _buf, at _write_pos. Data before _read_pos
+        # has been handed out, and no delimiter is to be found before _search_pos.
+        self._buf = bytearray(self._INITIAL_BUFFER_SIZE)
+        self._view = memoryview(self._buf)
+        self._read_pos = 0
+        self._write_pos = 0
+        self._search_pos = 0
 
     def recv(self, num_bytes):
-        while len(self._buf) < num_bytes:
-            try:
-                r = self._sock.recv(self._CHUNK_SIZE)
-            except OSError as e:
-                raise LinkError from e
-            self._buf.extend(r)
-
-        data = self._buf[:num_bytes]
-        self._buf = self._buf[num_bytes:]
+        data = bytearray(self.recv_view(num_bytes))
+        self.bytes_copied += num_bytes
         return data
 
+    def recv_view(self, num_bytes):
+        """Like recv, but get a memoryview into the receive buffer rather than a copy.
+
+        The view is only valid until the next call to any of the recv methods.
+        """
+        while self._write_pos - self._read_pos < num_bytes:
+            self.__recv_into_buf(num_bytes)
+
+        start = self._read_pos
+        self._read_pos += num_bytes
+        return self._view[start : self._read_pos]
+
     def recv_until(self, bs):
+        data = bytearray(self.recv_until_view(bs))
+        self.bytes_copied += len(data)
+        return data
+
+    def recv_until_view(self, bs):
+        """Like recv_until, but get a memoryview into the receive buffer rather than a copy.
+
+        The view is only valid until the next call to any of the recv methods.
+        """
         t0 = time()
+        self._search_pos = max(self._search_pos, self._read_pos)
         while True:
-            try:
-                i = self._buf.index(bs)
-            except ValueError:
-                pass
-            else:
+            i = self._buf.find(bs, self._search_pos, self._write_pos)
+            if i >= 0:
                 break
 
+            # Only search the new data next time, but mind delimiters split between reads
+            self._search_pos = max(self._read_pos, self._write_pos - len(bs) + 1)
+
             if time() - t0 > self._timeout:
                 raise LinkError("recv timeout")
 
-            try:
-                r = self._sock.recv(self._CHUNK_SIZE)
-            except OSError as e:
-                raise LinkError from e
-            self._buf.extend(r)
-
-        i += 1
-        data = self._buf[:i]
-        self._buf = self._buf[i:]
+            self.__recv_into_buf()
 
-        return data
+        start = self._read_pos
+        self._read_pos = self._search_pos = i + len(bs)
+        return self._view[start : self._read_pos]
 
     def send(self, data):
         self._sock.sendall(data)
@@ -130,8 +158,40 @@ class SocketLink(BaseLink):
         self._sock.shutdown(socket.SHUT_RDWR)
         self._sock.close()
         self._sock = None
+        self._view = None
         self._buf = None
 
+    def __recv_into_buf(self, num_bytes=0):
+        """Receive at least one byte into _buf, making room for num_bytes unread bytes."""
+        num_unread = self._write_pos - self._read_pos
+        min_size = max(num_unread, num_bytes) + self._CHUNK_SIZE
+
+        if self._read_pos + min_size > len(self._buf):
+            # Move the unread data to the start of the buffer. Keep the buffer much larger
+            # than a frame, so that this is only needed now and then.
+            if self._BUFFER_FRAMES * min_size > len(self._buf):
+                new_buf = bytearray(max(self._BUFFER_FRAMES * min_size, 2 * len(self._buf)))
+                new_buf[:num_unread] = self._buf[self._read_pos : self._write_pos]
+                self._buf = new_buf
+                self._view = memoryview(self._buf)
+            else:
+                self._view[:num_unread] = self._view[self._read_pos : self._write_pos]
+
+            self.bytes_copied += num_unread
+            self._search_pos -= self._read_pos
+            self._read_pos = 0
+            self._write_pos = num_unread
+
+        try:
+            n = self._sock.recv_into(self._view[self._write_pos :])
+        except OSError as e:
+            raise LinkError from e
+
+        if n == 0:
+            raise LinkError("connection closed")
+
+        self._write_pos += n
+
 
 class BaseSerialLink(BaseLink):
     def __init__(self, baudrate=115200):
@@ -195,23 +255,242 @@ class SerialLink(BaseSerialLink):
             self._ser.baudrate = new_baudrate
 
 
+class SharedRingBuffer:
+    """A ring buffer of bytes in shared memory, from one writer process to one reader process.
+
+    The writer copies data in with write. The reader gets it with read_view, as a memoryview
+    into the shared memory unless the data wraps around the end of the ring, and the view is
+    only valid until the next call to any of the read methods.
+
+    The header at the start of the shared memory holds the total number of bytes written
+    and read, and whether the reader is waiting for data, and is only accessed while holding
+    the lock. The writer sets the event when the reader is waiting.
+
+    The buffer is passed to the other process as an argument when starting it, and should
+    be closed in both processes and unlinked by the process that created it.
+    """
+
+    DEFAULT_CAPACITY = 2 ** 20
+    _POS = struct.Struct("<Q")
+    _FLAG = struct.Struct("<?")
+    _WRITE_POS_OFFSET = 0
+    _READ_POS_OFFSET = 8
+    _READER_WAITING_OFFSET = 16
+    _HEADER_SIZE = 24
+    _RECORD_LEN = struct.Struct("<I")
+    _ROOM_POLL_INTERVAL = 0.001
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self._shm = shared_memory.SharedMemory(create=True, size=self._HEADER_SIZE + capacity)
+        self._lock = mp.Lock()
+        self._data_event = mp.Event()
+
+        self._shm.buf[: self._HEADER_SIZE] = bytes(self._HEADER_SIZE)
+        self._attach()
+
+    def _attach(self):
+        self._buf = self._shm.buf
+        self._data = self._buf[self._HEADER_SIZE : self._HEADER_SIZE + self.capacity]
+
+        # Each position is only moved by one side, which keeps its own copy of it
+        self._write_pos = 0
+        self._read_pos = 0
+        self._num_held = 0  # bytes handed out by read_view, released by the next read
+
+    def __getstate__(self):
+        return {k: v for k, v in self.__dict__.items() if k not in ("_buf", "_data")}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._attach()
+
+    def write(self, *parts, timeout=None):
+        """Copy the parts into the buffer at once, waiting for room if needed.
+
+        Returns False, with nothing written, if there was no room within timeout.
+        """
+        parts = [memoryview(part).cast("B") for part in parts]
+        num_bytes = sum(len(part) for part in parts)
+
+        if num_bytes > self.capacity:
+            raise ValueError("data does not fit in the buffer")
+
+        t0 = time()
+        while True:
+            with self._lock:
+                (read_pos,) = self._POS.unpack_from(self._buf, self._READ_POS_OFFSET)
+
+            if self.capacity - (self._write_pos - read_pos) >= num_bytes:
+                break
+
+            if timeout is not None and time() - t0 > timeout:
+                return False
+
+            sleep(self._ROOM_POLL_INTERVAL)
+
+        # The room is not read from until the write position is moved past it
+        i = self._write_pos % self.capacity
+        for part in parts:
+            n = min(len(part), self.capacity - i)
+            self._data[i : i + n] = part[:n]
+            self._data[: len(part) - n] = part[n:]
+            i = (i + len(part)) % self.capacity
+
+        self._write_pos += num_bytes
+
+        with self._lock:
+            self._POS.pack_into(self._buf, self._WRITE_POS_OFFSET, self._write_pos)
+            (reader_waiting,) = self._FLAG.unpack_from(self._buf, self._READER_WAITING_OFFSET)
+            self._FLAG.pack_into(self._buf, self._READER_WAITING_OFFSET, False)
+
+        if reader_waiting:
+            self._data_event.set()
+
+        return True
+
+    def write_record(self, *parts, timeout=None):
+        """Like write, but prefixed with the length, to be read with read_record_view."""
+        num_bytes = sum(memoryview(part).nbytes for part in parts)
+        return self.write(self._RECORD_LEN.pack(num_bytes), *parts, timeout=timeout)
+
+    def read_view(self, num_bytes, timeout=None):
+        """Get the next num_bytes, waiting for them for at most timeout (None for no limit).
+
+        Raises LinkError on timeout.
+        """
+        self._release()
+        self._wait_for(num_bytes, timeout)
+        self._num_held = num_bytes
+        return self._get_view(0, num_bytes)
+
+    def read_record_view(self, timeout=None):
+        """Get the next record written with write_record, see read_view."""
+        self._release()
+        self._wait_for(self._RECORD_LEN.size, timeout)
+
+        # The record is written at once with its length, so it is there too
+        (num_bytes,) = self._RECORD_LEN.unpack(self._get_view(0, self._RECORD_LEN.size))
+        self._num_held = self._RECORD_LEN.size + num_bytes
+        return self._get_view(self._RECORD_LEN.size, num_bytes)
+
+    def wait(self, num_bytes, timeout=None):
+        """Wait until num_bytes can be read, without reading them, see read_view."""
+        self._release()
+        self._wait_for(num_bytes, timeout)
+
+    def find(self, sub, start=0):
+        """Find sub in the unread data, from offset start, without reading or waiting.
+
+        Returns the offset of sub, or -1, and the number of unread bytes. The data is searched
+        in place, unless it wraps around the end of the ring.
+        """
+        self._release()
+
+        with self._lock:
+            (write_pos,) = self._POS.unpack_from(self._buf, self._WRITE_POS_OFFSET)
+
+        num_unread = write_pos - self._read_pos
+
+        if num_unread - start < len(sub):
+            return -1, num_unread
+
+        # Unlike bytes, memoryviews have no find, but can be searched with re
+        match = re.search(re.escape(sub), self._get_view(start, num_unread - start))
+        i = -1 if match is None else start + match.start()
+        return i, num_unread
+
+    def discard(self):
+        """Drop all unread data."""
+        with self._lock:
+            (write_pos,) = self._POS.unpack_from(self._buf, self._WRITE_POS_OFFSET)
+
+        self._num_held = write_pos - self._read_pos
+        self._release()
+
+    def close(self):
+        data = self._data
+        self._buf = None
+        self._data = None
+
+        try:
+            data.release()
+            self._shm.close()
+        except BufferError:
+            # Views are still held, the memory is unmapped once they are gone
+            log.debug("shared memory still in use when closing")
+
+    def unlink(self):
+        self._shm.unlink()
+
+    def _get_view(self, offset, num_bytes):
+        """Get a view of num_bytes from offset past the read position."""
+        i = (self._read_pos + offset) % self.capacity
+
+        if i + num_bytes <= self.capacity:
+            return self._data[i : i + num_bytes]
+        else:
+            n = self.capacity - i
+            return memoryview(bytearray(self._data[i:]) + self._data[: num_bytes - n])
+
+    def _release(self):
+        if self._num_held > 0:
+            self._read_pos += self._num_held
+            self._num_held = 0
+
+            with self._lock:
+                self._POS.pack_into(self._buf, self._READ_POS_OFFSET, self._read_pos)
+
+    def _wait_for(self, num_bytes, timeout):
+        """Wait until num_bytes can be read, and get the write position."""
+        t0 = time()
+        while True:
+            with self._lock:
+                (write_pos,) = self._POS.unpack_from(self._buf, self._WRITE_POS_OFFSET)
+
+            if write_pos - self._read_pos >= num_bytes:
+                return write_pos
+
+            # Clear the event before telling the writer, so that a write is not missed
+            self._data_event.clear()
+
+            with self._lock:
+                (write_pos,) = self._POS.unpack_from(self._buf, self._WRITE_POS_OFFSET)
+                waiting = write_pos - self._read_pos < num_bytes
+                self._FLAG.pack_into(self._buf, self._READER_WAITING_OFFSET, waiting)
+
+            if not waiting:
+                return write_pos
+
+            if timeout is None:
+                remaining = None
+            else:
+                remaining = timeout - (time() - t0)
+
+                if remaining <= 0:
+                    raise LinkError("recv timeout")
+
+            self._data_event.wait(remaining)
+
+
 class SerialProcessLink(BaseSerialLink):
     def __init__(self, port=None):
         super().__init__()
         self._port = port
         self._process = None
+        self._ring = None
 
     def connect(self):
-        self._recv_queue = mp.Queue()
-        self._send_queue = mp.Queue()
+        self._ring = SharedRingBuffer()
+        send_conn_r, self._send_conn = mp.Pipe(duplex=False)
         self._flow_event = mp.Event()
         self._error_event = mp.Event()
 
         args = (
             self._port,
             self._baudrate,
-            self._recv_queue,
-            self._send_queue,
+            self._ring,
+            send_conn_r,
             self._flow_event,
             self._error_event,
         )
@@ -240,55 +519,43 @@ class SerialProcessLink(BaseSerialLink):
 
         log.debug("connect - successful")
 
-        self._buf = bytearray()
-
     def recv(self, num_bytes):
-        self.__empty_queue_into_buf()
+        return bytearray(self.recv_view(num_bytes))
 
-        t0 = time()
-        while len(self._buf) < num_bytes:
-            self.__get_into_buf()
+    def recv_view(self, num_bytes):
+        """Like recv, but get a memoryview into the shared receive buffer rather than a copy.
 
-            if time() - t0 > self._timeout:
-                raise LinkError("recv timeout")
-
-        data = self._buf[:num_bytes]
-        self._buf = self._buf[num_bytes:]
-        return data
+        The view is only valid until the next call to any of the recv methods.
+        """
+        return self._ring.read_view(num_bytes, self._timeout)
 
     def recv_until(self, bs):
-        self.__empty_queue_into_buf()
-
-        n = len(bs)
-        si = 0
         t0 = time()
+        start = 0
+        num_bytes = 1
         while True:
-            buf_size = len(self._buf)
-            if buf_size >= n:
-                try:
-                    i = self._buf.index(bs, si)
-                except ValueError:
-                    pass
-                else:
-                    break
+            self._ring.wait(num_bytes, self._timeout - (time() - t0))
+            i, num_unread = self._ring.find(bs, start)
 
-                si = buf_size - n + 1
+            if i >= 0:
+                return self.recv(i + len(bs))
 
-            if time() - t0 > self._timeout:
-                raise LinkError("recv timeout")
-
-            self.__get_into_buf()
-
-        data = self._buf[: i + n]
-        self._buf = self._buf[i + n :]
-        return data
+            # Only search the new data next time, but mind delimiters split between writes
+            start = max(0, num_unread - len(bs) + 1)
+            num_bytes = num_unread + 1
 
     def send(self, data):
-        self._send_queue.put(data)
+        self._send_conn.send(data)
 
     def disconnect(self):
         if self._process.exitcode is None:
             self._flow_event.clear()
+
+            try:
+                self._send_conn.send(("stop", None))  # wake the process up
+            except OSError:
+                pass  # the process has just stopped
+
             self._process.join(1)
 
         if self._process.exitcode is None:
@@ -300,24 +567,9 @@ class SerialProcessLink(BaseSerialLink):
         if self._process.exitcode is None:
             raise LinkError("failed to disconnect")
 
-    def __empty_queue_into_buf(self):
-        while True:
-            try:
-                data = self._recv_queue.get_nowait()
-            except queue.Empty:
-                break
-
-            self._buf.extend(data)
-
-    def __get_into_buf(self):
-        try:
-            data = self._recv_queue.get(timeout=self._timeout)
-        except queue.Empty:
-            raise LinkError("recv timeout")
-        except InterruptedError:
-            return  # fixes interrupt issue on Windows
-
-        self._buf.extend(data)
+        self._ring.close()
+        self._ring.unlink()
+        self._ring = None
 
     @property
     def baudrate(self):
@@ -329,15 +581,15 @@ class SerialProcessLink(BaseSerialLink):
 
         if self._process is not None and self._process.exitcode is None:
             log.debug("Changing baudrate to {}".format(new_baudrate))
-            self._send_queue.put(("baudrate", new_baudrate))
+            self._send_conn.send(("baudrate", new_baudrate))
 
 
-def serial_process_program(port, baud, recv_q, send_q, flow_event, error_event):
+def serial_process_program(port, baud, ring, send_conn, flow_event, error_event):
     log.debug("serial communication process started")
     signal.signal(signal.SIGINT, signal.SIG_IGN)
 
     try:
-        _serial_process_program(port, baud, recv_q, send_q, flow_event, error_event)
+        _serial_process_program(port, baud, ring, send_conn, flow_event, error_event)
     except Exception:
         error_event.set()
         flow_event.set()
@@ -346,38 +598,42 @@ def serial_process_program(port, baud, recv_q, send_q, flow_event, error_event):
         traceback.print_exc()
         print("\n\n")
 
-    recv_q.close()
-    send_q.close()
+    ring.close()
+    send_conn.close()
 
 
-def _serial_process_program(port, baud, recv_q, send_q, flow_event, error_event):
+def _serial_process_program(port, baud, ring, send_conn, flow_event, error_event):
     ser = serial.Serial(port=port, baudrate=baud, timeout=0, exclusive=True)
-    flow_event.set()
-    while flow_event.is_set():
-        received = bytearray()
-        while True:
-            data = bytearray(ser.read(4096))
-            if len(data) == 0:
-                break
-            received.extend(data)
-        if len(received) > 0:
-            recv_q.put(received)
 
-        sent = False
-        while True:
-            try:
-                x = send_q.get_nowait()
-            except queue.Empty:
-                break
+    # Block until there is data to receive or to send, rather than polling. The timeout is
+    # only a safeguard for noticing that the flow event was cleared.
+    selector = selectors.DefaultSelector()
+    selector.register(ser.fileno(), selectors.EVENT_READ, "recv")
+    selector.register(send_conn, selectors.EVENT_READ, "send")
 
-            if isinstance(x, tuple):
-                _, val = x  # assume its a baudrate change
-                ser.baudrate = val
+    flow_event.set()
+    while flow_event.is_set():
+        for key, _ in selector.select(timeout=1.0):
+            if key.data == "recv":
+                while True:
+                    data = ser.read(4096)
+                    if len(data) == 0:
+                        break
+
+                    # Wait for the main process to make room, unless disconnecting
+                    while not ring.write(data, timeout=0.1):
+                        if not flow_event.is_set():
+                            break
             else:
-                ser.write(x)
-                sent = True
+                while send_conn.poll():
+                    x = send_conn.recv()
 
-        if not sent:
-            sleep(0.0025)
+                    if isinstance(x, tuple):
+                        cmd, val = x
+                        if cmd == "baudrate":
+                            ser.baudrate = val
+                    else:
+                        ser.write(x)
 
+    selector.close()
     ser.close()
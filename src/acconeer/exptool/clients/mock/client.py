@@ -63,16 +63,34 @@ class MockClient(BaseClient):
         self._data_count = 0
 
     def _get_next(self):
-        config = self._config
-
         self._data_count += 1
+        self._wait_for_frame(self._data_count)
+
+        info, data = self._mock_frame(self._data_count)
+        data = self._decode_data(data, data.shape)
+        return info, data
 
-        data_capture_time = self._data_count / self._update_rate
+    def _get_next_batch(self, n):
+        # Wait once, for the last frame of the batch, and then mock all frames
+        first = self._data_count + 1
+        self._data_count += n
+        self._wait_for_frame(self._data_count)
+
+        infos, data = zip(*[self._mock_frame(i) for i in range(first, first + n)])
+        data = np.array(data)
+        data = self._decode_data(data, data.shape)
+        return list(infos), data
+
+    def _wait_for_frame(self, data_count):
+        data_capture_time = data_count / self._update_rate
         now = time() - self._start_time
         if data_capture_time > now:
             sleep(data_capture_time - now)
 
-        args = (data_capture_time, self._data_count)
+    def _mock_frame(self, data_count):
+        config = self._config
+
+        args = (data_count / self._update_rate, data_count)
         num_sensors = len(config.sensor)
 
         if self.squeeze and num_sensors == 1:
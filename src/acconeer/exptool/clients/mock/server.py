@@ -0,0 +1,348 @@
+"""Stand-in for acc_streaming_server, serving mock data over the json+binary protocol.
+
+SocketClient and AsyncSocketClient can connect to it as to the real server on the
+Raspberry Pi, which allows testing and benchmarking them off-device. The data comes from
+the same mockers as MockClient. Run with
+
+    python -m acconeer.exptool.clients.mock.server --port 6110
+
+Faults can be injected at random: dropped frames (reported with missed_data on the next
+frame), error frames, stalls, and closing the connection after a number of frames.
+"""
+
+import argparse
+import asyncio
+import itertools
+import json
+import logging
+import random
+import threading
+import time
+
+import numpy as np
+
+from acconeer.exptool import SDK_VERSION, configs
+from acconeer.exptool.clients.json.client import (
+    CONFIG_TO_CMD_KEY_MAP,
+    SESSION_HEADER_TO_INFO_KEY_REMAP,
+)
+from acconeer.exptool.clients.mock.client import (
+    DATA_QUALITY_WARNING_KEY,
+    MISSED_GET_NEXT_KEY,
+    MOCK_CLASS_MAP,
+)
+from acconeer.exptool.modes import Mode, get_mode
+from acconeer.exptool.structs import configbase
+
+
+log = logging.getLogger(__name__)
+
+
+# IQ data from the mocker has an amplitude well below 1, scale it to make use of the i2 range
+IQ_SCALE = 2 ** 12
+
+SESSION_INFO_TO_HEADER_KEY_REMAP = {
+    v: k for k, v in SESSION_HEADER_TO_INFO_KEY_REMAP.items() if v is not None
+}
+
+
+class MockStreamingServer:
+    def __init__(self, host="127.0.0.1", port=6110, **kwargs):
+        self.host = host
+        self.port = port
+        self.num_board_sensors = kwargs.pop("num_board_sensors", 4)
+        self.update_rate = kwargs.pop("update_rate", 100)  # when not set, 0 for unlimited
+        self.jitter_s = kwargs.pop("jitter_s", 0.0)
+        self.frame_pool_size = kwargs.pop("frame_pool_size", 100)
+        self.timestamps = kwargs.pop("timestamps", False)
+        self.drop_rate = kwargs.pop("drop_rate", 0.0)
+        self.error_rate = kwargs.pop("error_rate", 0.0)
+        self.stall_rate = kwargs.pop("stall_rate", 0.0)
+        self.stall_s = kwargs.pop("stall_s", 1.0)
+        self.disconnect_after = kwargs.pop("disconnect_after", None)
+
+        if kwargs:
+            a_key = next(iter(kwargs.keys()))
+            raise TypeError("Got unexpected keyword argument ({})".format(a_key))
+
+        self._server = None
+        self._loop = None
+        self._thread = None
+
+    async def start(self):
+        self._server = await asyncio.start_server(self._handle_connection, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        log.info("serving on {}:{}".format(self.host, self.port))
+
+    async def serve_forever(self):
+        if self._server is None:
+            await self.start()
+
+        async with self._server:
+            await self._server.serve_forever()
+
+    def start_thread(self):
+        """Serve from a thread with its own event loop, for use with blocking clients."""
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            self._loop.run_until_complete(self.start())
+            started.set()
+            self._loop.run_forever()
+
+            self._server.close()
+            self._loop.run_until_complete(self._server.wait_closed())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop_thread(self):
+        self._loop.call_soon_threadsafe(self._loop.stop)
+        self._thread.join()
+        self._thread = None
+
+    async def _handle_connection(self, reader, writer):
+        connection = _Connection(self, writer)
+
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+
+                try:
+                    cmd = json.loads(line)
+                except ValueError:
+                    connection.send({"status": "error", "message": "invalid command"})
+                else:
+                    connection.handle_cmd(cmd)
+
+                await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            connection.stop_streaming()
+            writer.close()
+
+
+class _Connection:
+    def __init__(self, server, writer):
+        self.server = server
+        self.writer = writer
+        self.config = None
+        self.mocker = None
+        self.stream_task = None
+
+    def send(self, header, payload=b""):
+        header["payload_size"] = len(payload)
+        packed = json.dumps(header, separators=(",", ":")).encode("ascii") + b"\n"
+        self.writer.write(packed + payload)
+
+    def handle_cmd(self, cmd):
+        name = cmd.get("cmd", "")
+
+        if name == "get_version":
+            self.send({"status": "ok", "message": "server version v" + SDK_VERSION})
+        elif name == "get_board_sensor_count":
+            self.send({"status": "ok", "message": str(self.server.num_board_sensors)})
+        elif name.endswith("_data"):
+            self.setup_session(cmd)
+        elif name == "start_streaming":
+            if self.mocker is None or self.stream_task is not None:
+                self.send({"status": "error", "message": "can not start streaming"})
+            else:
+                self.send({"status": "start"})
+                self.stream_task = asyncio.ensure_future(self.stream())
+        elif name == "stop_streaming":
+            self.stop_streaming()
+            self.send({"status": "end"})
+        else:
+            self.send({"status": "error", "message": "unknown command"})
+
+    def setup_session(self, cmd):
+        self.stop_streaming()
+
+        try:
+            self.config = get_config_for_cmd(cmd)
+            self.mocker = MOCK_CLASS_MAP[self.config.mode](self.config)
+        except (KeyError, ValueError, StopIteration) as e:
+            self.config = self.mocker = None
+            self.send({"status": "error", "message": "bad session setup: {}".format(e)})
+            return
+
+        header = {"status": "ok", "stitch_count": 0}
+        for k, v in self.mocker.session_info.items():
+            header[SESSION_INFO_TO_HEADER_KEY_REMAP.get(k, k)] = v
+
+        self.send(header)
+
+    def stop_streaming(self):
+        if self.stream_task is not None:
+            self.stream_task.cancel()
+            self.stream_task = None
+
+    async def stream(self):
+        server = self.server
+        update_rate = self.config.update_rate or server.update_rate
+        frames = self.get_frames()
+        missed = False
+
+        start_time = time.monotonic()
+        for sequence_number in itertools.count(1):
+            if server.disconnect_after is not None and sequence_number > server.disconnect_after:
+                log.info("closing connection after {} frames".format(server.disconnect_after))
+                self.writer.close()
+                return
+
+            if update_rate:
+                delay = start_time + sequence_number / update_rate - time.monotonic()
+                delay += random.uniform(0, server.jitter_s)
+                if random.random() < server.stall_rate:
+                    delay += server.stall_s
+
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            else:
+                await asyncio.sleep(0)  # let commands through
+
+            result_info, payload = next(frames)
+
+            if random.random() < server.drop_rate:
+                missed = True
+                continue
+
+            if random.random() < server.error_rate:
+                self.send({"status": "error", "message": "injected fault"})
+                continue
+
+            for info in result_info:
+                info["sequence_number"] = sequence_number
+                info[MISSED_GET_NEXT_KEY] = missed
+
+                if server.timestamps:
+                    info["server_time"] = time.time()
+
+            missed = False
+            self.send({"status": "ok", "result_info": result_info}, payload)
+            await self.writer.drain()
+
+    def get_frames(self):
+        """Get an endless iterator of (result_info, payload) for the session.
+
+        With a frame pool, a number of frames are made up front and then repeated, so that
+        the mocker does not limit the frame rate.
+        """
+        if self.server.frame_pool_size:
+            pool = [self.get_frame(i) for i in range(self.server.frame_pool_size)]
+            i = 0
+            while True:
+                result_info, payload = pool[i % len(pool)]
+                yield [dict(info) for info in result_info], payload
+                i += 1
+        else:
+            i = 0
+            while True:
+                yield self.get_frame(i)
+                i += 1
+
+    def get_frame(self, i):
+        num_sensors = len(self.config.sensor)
+        t = i / (self.config.update_rate or self.server.update_rate or 100)
+
+        # Same sensor offsets as MockClient
+        idx_offset = max(0, (num_sensors - 1) / 2)
+        out = [self.mocker.get_next(t, i, j - idx_offset) for j in range(num_sensors)]
+        result_info, data = zip(*out)
+        result_info = list(result_info)
+
+        for info in result_info:
+            info.setdefault(DATA_QUALITY_WARNING_KEY, False)
+
+        return result_info, encode_payload(np.array(data), self.config.mode)
+
+
+def encode_payload(data, mode):
+    if mode == Mode.IQ:
+        data = np.stack([data.real, data.imag], axis=-1) * IQ_SCALE
+        data = np.clip(np.rint(data), -(2 ** 15), 2 ** 15 - 1).astype(">i2")
+    else:
+        data = np.clip(np.rint(data), 0, 2 ** 16 - 1).astype(">u2")
+
+    return data.tobytes()
+
+
+def get_config_for_cmd(cmd):
+    """Get the sensor config for a session setup command, see get_dict_for_config."""
+    mode = get_mode(cmd["cmd"].lower().replace("_data", ""))
+    config = configs.MODE_TO_CONFIG_CLASS_MAP[mode]()
+    params = dict(config._get_keys_and_params())
+
+    # range_start and range_length can only be set through range_interval
+    if "range_start" in cmd and "range_length" in cmd:
+        config.range_interval = [cmd["range_start"], cmd["range_start"] + cmd["range_length"]]
+
+    for config_key, cmd_key in CONFIG_TO_CMD_KEY_MAP.items():
+        if cmd_key not in cmd or config_key not in params:
+            continue
+
+        if config_key in ("range_start", "range_length"):
+            continue
+
+        param = params[config_key]
+        val = cmd[cmd_key]
+
+        if isinstance(param, configbase.EnumParameter):
+            val = next(m for m in param.enum if getattr(m, "json_value", m.value) == val)
+        elif isinstance(param, configbase.BoolParameter):
+            val = bool(val)
+
+        setattr(config, config_key, val)
+
+    return config
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Mock acc_streaming_server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6110)
+    parser.add_argument("--num-board-sensors", type=int, default=4)
+    parser.add_argument(
+        "--update-rate", type=float, default=100,
+        help="used when not set by the client, 0 for as fast as possible",
+    )
+    parser.add_argument("--jitter", type=float, default=0.0, help="max added delay (s)")
+    parser.add_argument(
+        "--frame-pool-size", type=int, default=100, help="0 to mock every frame anew"
+    )
+    parser.add_argument("--timestamps", action="store_true", help="add server_time to infos")
+    parser.add_argument("--drop-rate", type=float, default=0.0)
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--stall-rate", type=float, default=0.0)
+    parser.add_argument("--stall", type=float, default=1.0, help="stall duration (s)")
+    parser.add_argument("--disconnect-after", type=int, default=None, help="frames")
+    args = parser.parse_args()
+
+    logging.basicConfig(format="[%(asctime)s] %(levelname)s: %(message)s", level=logging.INFO)
+
+    server = MockStreamingServer(
+        args.host,
+        args.port,
+        num_board_sensors=args.num_board_sensors,
+        update_rate=args.update_rate,
+        jitter_s=args.jitter,
+        frame_pool_size=args.frame_pool_size,
+        timestamps=args.timestamps,
+        drop_rate=args.drop_rate,
+        error_rate=args.error_rate,
+        stall_rate=args.stall_rate,
+        stall_s=args.stall,
+        disconnect_after=args.disconnect_after,
+    )
+
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
@@ -1,13 +1,45 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from time import monotonic
+
 import numpy as np
 
 from acconeer.exptool.clients.base import BaseClient, ClientError
 
 
+log = logging.getLogger(__name__)
+
+
 class MultiClientWrapper(BaseClient):
+    """Wraps one client per sensor, getting the frames of all clients concurrently.
+
+    By default, one frame is taken from each client in lock-step, as they come. Alignment
+    is opt-in:
+
+    - With align_sequence, the frames are aligned by the sequence_number in their infos: a
+      client whose frame is behind the newest one is read again until it catches up. The
+      sessions of the clients are started one after the other, so frames with the same
+      sequence number were measured at about the same time.
+    - With max_skew_s set, the frames are aligned by the time they were received: a client
+      whose frame was received more than max_skew_s before the newest one is read again.
+
+    The frames dropped this way are counted in frames_dropped. If the frames are still not
+    aligned after MAX_ALIGN_ATTEMPTS rounds of reads, they are given as they are.
+    """
+
+    MAX_ALIGN_ATTEMPTS = 10
+
     def __init__(self, clients, **kwargs):
         kwargs["squeeze"] = False
+        self.align_sequence = kwargs.pop("align_sequence", False)
+        self.max_skew_s = kwargs.pop("max_skew_s", None)
         super().__init__(**kwargs)
         self.clients = clients
+        self.frames_dropped = 0
+
+        self._executor = None
+        self._data_shape = None
+        self._data_dtype = None
 
         for client in clients:
             client.squeeze = False
@@ -30,6 +62,7 @@ class MultiClientWrapper(BaseClient):
             info = client.setup_session(config)
 
         config.sensor = expected_sensors
+        self._data_shape = None
 
         return info
 
@@ -37,20 +70,95 @@ class MultiClientWrapper(BaseClient):
         for client in self.clients:
             client.start_session()
 
+        self._executor = ThreadPoolExecutor(max_workers=len(self.clients))
+
     def _get_next(self):
+        num_clients = len(self.clients)
+
+        if self._data_shape is None:
+            # The shape of the data is only known from the first frame
+            frames = self._get_frames(range(num_clients), [None] * num_clients)
+            data = frames[0][1]
+            self._data_shape = (num_clients * len(data),) + data.shape[1:]
+            self._data_dtype = data.dtype
+        else:
+            frames = None
+
+        out = self._out
+        if out is None:
+            out = self._get_output_array(self._data_shape, self._data_dtype)
+
+        # One slice of the output per client, for its sensor
+        rows = np.split(out, num_clients)
+
+        if frames is None:
+            frames = self._get_frames(range(num_clients), rows)
+        else:
+            for (_, data, _), row in zip(frames, rows):
+                np.copyto(row, data, casting="same_kind")
+
+        if self.align_sequence or self.max_skew_s is not None:
+            self._align_frames(frames, rows)
+
         all_info = []
-        all_data = []
-        for client in self.clients:
-            info, data = client.get_next()
+        for info, _, _ in frames:
             all_info.extend(info)
-            all_data.append(data)
 
-        return all_info, np.concatenate(all_data)
+        return all_info, out
+
+    def _get_frames(self, idxs, rows):
+        """Get the next frame of the clients at idxs concurrently, as (info, data, time)."""
+        futures = [
+            self._executor.submit(self._get_frame, self.clients[i], rows[i]) for i in idxs
+        ]
+        return [future.result() for future in futures]
+
+    @staticmethod
+    def _get_frame(client, out):
+        info, data = client.get_next(out=out)
+        return info, data, monotonic()
+
+    def _align_frames(self, frames, rows):
+        for _ in range(self.MAX_ALIGN_ATTEMPTS):
+            lagging = self._get_lagging(frames)
+
+            if not lagging:
+                return
+
+            log.debug("dropping frames of clients {} to align".format(lagging))
+            self.frames_dropped += len(lagging)
+
+            for i, frame in zip(lagging, self._get_frames(lagging, rows)):
+                frames[i] = frame
+
+        log.warning("could not align the frames, giving them as they are")
+
+    def _get_lagging(self, frames):
+        """Get the indexes of the clients whose frames are behind the newest one."""
+        if self.align_sequence:
+            try:
+                seqs = [info[0]["sequence_number"] for info, _, _ in frames]
+            except KeyError:
+                log.debug("no sequence_number in the infos, can not align by it")
+                seqs = None
+
+            if seqs is not None:
+                newest = max(seqs)
+                return [i for i, seq in enumerate(seqs) if seq < newest]
+
+        if self.max_skew_s is None:
+            return []
+
+        newest = max(t for _, _, t in frames)
+        return [i for i, (_, _, t) in enumerate(frames) if newest - t > self.max_skew_s]
 
     def _stop_session(self):
         for client in self.clients:
             client.stop_session()
 
+        self._executor.shutdown()
+        self._executor = None
+
     def _disconnect(self):
         for client in self.clients:
             client.disconnect()
@@ -0,0 +1,208 @@
+import logging
+import threading
+
+import numpy as np
+
+from acconeer.exptool.clients.base import BaseClient, ClientError
+
+
+log = logging.getLogger(__name__)
+
+
+DROP_OLDEST = "drop_oldest"
+DROP_NEWEST = "drop_newest"
+BLOCK = "block"
+
+POLICIES = (DROP_OLDEST, DROP_NEWEST, BLOCK)
+
+
+class PrefetchClient(BaseClient):
+    """Wraps a client, reading its frames in a background thread while streaming.
+
+    The frames are kept in a ring buffer of queue_size frames, so that the server is drained
+    even when get_next is not called for a while. When the buffer is full, the policy
+    decides what happens with the next frame:
+
+    - "drop_oldest" (default): the oldest frame in the buffer is dropped
+    - "drop_newest": the new frame is dropped
+    - "block": the frame is not read from the wrapped client until there is room
+
+    get_next and get_next_batch give the oldest frames in the buffer, while get_latest gives
+    the newest and skips the rest. The data is always copied out of the ring buffer. The
+    counters frames_received, frames_dropped and frames_skipped, and queue_depth and
+    max_queue_depth, tell how the buffer keeps up.
+    """
+
+    def __init__(self, client, **kwargs):
+        self.queue_size = kwargs.pop("queue_size", 16)
+        self.policy = kwargs.pop("policy", DROP_OLDEST)
+        self.timeout = kwargs.pop("timeout", None)  # for waiting on a frame, None for no limit
+
+        super().__init__(**kwargs)
+
+        if self.policy not in POLICIES:
+            raise ValueError("policy must be one of {}".format(", ".join(POLICIES)))
+
+        if self.queue_size < 1:
+            raise ValueError("queue_size must be at least 1")
+
+        if client.reuse_output:
+            raise ValueError("the wrapped client must not reuse its output")
+
+        self.client = client
+
+        self._thread = None
+        self._cond = threading.Condition()
+        self._stopping = False
+        self._error = None
+        self._reset_buffer()
+
+    def _reset_buffer(self):
+        # One slot more than the queue size, so that there is always a free slot to read
+        # the next frame into. The queued frames are the count slots from head and on.
+        self._ring = None
+        self._ring_infos = [None] * (self.queue_size + 1)
+        self._head = 0
+        self._count = 0
+
+        self.frames_received = 0
+        self.frames_dropped = 0
+        self.frames_skipped = 0
+        self.max_queue_depth = 0
+
+    @property
+    def queue_depth(self):
+        return self._count
+
+    def get_latest(self, out=None):
+        """Like get_next, but get the newest frame in the buffer, skipping the older ones.
+
+        Waits for a frame if the buffer is empty.
+        """
+        if not self._streaming_started:
+            raise ClientError("must be streaming to get next")
+
+        self._out = out
+        try:
+            return self._pop(latest=True)
+        finally:
+            self._out = None
+
+    def _connect(self):
+        return self.client.connect()
+
+    def _setup_session(self, config):
+        return self.client.setup_session(config)
+
+    def _start_session(self):
+        self.client.start_session()
+
+        self._reset_buffer()
+        self._stopping = False
+        self._error = None
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _get_next(self):
+        return self._pop(latest=False)
+
+    def _stop_session(self):
+        with self._cond:
+            self._stopping = True
+            self._cond.notify_all()
+
+        # The thread finishes once the wrapped client gives its next frame
+        self._thread.join()
+        self._thread = None
+
+        self.client.stop_session()
+
+    def _disconnect(self):
+        self.client.disconnect()
+
+    def _get_supported_modes(self):
+        return self.client.supported_modes
+
+    def _run(self):
+        size = self.queue_size + 1
+
+        try:
+            while True:
+                with self._cond:
+                    if self.policy == BLOCK:
+                        while self._count >= self.queue_size and not self._stopping:
+                            self._cond.wait()
+
+                    if self._stopping:
+                        return
+
+                    i = (self._head + self._count) % size
+
+                # Read into the free slot without holding the lock, the consumer never
+                # touches it
+                if self._ring is None:
+                    info, data = self.client.get_next()
+                    self._ring = np.empty((size,) + data.shape, data.dtype)
+                    self._ring[i] = data
+                else:
+                    info, _ = self.client.get_next(out=self._ring[i])
+
+                with self._cond:
+                    self.frames_received += 1
+
+                    if self._count >= self.queue_size:
+                        self.frames_dropped += 1
+
+                        if self.policy == DROP_NEWEST:
+                            continue
+
+                        # DROP_OLDEST
+                        self._head = (self._head + 1) % size
+                        self._count -= 1
+
+                    self._ring_infos[i] = info
+                    self._count += 1
+                    self.max_queue_depth = max(self.max_queue_depth, self._count)
+                    self._cond.notify_all()
+        except Exception as e:
+            log.debug("prefetch thread stopped by exception: {}".format(e))
+
+            with self._cond:
+                self._error = e
+                self._cond.notify_all()
+
+    def _pop(self, latest):
+        with self._cond:
+            ready = self._cond.wait_for(
+                lambda: self._count > 0 or self._error is not None, self.timeout
+            )
+
+            if not ready:
+                raise ClientError("timeout while waiting for frame")
+
+            if self._count == 0:
+                raise ClientError("failed to get frame from wrapped client") from self._error
+
+            if latest:
+                self.frames_skipped += self._count - 1
+                self._head = (self._head + self._count - 1) % len(self._ring)
+                self._count = 1
+
+            i = self._head
+            info = self._ring_infos[i]
+            self._ring_infos[i] = None
+            data = self._ring[i]
+
+            if self._out is not None:
+                out = self._out
+            else:
+                out = self._get_output_array(data.shape, data.dtype)
+
+            # Copy while holding the lock, so that the slot is not written to meanwhile
+            np.copyto(out, data, casting="same_kind")
+
+            self._head = (self._head + 1) % len(self._ring)
+            self._count -= 1
+            self._cond.notify_all()
+
+        return info, out
@@ -4,6 +4,7 @@ import multiprocessing as mp
 import platform
 import queue
 import signal
+import struct
 import sys
 import traceback
 from collections import namedtuple
@@ -20,6 +21,7 @@ from acconeer.exptool.clients.base import (
     decode_version_str,
 )
 from acconeer.exptool.clients.reg import protocol, regmap
+from acconeer.exptool.clients.reg.polling import DataReadyPoller
 from acconeer.exptool.modes import Mode
 
 
@@ -57,10 +59,12 @@ class RegBaseClient(BaseClient):
         self._mode = mode
         self._config = config
 
-        self._write_reg("main_control", "stop")
-        self._write_reg("mode_selection", mode)
-        self._write_reg("update_rate", 0)
-        self._write_reg("sensor_power_mode", "active")
+        reg_vals = [
+            ("main_control", "stop"),
+            ("mode_selection", mode),
+            ("update_rate", 0),
+            ("sensor_power_mode", "active"),
+        ]
 
         for key, reg in regmap.get_config_key_to_reg_map(mode).items():
             val = getattr(config, key)
@@ -68,23 +72,29 @@ class RegBaseClient(BaseClient):
             if val is None:
                 continue
 
-            self._write_reg(reg, val)
+            reg_vals.append((reg, val))
 
-        self._write_reg("streaming_control", self._streaming_control_val)
+        reg_vals.append(("streaming_control", self._streaming_control_val))
 
+        # The config writes can be sent in one go, but the session is only created once all
+        # of them are known to have succeeded
+        self._write_regs(reg_vals)
         self._write_reg("main_control", "create")
         self._wait_status(regmap.STATUS_FLAGS.CREATED)
 
-        info = {}
-        info_regs = regmap.get_session_info_regs(mode)
-        for reg in info_regs:
+        info_keys = []
+        info_regs = []
+        for reg in regmap.get_session_info_regs(mode):
             k = reg.stripped_name
             k = regmap.STRIPPED_NAME_TO_INFO_REMAP.get(k, k)
 
             if k is None:
                 continue
 
-            info[k] = self._read_reg(reg)
+            info_keys.append(k)
+            info_regs.append(reg)
+
+        info = dict(zip(info_keys, self._read_regs(info_regs)))
 
         if MODE_INFOS[mode].fixed_buffer_size:
             self._data_length = info.get("data_length")
@@ -130,8 +140,9 @@ class RegBaseClient(BaseClient):
         self._write_reg("main_control", "clear_status")
 
         for mode in Mode:
-            self._write_reg("mode_selection", mode)
-            status = self._read_reg("status")
+            # The mode selection and the status read are sent together, but the status is
+            # still only cleared on errors, which needs the status first
+            (status,) = self._transact_regs([("mode_selection", mode), "status"])
 
             if status & regmap.STATUS_FLAGS.ERROR_SET_MODE:
                 self._write_reg("main_control", "clear_status")
@@ -154,6 +165,95 @@ class RegBaseClient(BaseClient):
 
         return self._buffer_size * 8 * self._config.update_rate
 
+    def _get_next(self):
+        info, buffer = self._recv_frame()
+        raw, shape = protocol.unpack_output_buffer(buffer, self._mode, self._sweeps_per_frame)
+
+        if not self.squeeze:
+            info = [info]
+            shape = (1,) + shape
+
+        data = self._decode_data(raw, shape, iq=self._mode == Mode.IQ)
+        return info, data
+
+    def _get_next_batch(self, n):
+        # Receive all frames first, with their buffers one after the other, and then decode
+        # them all at once
+        infos = []
+        buffers = None
+
+        for i in range(n):
+            info, buffer = self._recv_frame()
+            infos.append(info if self.squeeze else [info])
+
+            if buffers is None:
+                buffer_size = len(buffer)
+                buffers = bytearray(n * buffer_size)
+            elif len(buffer) != buffer_size:
+                raise ClientError("buffer size changed within batch")
+
+            buffers[i * buffer_size : (i + 1) * buffer_size] = buffer
+
+        raw, shape = protocol.unpack_output_buffer(buffer, self._mode, self._sweeps_per_frame)
+        raw = np.frombuffer(buffers, dtype=raw.dtype)
+        shape = (n,) + shape if self.squeeze else (n, 1) + shape
+
+        data = self._decode_data(raw, shape, iq=self._mode == Mode.IQ)
+        return infos, data
+
+    @property
+    def _sweeps_per_frame(self):
+        return getattr(self._config, "sweeps_per_frame", None)
+
+    def _decode_result_info(self, result_info):
+        """Decode the result info of a stream data segment into an info dict."""
+        decoders = regmap.get_data_info_decoders(self._mode)
+
+        info = {}
+        for addr, enc_val in result_info.tolist():
+            try:
+                k, decode = decoders[addr]
+                val = decode(enc_val)
+            except (KeyError, ValueError, struct.error):
+                log.info("got unknown reg val in result info")
+                log.info("addr: {}, value: {}".format(addr, fmt_enc_val(enc_val)))
+            else:
+                if k is None:
+                    continue
+
+                info[k] = val
+
+        return info
+
+    def _write_regs(self, reg_vals):
+        """Write several registers, given as (reg, val) pairs, in order."""
+        self._transact_regs(reg_vals)
+
+    def _read_regs(self, regs):
+        """Read several registers, in order."""
+        return self._transact_regs(regs)
+
+    def _transact_regs(self, transactions):
+        """Do register writes, given as (reg, val) pairs, and reads, given as regs, in order.
+
+        Returns the values read. Override in clients which can send all requests before
+        waiting for the responses.
+        """
+        vals = []
+
+        for transaction in transactions:
+            if isinstance(transaction, tuple):
+                self._write_reg(*transaction)
+            else:
+                vals.append(self._read_reg(transaction))
+
+        return vals
+
+    @abc.abstractmethod
+    def _recv_frame(self):
+        """Receive the next frame, as the info and the raw output buffer."""
+        pass
+
     @abc.abstractmethod
     def _read_reg(self, reg):
         pass
@@ -166,6 +266,7 @@ class RegBaseClient(BaseClient):
 class UARTClient(RegBaseClient):
     DEFAULT_BASE_BAUDRATE = 115200
     CONNECT_ROUTINE_TIMEOUT = 0.6
+    MAX_PIPELINED_REQUESTS = 16
 
     def __init__(self, port, **kwargs):
         self.override_baudrate = kwargs.pop("override_baudrate", None)
@@ -252,36 +353,13 @@ class UARTClient(RegBaseClient):
         # self._wait_status(regmap.STATUS_FLAGS.ACTIVATED)
         # TODO: how can we handle streaming and reading/writing registers at the same time?
 
-    def _get_next(self):
+    def _recv_frame(self):
         packet = self._recv_packet(allow_recovery_skip=True)
 
         if not isinstance(packet, protocol.StreamData):
             raise ClientError("got unexpected type of frame")
 
-        info = {}
-        for addr, enc_val in packet.result_info:
-            try:
-                reg = regmap.get_reg(addr, self._mode)
-                val = reg.decode(enc_val)
-            except (protocol.ProtocolError, ValueError):
-                log.info("got unknown reg val in result info")
-                log.info("addr: {}, value: {}".format(addr, fmt_enc_val(enc_val)))
-            else:
-                k = reg.stripped_name
-                k = regmap.STRIPPED_NAME_TO_INFO_REMAP.get(k, k)
-
-                if k is None:
-                    continue
-
-                info[k] = val
-
-        sweeps_per_frame = getattr(self._config, "sweeps_per_frame", None)
-        data = protocol.decode_output_buffer(packet.buffer, self._mode, sweeps_per_frame)
-
-        if self.squeeze:
-            return info, data
-        else:
-            return [info], np.expand_dims(data, 0)
+        return self._decode_result_info(packet.result_info), packet.buffer
 
     def _stop_session(self):
         self._write_reg("main_control", "stop", expect_response=False)
@@ -365,6 +443,64 @@ class UARTClient(RegBaseClient):
 
             log.debug("recv reg w res: ok")
 
+    def _transact_regs(self, transactions):
+        requests = []
+        read_regs = []
+
+        for transaction in transactions:
+            if isinstance(transaction, tuple):
+                reg, val = transaction
+                reg = regmap.get_reg(reg, self._mode)
+                rrv = protocol.RegVal(reg.addr, reg.encode(val))
+                requests.append(protocol.RegWriteRequest(rrv))
+            else:
+                reg = regmap.get_reg(transaction, self._mode)
+                requests.append(protocol.RegReadRequest(reg.addr))
+                read_regs.append(reg)
+
+        responses = self._transact(requests)
+        read_responses = [res for res in responses if isinstance(res, protocol.RegReadResponse)]
+        return [reg.decode(res.reg_val.val) for reg, res in zip(read_regs, read_responses)]
+
+    def _transact(self, requests):
+        """Send requests back-to-back, and then get and check their responses, in order.
+
+        Saves a round trip over the link per request. At most MAX_PIPELINED_REQUESTS are
+        sent before waiting for responses, so that the input buffer of the module is not
+        overrun.
+        """
+        responses = []
+
+        for i in range(0, len(requests), self.MAX_PIPELINED_REQUESTS):
+            chunk = requests[i : i + self.MAX_PIPELINED_REQUESTS]
+            frames = [protocol.insert_packet_into_frame(req) for req in chunk]
+            self._link.send(b"".join(frames))
+
+            log.debug("sent {} pipelined requests".format(len(chunk)))
+
+            for req in chunk:
+                res = self._recv_packet()
+
+                if isinstance(req, protocol.RegWriteRequest):
+                    if not isinstance(res, protocol.RegWriteResponse):
+                        raise ClientError("got unexpected packet (expected reg write response)")
+                    if res.reg_val != req.reg_val:
+                        raise ClientError("reg write failed")
+                elif isinstance(req, protocol.RegReadRequest):
+                    if not isinstance(res, protocol.RegReadResponse):
+                        raise ClientError("got unexpected type of frame")
+                    if res.reg_val.addr != req.addr:
+                        raise ClientError("got reg read response for another reg")
+                elif isinstance(req, protocol.BufferReadRequest):
+                    if not isinstance(res, protocol.BufferReadResponse):
+                        raise ClientError("got unexpected type of frame")
+
+                responses.append(res)
+
+        log.debug("recv {} pipelined responses".format(len(responses)))
+
+        return responses
+
     def _send_packet(self, packet):
         frame = protocol.insert_packet_into_frame(packet)
         self._link.send(frame)
@@ -378,16 +514,18 @@ class UARTClient(RegBaseClient):
         if start_marker != protocol.START_MARKER:
             raise ClientError("got invalid frame (incorrect start marker)")
 
-        buf_2 = self._link.recv(packet_len + 2)
-        packet = buf_2[:-1]
+        buf_2 = self._link.recv_view(packet_len + 2)
         end_marker = buf_2[-1]
 
-        if end_marker != protocol.END_MARKER:
+        if end_marker == protocol.END_MARKER:
+            packet = buf_2[:-1]
+        else:
             if not allow_recovery_skip:
                 raise ClientError("got invalid frame (incorrect end marker)")
 
             log.debug("got invalid frame (incorrect end marker), attempting recovery")
 
+            buf_2 = bytearray(buf_2)
             buf_2.extend(self._link.recv(1 + protocol.LEN_FIELD_SIZE))
 
             si = 0
@@ -432,23 +570,62 @@ class PollingUARTClient(UARTClient):
         super().__init__(port, **kwargs)
         self._streaming_control_val = "no_streaming"
         self._link = links.SerialLink(port)  # don't use link in separate process
+        self._poller = DataReadyPoller()
+        self._frame_requests = None
+        self._info_decoders = None
+
+    @property
+    def status_reads(self):
+        return self._poller.status_reads
+
+    @property
+    def status_reads_per_frame(self):
+        return self._poller.status_reads_per_frame
+
+    def _setup_session(self, config):
+        ret = super()._setup_session(config)
+
+        # The requests to read the buffer and the data info, and clear the status, of each
+        # frame, sent in one go
+        self._frame_requests = [protocol.BufferReadRequest(protocol.MAIN_BUFFER_ADDR)]
+        self._info_decoders = []
+
+        for addr, (k, decode) in regmap.get_data_info_decoders(self._config.mode).items():
+            if k is None:
+                continue
+
+            self._info_decoders.append((k, decode))
+            self._frame_requests.append(protocol.RegReadRequest(addr))
+
+        if not self._measure_on_call:
+            reg = regmap.get_reg("main_control")
+            rrv = protocol.RegVal(reg.addr, reg.encode("clear_status"))
+            self._frame_requests.append(protocol.RegWriteRequest(rrv))
+
+        return ret
 
     def _start_session(self):
         self._write_reg("main_control", "activate")
         self._wait_status(regmap.STATUS_FLAGS.ACTIVATED)
 
-    def _get_next(self):
+        update_rate = self._config.update_rate
+        self._poller = DataReadyPoller(update_rate, periodic=not self._measure_on_call)
+
+    def _recv_frame(self):
         if self._measure_on_call:
             self._write_reg("main_control", "clear_status")
 
         poll_t = time()
+        self._poller.start()
 
         while True:
+            self._poller.wait()
             status = self._read_reg("status")
 
             if status & regmap.STATUS_MASKS.ERROR_MASK:
                 raise ClientError("server error: " + str(status).split(".")[1])
             elif status & regmap.STATUS_FLAGS.DATA_READY:
+                self._poller.ready()
                 break
             else:
                 if (time() - poll_t) > self._link.timeout:
@@ -456,29 +633,14 @@ class PollingUARTClient(UARTClient):
 
                 continue
 
-        buffer = self._read_buf_raw()
+        responses = self._transact(self._frame_requests)
+        buffer = responses[0].buffer
 
         info = {}
-        info_regs = regmap.get_data_info_regs(self._config.mode)
-        for reg in info_regs:
-            k = reg.stripped_name
-            k = regmap.STRIPPED_NAME_TO_INFO_REMAP.get(k, k)
-
-            if k is None:
-                continue
-
-            info[k] = self._read_reg(reg)
-
-        if not self._measure_on_call:
-            self._write_reg("main_control", "clear_status")
-
-        sweeps_per_frame = getattr(self._config, "sweeps_per_frame", None)
-        data = protocol.decode_output_buffer(buffer, self._mode, sweeps_per_frame)
+        for (k, decode), res in zip(self._info_decoders, responses[1:]):
+            info[k] = decode(res.reg_val.val)
 
-        if self.squeeze:
-            return info, data
-        else:
-            return [info], np.expand_dims(data, 0)
+        return info, buffer
 
     def _stop_session(self):
         self._write_reg("main_control", "stop")
@@ -488,17 +650,47 @@ class PollingUARTClient(UARTClient):
 
 
 class SPIClient(RegBaseClient):
+    _ERROR_CHECK_INTERVAL = 0.1
+
     def __init__(self, **kwargs):
+        # Private and off by default, as it is not verified on hardware. With _full_duplex,
+        # the data info and buffer requests of each frame are sent in full duplex with
+        # reading the response to the request before (see SPICommProcess.transfer_requests).
+        # That relies on the module firmware keeping the response to a register read
+        # request until the next transfer, and taking in a new request during that same
+        # transfer, rather than only answering a read which follows its request.
+        self._full_duplex = kwargs.pop("_full_duplex", False)
+
         super().__init__(**kwargs)
 
         self._proc = None
+        self._ring = None
+        self._poll_counts = mp.Array("q", 2)  # status reads and frames, set by the process
+
+    @property
+    def status_reads(self):
+        return self._poll_counts[0]
+
+    @property
+    def status_reads_per_frame(self):
+        with self._poll_counts.get_lock():
+            status_reads, frames = self._poll_counts
+
+        if frames == 0:
+            return None
+
+        return status_reads / frames
 
     def _connect(self):
         self._cmd_queue = mp.Queue()
         self._data_queue = mp.Queue()
+        self._ring = links.SharedRingBuffer()
         args = (
             self._cmd_queue,
             self._data_queue,
+            self._ring,
+            self._poll_counts,
+            self._full_duplex,
         )
         self._proc = SPICommProcess(*args)
         self._proc.start()
@@ -532,24 +724,32 @@ class SPIClient(RegBaseClient):
 
         self.__cmd_proc("start_session")
 
-    def _get_next(self):
-        ret_cmd, ret_args = self._data_queue.get()
-        if ret_cmd == "error":
-            raise ClientError("exception raised in SPI communcation process")
-        elif ret_cmd != "get_next":
-            raise ClientError
-        info, buffer = ret_args
+    def _recv_frame(self):
+        # The frames are written to the ring buffer, while errors come through the queue
+        while True:
+            try:
+                segment = self._ring.read_record_view(timeout=self._ERROR_CHECK_INTERVAL)
+            except links.LinkError:
+                pass
+            else:
+                break
+
+            try:
+                ret_cmd, _ = self._data_queue.get_nowait()
+            except queue.Empty:
+                continue
 
-        sweeps_per_frame = getattr(self._config, "sweeps_per_frame", None)
-        data = protocol.decode_output_buffer(buffer, self._mode, sweeps_per_frame)
+            if ret_cmd == "error":
+                raise ClientError("exception raised in SPI communcation process")
+            else:
+                raise ClientError
 
-        if self.squeeze:
-            return info, data
-        else:
-            return [info], np.expand_dims(data, 0)
+        stream_data = protocol.unpack_stream_data_segment(segment)
+        return self._decode_result_info(stream_data.result_info), stream_data.buffer
 
     def _stop_session(self):
         self.__cmd_proc("stop_session")
+        self._ring.discard()
 
         mask = regmap.STATUS_FLAGS.CREATED | regmap.STATUS_FLAGS.ACTIVATED
         self._wait_status(0, mask=mask)
@@ -558,6 +758,10 @@ class SPIClient(RegBaseClient):
         self.__cmd_proc("disconnect")
         self._proc.join(1)
 
+        self._ring.close()
+        self._ring.unlink()
+        self._ring = None
+
     def _read_reg(self, reg):
         reg = regmap.get_reg(reg, self._mode)
         enc_val = self._read_reg_raw(reg.addr)
@@ -593,31 +797,26 @@ class SPIClient(RegBaseClient):
     def __cmd_proc(self, cmd, *args):
         log.debug("sending cmd to proc: {}".format(cmd))
         self._cmd_queue.put((cmd, args))
-        if cmd == "stop_session":
-            while True:
-                ret_cmd, _ = self._data_queue.get()
-                if ret_cmd == cmd:
-                    break
-                elif ret_cmd == "error":
-                    raise ClientError("exception raised in SPI communcation process")
-                elif ret_cmd != "get_next":
-                    raise ClientError
-            ret_args = None
-        else:
-            ret_cmd, ret_args = self._data_queue.get()
-            if ret_cmd == "error":
-                raise ClientError("exception raised in SPI communcation process")
-            elif ret_cmd != cmd:
-                raise ClientError
+
+        # Frames are written to the ring buffer, so the next response is to this command
+        ret_cmd, ret_args = self._data_queue.get()
+        if ret_cmd == "error":
+            raise ClientError("exception raised in SPI communcation process")
+        elif ret_cmd != cmd:
+            raise ClientError
         return ret_args
 
 
 class SPICommProcess(mp.Process):
-    def __init__(self, cmd_q, data_q):
+    def __init__(self, cmd_q, data_q, ring, poll_counts, full_duplex=False):
         super().__init__(daemon=True)
         self.cmd_q = cmd_q
         self.data_q = data_q
+        self.ring = ring
+        self.poll_counts = poll_counts
+        self.full_duplex = full_duplex
         self.mode = None
+        self.poller = DataReadyPoller()
 
     def run(self):
         self.log = logging.getLogger(__name__)
@@ -638,6 +837,8 @@ class SPICommProcess(mp.Process):
             except queue.Empty:
                 break
 
+        self.ring.close()
+
     def _run(self):
         while True:
             (cmd, cmd_args) = self.cmd_q.get()
@@ -655,18 +856,26 @@ class SPICommProcess(mp.Process):
 
     def poll(self):
         while self.cmd_q.empty():
-            ret = self.get_next()
-            self.data_q.put(("get_next", ret))
+            segment = self.get_next()
+
+            # Wait for the main process to make room, unless there is a new command
+            while not self.ring.write_record(segment, timeout=0.1):
+                if not self.cmd_q.empty():
+                    self.log.debug("dropped frame, the ring buffer is full")
+                    break
 
     def get_next(self):
         poll_t = time()
+        self.poller.start()
 
         while True:
+            self.poller.wait()
             status = self.read_reg("status", do_log=False)
 
             if status & regmap.STATUS_MASKS.ERROR_MASK:
                 raise ClientError("server error: " + str(status).split(".")[1])
             elif status & regmap.STATUS_FLAGS.DATA_READY:
+                self.poller.ready()
                 break
             else:
                 if (time() - poll_t) > self.poll_timeout:
@@ -674,26 +883,30 @@ class SPICommProcess(mp.Process):
 
                 continue
 
-        buffer_size = self.fixed_buf_size or self.read_reg("output_buffer_length")
-        if buffer_size > 0:
-            buffer = self.read_buf_raw(protocol.MAIN_BUFFER_ADDR, buffer_size)
-        else:
-            buffer = bytearray()
+        with self.poll_counts.get_lock():
+            self.poll_counts[:] = [self.poller.status_reads, self.poller.frames]
 
-        info = {}
-        info_regs = regmap.get_data_info_regs(self.mode)
-        for reg in info_regs:
-            k = reg.stripped_name
-            k = regmap.STRIPPED_NAME_TO_INFO_REMAP.get(k, k)
+        buffer_size = self.fixed_buf_size or self.read_reg("output_buffer_length", do_log=False)
 
-            if k is None:
-                continue
+        # The result info is decoded in the main process, as for UART streaming
+        if self.full_duplex and buffer_size > 0:
+            # Read the data info and request the buffer with one transfer per request
+            enc_vals = self.transfer_requests(self.frame_requests)
+            result_info = list(zip(self.info_addrs, enc_vals))
+            buffer = self.dev.spi_master_single_read(buffer_size)
+        else:
+            if buffer_size > 0:
+                buffer = self.read_buf_raw(protocol.MAIN_BUFFER_ADDR, buffer_size)
+            else:
+                buffer = bytearray()
 
-            info[k] = self.read_reg(reg, do_log=False)
+            result_info = [
+                (addr, self.read_reg_raw(addr, do_log=False)) for addr in self.info_addrs
+            ]
 
         self.write_reg("main_control", "clear_status", do_log=False)
 
-        return info, buffer
+        return protocol.pack_stream_data_segment(result_info, buffer)
 
     def connect(self):
         self.dev = libft4222.Device()
@@ -714,9 +927,25 @@ class SPICommProcess(mp.Process):
             self.poll_timeout = 2 / update_rate + 0.5
 
         self.fixed_buf_size = buffer_size
+        self.poller = DataReadyPoller(update_rate)
+
+        self.info_addrs = []
+        for addr, (k, _) in regmap.get_data_info_decoders(mode).items():
+            if k is not None:
+                self.info_addrs.append(addr)
+
+        self.frame_requests = [
+            bytearray([protocol.REG_READ_REQUEST, addr, 0, 0]) for addr in self.info_addrs
+        ]
+        self.frame_requests.append(
+            bytearray([protocol.BUF_READ_REQUEST, protocol.MAIN_BUFFER_ADDR, 0, 0])
+        )
 
     def start_session(self):
-        pass
+        self.poller.reset()
+
+        with self.poll_counts.get_lock():
+            self.poll_counts[:] = [0, 0]
 
     def stop_session(self):
         self.write_reg("main_control", "stop")
@@ -756,6 +985,17 @@ class SPICommProcess(mp.Process):
         self.dev.spi_master_single_write(b)
         return self.dev.spi_master_single_read(size)
 
+    def transfer_requests(self, requests):
+        """Send the requests, each in full duplex with reading the response to the one before.
+
+        Gives the (4 byte) responses to all but the last request, which is left for the caller
+        to read. Saves a transfer per request compared to writing and reading one at a time,
+        but relies on the module firmware taking in a request while it sends the response
+        to the one before, which is not verified on hardware. Only used with _full_duplex.
+        """
+        self.dev.spi_master_single_write(requests[0])
+        return [self.dev.spi_master_single_read_write(req) for req in requests[1:]]
+
 
 def fmt_enc_val(enc_val):
     return " ".join(["{:02x}".format(x) for x in enc_val])
@@ -0,0 +1,125 @@
+from collections import deque
+from statistics import median
+from time import monotonic, sleep
+
+
+class DataReadyPoller:
+    """Schedules the status reads when polling for DATA_READY.
+
+    Rather than reading the status register back to back, the poller predicts when the next
+    frame will be ready, sleeps until shortly before that, and then reads with exponentially
+    increasing intervals, from MIN_INTERVAL up to MAX_INTERVAL.
+
+    With periodic frames, the next frame is expected one frame period after the previous
+    one. The period is 1 / update_rate if given, and otherwise the median of the recent
+    intervals between frames. Frames measured on call (not periodic) are expected the
+    median of the recent measurement times after the call. Until there is anything to go
+    by, the poller backs off from the start.
+
+    The counters status_reads and frames tell how many status reads it takes per frame.
+
+    Usage, for each frame:
+
+        poller.start()
+        while True:
+            poller.wait()
+            status = read status register
+            if DATA_READY in status:
+                poller.ready()
+                break
+    """
+
+    HISTORY = 8
+    MARGIN = 0.05  # of the expected wait
+    MIN_MARGIN = 0.5e-3
+    MIN_INTERVAL = 0.2e-3
+    MAX_INTERVAL = 2e-3
+
+    def __init__(self, update_rate=None, periodic=True):
+        self.period = None if update_rate is None else 1 / update_rate
+        self.periodic = periodic
+        self.reset()
+
+    def reset(self):
+        self.status_reads = 0
+        self.frames = 0
+
+        self._times = deque(maxlen=self.HISTORY)  # frame intervals or measurement times
+        self._last_ready_t = None
+        self._start_t = None
+        self._wake_t = None
+        self._read_t = None
+        self._prev_read_t = None
+        self._num_reads = 0
+        self._interval = self.MIN_INTERVAL
+
+    @property
+    def status_reads_per_frame(self):
+        if self.frames == 0:
+            return None
+
+        return self.status_reads / self.frames
+
+    def start(self):
+        """Start waiting for the next frame."""
+        self._start_t = monotonic()
+        self._read_t = None
+        self._prev_read_t = None
+        self._num_reads = 0
+        self._interval = self.MIN_INTERVAL
+
+        if self.periodic:
+            ref_t = self._last_ready_t
+            expected = self.period if self.period is not None else self._get_typical_time()
+        else:
+            ref_t = self._start_t
+            expected = self._get_typical_time()
+
+        if ref_t is None or expected is None:
+            self._wake_t = None
+        else:
+            margin = max(expected * self.MARGIN, self.MIN_MARGIN)
+            self._wake_t = ref_t + expected - margin
+
+    def wait(self):
+        """Sleep until it is time for the next status read."""
+        if self._num_reads == 0:
+            delay = 0.0 if self._wake_t is None else self._wake_t - monotonic()
+        else:
+            delay = self._interval
+            self._interval = min(2 * self._interval, self.MAX_INTERVAL)
+
+        if delay > 0:
+            sleep(delay)
+
+        self._prev_read_t = self._read_t
+        self._read_t = monotonic()
+        self._num_reads += 1
+        self.status_reads += 1
+
+    def ready(self):
+        """Tell that the last status read had DATA_READY set."""
+        # Take the earliest time the frame could have gotten ready, that is, the read before.
+        # Estimating early rather than late keeps the predictions from drifting late. If the
+        # first read was ready, the wake up time is used instead, so that the next wake up
+        # comes earlier until the frame is caught getting ready.
+        if self._prev_read_t is not None:
+            ready_t = self._prev_read_t
+        elif self._wake_t is not None:
+            ready_t = min(self._wake_t, self._read_t)
+        else:
+            ready_t = self._read_t
+
+        if not self.periodic:
+            self._times.append(ready_t - self._start_t)
+        elif self._last_ready_t is not None:
+            self._times.append(ready_t - self._last_ready_t)
+
+        self._last_ready_t = ready_t
+        self.frames += 1
+
+    def _get_typical_time(self):
+        if not self._times:
+            return None
+
+        return median(self._times)
@@ -2,6 +2,7 @@ from collections import namedtuple
 
 import numpy as np
 
+from acconeer.exptool.clients.base import decode_data
 from acconeer.exptool.modes import Mode, get_mode
 
 
@@ -40,13 +41,20 @@ STREAM_BUFFER = 0xFE
 
 MAIN_BUFFER_ADDR = 0xE8
 
+RESULT_INFO_DTYPE = np.dtype([("addr", "u1"), ("val", "V{}".format(REG_SIZE))])
+
 
 def unpack_packet(packet):
     if len(packet) < 1:
         raise ProtocolError("package is too short")
 
     packet_type = packet[0]
-    segment = packet[1:]
+
+    if packet_type == STREAM_PACKET:
+        # Unpacked without copying, the stream data refers to the packet
+        return unpack_stream_data_segment(memoryview(packet)[1:])
+
+    segment = bytearray(packet[1:])
 
     if packet_type == REG_READ_RESPONSE:
         return unpack_reg_read_res_segment(segment)
@@ -54,8 +62,6 @@ def unpack_packet(packet):
         return unpack_reg_write_res_segment(segment)
     elif packet_type == BUF_READ_RESPONSE:
         return unpack_buf_read_res_segment(segment)
-    elif packet_type == STREAM_PACKET:
-        return unpack_stream_data_segment(segment)
     else:
         raise ProtocolError("unknown packet type")
 
@@ -87,32 +93,31 @@ def unpack_buf_read_res_segment(segment):
 
 
 def unpack_stream_data_segment(segment):
+    """Unpack the segment of a stream data packet, without copying it.
+
+    The result info is given as an array of RESULT_INFO_DTYPE, with the address and the
+    encoded value of each register, and the buffer as a memoryview into the segment.
+    """
+    segment = memoryview(segment)
     result_info = None
     buffer = None
-    rest = segment
-    while len(rest) > 0:
-        if len(rest) < 1 + LEN_FIELD_SIZE:
+    start = 0
+    while start < len(segment):
+        if len(segment) - start < 1 + LEN_FIELD_SIZE:
             raise ProtocolError("invalid package length")
 
-        part_type = rest[0]
-        data_start_index = 1 + LEN_FIELD_SIZE
-        part_len = int.from_bytes(rest[1:data_start_index], BO)
+        part_type = segment[start]
+        data_start_index = start + 1 + LEN_FIELD_SIZE
+        part_len = int.from_bytes(segment[start + 1 : data_start_index], BO)
         data_end_index = data_start_index + part_len
-        part_data = rest[data_start_index:data_end_index]
-        rest = rest[data_end_index:]
+        part_data = segment[data_start_index:data_end_index]
+        start = data_end_index
 
         if part_type == STREAM_RESULT_INFO:
-            s = ADDR_SIZE + REG_SIZE
-            if part_len % s != 0:
+            if len(part_data) % RESULT_INFO_DTYPE.itemsize != 0:
                 raise ProtocolError("invalid package length")
 
-            result_info = []
-            num_regs = part_len // s
-            for i in range(num_regs):
-                addr = part_data[s * i]
-                enc_val = part_data[s * i + 1 : s * (i + 1)]
-                rrv = RegVal(addr, enc_val)
-                result_info.append(rrv)
+            result_info = np.frombuffer(part_data, dtype=RESULT_INFO_DTYPE)
         elif part_type == STREAM_BUFFER:
             buffer = part_data
         else:
@@ -121,6 +126,24 @@ def unpack_stream_data_segment(segment):
     return StreamData(result_info, buffer)
 
 
+def pack_stream_data_segment(result_info, buffer):
+    """Pack the result info, as (addr, enc_val) pairs, and the buffer as a stream data segment.
+
+    The inverse of unpack_stream_data_segment.
+    """
+    packed_info = bytearray()
+    for reg_val in result_info:
+        packed_info.extend(pack_reg_val(RegVal(*reg_val)))
+
+    segment = bytearray()
+    for part_type, part_data in [(STREAM_RESULT_INFO, packed_info), (STREAM_BUFFER, buffer)]:
+        segment.append(part_type)
+        segment.extend(len(part_data).to_bytes(LEN_FIELD_SIZE, BO))
+        segment.extend(part_data)
+
+    return segment
+
+
 def pack_reg_val(reg_val):
     if len(reg_val.val) != REG_SIZE:
         raise ProtocolError("register value must be {} bytes".format(REG_SIZE))
@@ -188,19 +211,23 @@ def insert_packet_into_frame(packet):
     return frame
 
 
-def decode_output_buffer(buffer, mode, sweeps_per_frame=None):
+def decode_output_buffer(buffer, mode, sweeps_per_frame=None, dtype="float", out=None):
+    raw, shape = unpack_output_buffer(buffer, mode, sweeps_per_frame)
+    return decode_data(raw, shape, dtype, out, iq=get_mode(mode) == Mode.IQ)
+
+
+def unpack_output_buffer(buffer, mode, sweeps_per_frame=None):
+    """Get the raw data of an output buffer, as a flat array, and its shape when decoded."""
     mode = get_mode(mode)
 
-    if mode == Mode.POWER_BINS:
-        return np.frombuffer(buffer, dtype="<u2").astype("float")
-    elif mode == Mode.ENVELOPE:
-        return np.frombuffer(buffer, dtype="<u2").astype("float")
+    if mode in (Mode.POWER_BINS, Mode.ENVELOPE):
+        raw = np.frombuffer(buffer, dtype="<u2")
+        return raw, raw.shape
     elif mode == Mode.IQ:
-        data = np.frombuffer(buffer, dtype="<i2").astype("float")
-        return data.reshape((-1, 2)).view(dtype="complex").flatten()
+        raw = np.frombuffer(buffer, dtype="<i2")
+        return raw, (raw.size // 2,)
     elif mode == Mode.SPARSE:
-        data = np.frombuffer(buffer, dtype="<u2").astype("float")
-        data = data.reshape((sweeps_per_frame, -1))
-        return data
+        raw = np.frombuffer(buffer, dtype="<u2")
+        return raw, (sweeps_per_frame, raw.size // sweeps_per_frame)
     else:
         raise NotImplementedError
@@ -1,6 +1,7 @@
 import enum
 import operator
 import os
+import struct
 from functools import partial, reduce
 
 import attr
@@ -166,32 +167,22 @@ ENUM_REMAP = {
 
 REGISTERS = None
 
+# Built from REGISTERS in load_yaml, for each mode and None (any mode)
+MODE_TO_REGS = None  # {mode: [reg]}
+MODE_TO_REG_LOOKUP = None  # {mode: {addr/full_name/stripped_name: [reg]}}
+MODE_TO_DATA_INFO_DECODERS = None  # {mode: {addr: (info_key, decode_fun)}}
 
-def _match_reg_by_addr(addr, reg):
-    return reg.addr == addr
-
-
-def _match_reg_by_name(name, reg):
-    return name in (reg.full_name, reg.stripped_name)
+UINT32_STRUCT = struct.Struct("<I")
+INT32_STRUCT = struct.Struct("<i")
 
 
 def get_reg(value, mode=None):
     if isinstance(value, Register):
         return value
-    elif isinstance(value, int):
-        match_fun = partial(_match_reg_by_addr, value)
-    elif isinstance(value, str):
-        match_fun = partial(_match_reg_by_name, value)
-    else:
+    elif not isinstance(value, (int, str)):
         raise ValueError
 
-    mode = get_mode(mode)
-    matches = []
-
-    for reg in REGISTERS:
-        if match_fun(reg):
-            if mode is None or reg.modes is None or mode in reg.modes:
-                matches.append(reg)
+    matches = MODE_TO_REG_LOOKUP[get_mode(mode)].get(value, ())
 
     if len(matches) < 1:
         raise ValueError("unknown reg: {}".format(value))
@@ -215,8 +206,7 @@ def get_regs_for_mode(mode):
     if mode is None:
         raise ValueError
 
-    mode = get_mode(mode)
-    return [reg for reg in REGISTERS if reg.modes is None or mode in reg.modes]
+    return list(MODE_TO_REGS[get_mode(mode)])
 
 
 def get_regs_for_mode_in_category(category, mode):
@@ -227,6 +217,42 @@ get_session_info_regs = partial(get_regs_for_mode_in_category, Category.SESSION_
 get_data_info_regs = partial(get_regs_for_mode_in_category, Category.DATA_INFO)
 
 
+def get_data_info_decoders(mode):
+    """Get {addr: (info_key, decode_fun)} of the data info regs of the mode.
+
+    The info key is None for regs that are not given in the result info.
+    """
+    if mode is None:
+        raise ValueError
+
+    return MODE_TO_DATA_INFO_DECODERS[get_mode(mode)]
+
+
+def get_decoder(reg):
+    """Get a function decoding an encoded value of reg, as reg.decode but faster.
+
+    The encoded value must be REG_SIZE (4) bytes.
+    """
+    unpack = (INT32_STRUCT if reg.data_type == DataType.INT32 else UINT32_STRUCT).unpack
+
+    if reg.data_type == DataType.BITSET:
+        flags = reg.bitset_flags
+        return lambda enc_val: flags(unpack(enc_val)[0])
+
+    if reg.data_type == DataType.ENUM:
+        enum_cls = reg.enum
+        return lambda enc_val: enum_cls(unpack(enc_val)[0])
+
+    if reg.data_type == DataType.BOOL:
+        return lambda enc_val: bool(unpack(enc_val)[0])
+
+    if reg.float_scale is not None:
+        scale = reg.float_scale
+        return lambda enc_val: float(unpack(enc_val)[0]) / scale
+
+    return lambda enc_val: unpack(enc_val)[0]
+
+
 def get_config_key_to_reg_map(mode):  # {config_key: reg}
     mode = get_mode(mode)
     config_cls = configs.MODE_TO_CONFIG_CLASS_MAP[mode]
@@ -347,6 +373,40 @@ def load_yaml():
 
         REGISTERS.append(reg)
 
+    index_registers()
+
+
+def index_registers():
+    global MODE_TO_REGS, MODE_TO_REG_LOOKUP, MODE_TO_DATA_INFO_DECODERS
+
+    MODE_TO_REGS = {None: list(REGISTERS)}
+    MODE_TO_REG_LOOKUP = {}
+    MODE_TO_DATA_INFO_DECODERS = {}
+
+    for mode in Mode:
+        MODE_TO_REGS[mode] = [reg for reg in REGISTERS if reg.modes is None or mode in reg.modes]
+
+    for mode, regs in MODE_TO_REGS.items():
+        lookup = {}
+        for reg in regs:
+            for key in {reg.addr, reg.full_name, reg.stripped_name}:
+                lookup.setdefault(key, []).append(reg)
+
+        MODE_TO_REG_LOOKUP[mode] = lookup
+
+        if mode is None:
+            continue
+
+        decoders = {}
+        for reg in regs:
+            if reg.category != Category.DATA_INFO:
+                continue
+
+            k = STRIPPED_NAME_TO_INFO_REMAP.get(reg.stripped_name, reg.stripped_name)
+            decoders[reg.addr] = (k, get_decoder(reg))
+
+        MODE_TO_DATA_INFO_DECODERS[mode] = decoders
+
 
 load_yaml()
 
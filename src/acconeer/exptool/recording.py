@@ -1,8 +1,10 @@
 import copy
 import datetime
 import json
+import struct
 import time
 import warnings
+import zipfile
 from pathlib import Path
 from typing import Optional, Union
 
@@ -14,6 +16,20 @@ import acconeer.exptool
 from acconeer.exptool import configs, modes
 from acconeer.exptool.structs import configbase
 
+# Column types of the data_info keys given by the clients, used by StreamingRecorder. Other
+# keys get the type of their value in the first sample.
+DATA_INFO_DTYPES = {
+    "data_saturated": np.dtype(bool),
+    "missed_data": np.dtype(bool),
+    "data_quality_warning": np.dtype(bool),
+    "sensor_comm_error": np.dtype(bool),
+    "sensor_communication_error": np.dtype(bool),
+    "proximity_power": np.dtype("i8"),
+    "sequence_number": np.dtype("i8"),
+    "stitch_count": np.dtype("i8"),
+    "server_time": np.dtype("f8"),
+}
+
 
 @attr.s
 class Record:
@@ -124,6 +140,198 @@ class Recorder:
         return self.record
 
 
+class StreamingRecorder:
+    """Recorder that writes to an HDF5 file as it goes, rather than keeping all in memory.
+
+    Samples are buffered in chunks of chunk_size, which are appended to resizable,
+    compressed datasets when full, or at the latest every flush_interval_s. At most the
+    unflushed samples are lost if the process dies. data_info is stored columnar, one
+    dataset per key. The file can be loaded with load or load_h5.
+
+    The data type is taken from the first sample, with integer-valued real data stored
+    as u2 like save_h5 does, unless given with dtype. The data_info keys are those of the
+    first sample, with the types in DATA_INFO_DTYPES, or else the type of the first value.
+    A sample with other keys, or a value that can not be stored as the type of its column
+    (such as a float for an int column), raises a ValueError.
+    """
+
+    def __init__(self, filename: Union[str, Path], **kwargs):
+        sensor_config = kwargs.pop("sensor_config")
+        session_info = kwargs.pop("session_info")
+        module_key = kwargs.pop("module_key", None)
+        processing_config = kwargs.pop("processing_config", None)
+        rss_version = kwargs.pop("rss_version", None)
+
+        mode = kwargs.pop("mode", sensor_config.mode)
+
+        self.dtype = kwargs.pop("dtype", None)
+        self.chunk_size = kwargs.pop("chunk_size", 100)
+        self.flush_interval_s = kwargs.pop("flush_interval_s", 10.0)
+
+        if kwargs:
+            key = next(iter(kwargs.keys()))
+            msg = "StreamingRecorder got an unexpected keyword argument '{}'".format(key)
+            raise TypeError(msg)
+
+        if not isinstance(sensor_config, configbase.SensorConfig):
+            raise TypeError("Unexpected sensor config type")
+
+        if isinstance(processing_config, configbase.ProcessingConfig):
+            processing_config_dump = processing_config._dumps()
+        elif processing_config is None:
+            processing_config_dump = None
+        else:
+            raise TypeError("Unexpected processing config type")
+
+        filename = str(filename)
+
+        if not filename.lower().endswith(".h5"):
+            filename = filename + ".h5"
+
+        self.mode = mode
+        self.num_samples = 0
+        self.num_buffered = 0
+        self.last_flush_time = time.time()
+
+        self.file = h5py.File(filename, "w")
+
+        packed = {
+            "mode": mode.name.lower(),
+            "sensor_config_dump": sensor_config._dumps(),
+            "session_info": json.dumps(session_info),
+            "module_key": module_key,
+            "processing_config_dump": processing_config_dump,
+            "rss_version": rss_version,
+            "lib_version": acconeer.exptool.__version__,
+            "timestamp": datetime.datetime.now().isoformat(timespec="seconds"),
+        }
+
+        for k, v in packed.items():
+            if v is not None:
+                self.file.create_dataset(k, data=v, dtype=h5py.special_dtype(vlen=str))
+
+        self.data_info_group = self.file.create_group("data_info")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def sample(self, data_info: list, data: np.ndarray):
+        expected_num_dims = 3 if self.mode == modes.Mode.SPARSE else 2
+        if data.ndim != expected_num_dims:  # then assume data is squeezed
+            # unsqueeze (add back sensor dim)
+            data = data[None, ...]
+            data_info = [data_info]
+
+        if self.num_samples == 0 and self.num_buffered == 0:
+            self._create_datasets(data_info, data)
+
+        if self.data_buffer.dtype == np.dtype("u2") and not np.all(data == data.astype("u2")):
+            raise ValueError("Sample can not be stored as u2, pass dtype to the recorder")
+
+        for info in data_info:
+            self._check_data_info(info)
+
+        i = self.num_buffered
+        self.data_buffer[i] = data
+        self.sample_times_buffer[i] = time.time()
+
+        for k, buffer in self.data_info_buffers.items():
+            for j, info in enumerate(data_info):
+                buffer[i, j] = info[k]
+
+        self.num_buffered += 1
+
+        if self.num_buffered == self.chunk_size:
+            self.flush()
+        elif time.time() - self.last_flush_time > self.flush_interval_s:
+            self.flush()
+
+    def flush(self):
+        """Append the buffered samples to the file, and flush it to disk."""
+        n = self.num_buffered
+        if n > 0:
+            start = self.num_samples
+            end = start + n
+
+            # data goes last, as its length is what counts when loading a file that was
+            # not closed properly
+            datasets = [(self.data_info_group[k], b) for k, b in self.data_info_buffers.items()]
+            datasets.append((self.file["sample_times"], self.sample_times_buffer))
+            datasets.append((self.file["data"], self.data_buffer))
+
+            for dataset, buffer in datasets:
+                dataset.resize(end, axis=0)
+                dataset[start:end] = buffer[:n]
+
+            self.num_samples = end
+            self.num_buffered = 0
+
+        self.file.flush()
+        self.last_flush_time = time.time()
+
+    def close(self):
+        if not self.file:
+            return
+
+        if "data" not in self.file:
+            self.file.create_dataset("data", data=np.array([]))
+
+        self.flush()
+        self.file.close()
+
+    def _check_data_info(self, info):
+        if info.keys() != self.data_info_buffers.keys():
+            missing = set(self.data_info_buffers) - set(info)
+            unexpected = set(info) - set(self.data_info_buffers)
+            raise ValueError(
+                "data_info keys differ from the first sample, missing: {}, unexpected: {}".format(
+                    sorted(missing), sorted(unexpected)
+                )
+            )
+
+        for k, buffer in self.data_info_buffers.items():
+            value_dtype = np.asarray(info[k]).dtype
+            if not np.can_cast(value_dtype, buffer.dtype, casting="safe"):
+                raise ValueError(
+                    "data_info value {!r} of '{}' can not be stored as {}".format(
+                        info[k], k, buffer.dtype
+                    )
+                )
+
+    def _create_datasets(self, data_info, data):
+        dtype = self.dtype
+        if dtype is None:
+            dtype = data.dtype
+            if np.isrealobj(data) and np.all(data == data.astype("u2")):
+                dtype = np.dtype("u2")
+
+        def create(group, name, shape, dtype):
+            group.create_dataset(
+                name,
+                shape=(0,) + shape,
+                maxshape=(None,) + shape,
+                chunks=(self.chunk_size,) + shape,
+                dtype=dtype,
+                compression="gzip",
+            )
+            return np.empty((self.chunk_size,) + shape, dtype=dtype)
+
+        self.data_buffer = create(self.file, "data", data.shape, dtype)
+        self.sample_times_buffer = create(self.file, "sample_times", (), float)
+
+        keys = list(data_info[0].keys())
+        self.data_info_group.attrs["keys"] = json.dumps(keys)
+        self.data_info_buffers = {}
+        for k in keys:
+            value_dtype = DATA_INFO_DTYPES.get(k, np.asarray(data_info[0][k]).dtype)
+            self.data_info_buffers[k] = create(
+                self.data_info_group, k, (len(data_info),), value_dtype
+            )
+
+
 def save(filename: Union[str, Path], record: Record):
     filename = str(filename)
 
@@ -203,7 +411,7 @@ def load(filename: Union[str, Path]) -> Record:
 
 
 def unpack(packed: dict) -> Record:
-    kwargs = {}
+    kwargs = unpack_metadata(packed)
 
     data = packed["data"]
     if np.isrealobj(data):
@@ -211,6 +419,23 @@ def unpack(packed: dict) -> Record:
 
     kwargs["data"] = data
 
+    data_info = packed["data_info"]
+    if isinstance(data_info, str):
+        data_info = json.loads(data_info)
+
+    kwargs["data_info"] = data_info
+
+    kwargs["sample_times"] = packed.get("sample_times", None)
+
+    assert len(kwargs["data"]) == len(kwargs["data_info"])
+
+    return Record(**kwargs)
+
+
+def unpack_metadata(packed: dict) -> dict:
+    """Get the Record arguments other than data, data_info and sample_times."""
+    kwargs = {}
+
     for a in attr.fields(Record):
         k = a.name
         if a.type == str:
@@ -227,13 +452,8 @@ def unpack(packed: dict) -> Record:
     kwargs["mode"] = mode
 
     kwargs["session_info"] = json.loads(packed["session_info"])
-    kwargs["data_info"] = json.loads(packed["data_info"])
-
-    kwargs["sample_times"] = packed.get("sample_times", None)
 
-    assert len(kwargs["data"]) == len(kwargs["data_info"])
-
-    return Record(**kwargs)
+    return kwargs
 
 
 def load_npz(filename: Union[str, Path]) -> Record:
@@ -242,7 +462,7 @@ def load_npz(filename: Union[str, Path]) -> Record:
     packed = {}
     with np.load(filename, allow_pickle=False) as f:
         for k, v in f.items():
-            if v.dtype.type is np.unicode_:
+            if v.dtype.type is np.str_:
                 v = str(v)
 
             packed[k] = v
@@ -254,7 +474,14 @@ def load_h5(filename: Union[str, Path]) -> Record:
     filename = str(filename)
 
     with h5py.File(filename, "r") as f:
-        packed = {k: v[()] for k, v in f.items()}
+        packed = {k: v[()] for k, v in f.items() if isinstance(v, h5py.Dataset)}
+
+        # Columnar data_info, as written by StreamingRecorder
+        if isinstance(f.get("data_info"), h5py.Group):
+            data = packed["data"]
+            packed["data_info"] = load_data_info_columns(f["data_info"], 0, data.shape[:2])
+            if "sample_times" in packed:
+                packed["sample_times"] = packed["sample_times"][: len(data)]
 
     for k, v in packed.items():
         if isinstance(v, bytes):
@@ -263,6 +490,237 @@ def load_h5(filename: Union[str, Path]) -> Record:
     return unpack(packed)
 
 
+def load_data_info_columns(group: h5py.Group, start: int, shape: tuple) -> list:
+    """Get data_info as a list (samples) of lists (sensors) of dicts from its columns.
+
+    Only the samples from start, shape[0] of them, are read.
+    """
+    if len(shape) < 2:
+        return []
+
+    num_samples, num_sensors = shape
+    keys = json.loads(group.attrs.get("keys", "[]"))
+    columns = [group[k][start : start + num_samples].tolist() for k in keys]
+
+    if not columns:
+        return [[{} for _ in range(num_sensors)] for _ in range(num_samples)]
+
+    return [
+        [dict(zip(keys, sensor_values)) for sensor_values in zip(*sample_values)]
+        for sample_values in zip(*columns)
+    ]
+
+
+class LazyRecord:
+    """Read-only view of a recording file, which only reads the samples asked for.
+
+    Slicing (by sample index) or time_slice (by sample time) gives a Record of just those
+    samples, with data converted to dtype (float like load, or None to keep the stored
+    type) and data_info decoded. Iterating reads the file in chunks of chunk_size.
+
+    For .h5 files, the datasets are read from the open file. For .npz files, the data is
+    memory-mapped if it is stored uncompressed, otherwise it is read fully when first
+    needed. data_info stored as one JSON string is decoded fully when first needed, while
+    columnar data_info (see StreamingRecorder) is read per slice.
+    """
+
+    def __init__(self, filename: Union[str, Path], dtype="float", chunk_size=1000):
+        filename = str(filename)
+
+        self.dtype = dtype
+        self.chunk_size = chunk_size
+        self._sample_times = None
+        self._data_info = None
+        self._data_info_columns = None
+
+        if filename.lower().endswith(".h5"):
+            self._file = h5py.File(filename, "r")
+            keys = self._file.keys()
+            self._data = self._file["data"]
+            self._len = len(self._data)
+
+            if isinstance(self._file.get("data_info"), h5py.Group):
+                self._data_info_columns = self._file["data_info"]
+        elif filename.lower().endswith(".npz"):
+            self._file = np.load(filename, allow_pickle=False)
+            keys = self._file.files
+            self._data = mmap_npz_member(filename, "data")
+            if self._data is None:
+                # Compressed, only the header is read until the data is needed
+                self._len = read_npz_member_header(filename, "data")[0][0]
+            else:
+                self._len = len(self._data)
+        else:
+            raise ValueError("Unknown file format")
+
+        packed = {}
+        for k in keys:
+            if k in ("data", "data_info", "sample_times"):
+                continue
+
+            v = self._file[k]
+            if isinstance(v, h5py.Dataset):
+                v = v[()]
+
+            if isinstance(v, bytes):
+                v = v.decode()
+            elif isinstance(v, np.ndarray) and v.dtype.type is np.str_:
+                v = str(v)
+
+            packed[k] = v
+
+        for k, v in unpack_metadata(packed).items():
+            setattr(self, k, v)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return self._len
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step < 1:
+                raise ValueError("Slice step must be positive")
+
+            return self._get_record(start, max(stop, start), step)
+
+        index = range(len(self))[key]
+        record = self._get_record(index, index + 1)
+        return record.data_info[0], record.data[0]
+
+    def __iter__(self):
+        for start in range(0, len(self), self.chunk_size):
+            yield from self[start : start + self.chunk_size]
+
+    def close(self):
+        self._file.close()
+
+    @property
+    def sensor_config(self):
+        return configs.load(self.sensor_config_dump, self.mode)
+
+    @property
+    def sample_times(self):
+        if self._sample_times is None and "sample_times" in self._file:
+            self._sample_times = np.asarray(self._file["sample_times"])[: len(self)]
+
+        return self._sample_times
+
+    @property
+    def data_info(self):
+        return self._get_data_info(0, len(self), 1)
+
+    def time_slice(self, start_time=None, end_time=None) -> Record:
+        """Get the samples with start_time <= sample time < end_time as a Record."""
+        if self.sample_times is None:
+            raise ValueError("Recording has no sample times")
+
+        start = 0 if start_time is None else np.searchsorted(self.sample_times, start_time)
+        stop = len(self) if end_time is None else np.searchsorted(self.sample_times, end_time)
+        return self[int(start) : int(stop)]
+
+    def load(self) -> Record:
+        """Get all samples as a Record, like load would."""
+        return self[:]
+
+    def _get_record(self, start, stop, step=1):
+        if self._data is None:
+            self._data = self._file["data"]
+
+        data = self._data[start:stop:step]
+        if self.dtype is not None and np.isrealobj(data):
+            data = data.astype(self.dtype)
+
+        sample_times = self.sample_times
+        if sample_times is not None:
+            sample_times = sample_times[start:stop:step]
+
+        return Record(
+            mode=self.mode,
+            sensor_config_dump=self.sensor_config_dump,
+            session_info=self.session_info,
+            data=data,
+            data_info=self._get_data_info(start, stop, step),
+            module_key=self.module_key,
+            processing_config_dump=self.processing_config_dump,
+            rss_version=self.rss_version,
+            lib_version=self.lib_version,
+            timestamp=self.timestamp,
+            sample_times=sample_times,
+            note=self.note,
+            legacy_processing_config_dump=self.legacy_processing_config_dump,
+        )
+
+    def _get_data_info(self, start, stop, step):
+        if self._data_info_columns is not None:
+            shape = (stop - start,) + self._data.shape[1:2]
+            return load_data_info_columns(self._data_info_columns, start, shape)[::step]
+
+        if self._data_info is None:
+            source = self._file["data_info"]
+            if isinstance(source, h5py.Dataset):
+                source = source[()]
+
+            if isinstance(source, bytes):
+                source = source.decode()
+
+            self._data_info = json.loads(str(source))
+
+        return self._data_info[start:stop:step]
+
+
+def load_lazy(filename: Union[str, Path], dtype="float") -> LazyRecord:
+    return LazyRecord(filename, dtype=dtype)
+
+
+def mmap_npz_member(filename: Union[str, Path], name: str) -> Optional[np.ndarray]:
+    """Memory-map an array in an npz file, or get None if it is compressed."""
+    with zipfile.ZipFile(filename) as zf:
+        info = zf.getinfo(name + ".npy")
+
+    if info.compress_type != zipfile.ZIP_STORED:
+        return None
+
+    with open(filename, "rb") as f:
+        # Skip the local file header, which precedes the .npy file
+        f.seek(info.header_offset)
+        header = f.read(30)
+        name_length, extra_length = struct.unpack("<HH", header[26:30])
+        f.seek(info.header_offset + 30 + name_length + extra_length)
+
+        shape, fortran_order, dtype = read_npy_header(f)
+        offset = f.tell()
+
+    if dtype.hasobject:
+        return None
+
+    order = "F" if fortran_order else "C"
+    return np.memmap(filename, dtype=dtype, mode="r", offset=offset, shape=shape, order=order)
+
+
+def read_npz_member_header(filename: Union[str, Path], name: str) -> tuple:
+    """Get the shape, fortran_order and dtype of an array in an npz file, without reading it.
+
+    Only the start of the array is decompressed if it is compressed.
+    """
+    with zipfile.ZipFile(filename) as zf, zf.open(name + ".npy") as f:
+        return read_npy_header(f)
+
+
+def read_npy_header(f) -> tuple:
+    """Read the header of a .npy file from f, leaving it at the start of the array."""
+    version = np.lib.format.read_magic(f)
+    if version == (1, 0):
+        return np.lib.format.read_array_header_1_0(f)
+    else:
+        return np.lib.format.read_array_header_2_0(f)
+
+
 if __name__ == "__main__":
     import argparse
     import os
@@ -0,0 +1,9 @@
+import os
+import sys
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Neither the library nor the client is installed as a package
+for path in ["src", "client"]:
+    sys.path.insert(0, os.path.join(ROOT, path))
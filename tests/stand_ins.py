@@ -0,0 +1,253 @@
+"""Stand-ins for the module, answering register and buffer requests as it would.
+
+Used by the tests and the benchmarks of the register clients.
+"""
+
+from time import perf_counter, sleep
+
+import numpy as np
+
+from acconeer.exptool import SDK_VERSION
+from acconeer.exptool.clients import links
+from acconeer.exptool.clients.reg import protocol, regmap
+
+
+class DataReadyTiming:
+    """Emulates when the module sets DATA_READY.
+
+    With a period, frames are measured periodically from activation, and clear_status clears
+    DATA_READY until the next one. Otherwise, a frame is measured on each clear_status, and
+    is ready measure_time later. The delays from DATA_READY being set until a status read
+    sees it are kept in latencies.
+    """
+
+    def __init__(self, period=None, measure_time=2e-3):
+        self.period = period
+        self.measure_time = measure_time
+        self.latencies = []
+        self._t0 = None
+        self._ready_t = None
+        self._seen = False
+
+    @property
+    def active(self):
+        return self._t0 is not None
+
+    def activate(self, t):
+        self._t0 = t
+        self._ready_t = t + (self.period or self.measure_time)
+        self._seen = False
+
+    def clear_status(self, t):
+        if self._t0 is None:
+            return
+
+        if self.period is None:
+            self._ready_t = t + self.measure_time
+        else:
+            self._ready_t = self._t0 + ((t - self._t0) // self.period + 1) * self.period
+
+        self._seen = False
+
+    def is_ready(self, t):
+        if self._t0 is None or t < self._ready_t:
+            return False
+
+        if not self._seen:
+            self.latencies.append(t - self._ready_t)
+            self._seen = True
+
+        return True
+
+    def get_status(self, t):
+        flags = regmap.STATUS_FLAGS
+        status = flags.CREATED | flags.ACTIVATED
+
+        if self.is_ready(t):
+            status |= flags.DATA_READY
+
+        return status
+
+    def handle_main_control(self, enc_val, t):
+        cmd = regmap.get_reg("main_control").decode(enc_val).name.lower()
+
+        if cmd == "activate":
+            self.activate(t)
+        elif cmd == "clear_status":
+            self.clear_status(t)
+        elif cmd == "stop":
+            self._t0 = None
+
+
+class ModuleStandInLink(links.BaseLink):
+    """Stand-in for the serial link to the module.
+
+    The responses arrive after the transfer time of the bytes at the baudrate, a processing
+    time per request, and a fixed latency each time the host sends, as with the latency
+    timer of USB serial adapters.
+    """
+
+    BITS_PER_BYTE = 10  # with start and stop bits
+
+    def __init__(self, baudrate, latency, processing_time=50e-6, data_length=1000, timing=None):
+        super().__init__()
+        self.baudrate = baudrate
+        self.latency = latency
+        self.processing_time = processing_time
+        self.data_length = data_length
+        self.timing = timing  # DATA_READY always set if None
+
+        status = regmap.STATUS_FLAGS.CREATED | regmap.STATUS_FLAGS.DATA_READY
+        self._reg_vals = {regmap.STATUS_REG.addr: regmap.STATUS_REG.encode(status)}
+        self._rx = bytearray()
+        self._rx_times = []  # when each byte of _rx has arrived, in perf_counter time
+        self._busy_until = 0.0
+
+    def connect(self):
+        pass
+
+    def disconnect(self):
+        pass
+
+    def send(self, data):
+        t = max(perf_counter(), self._busy_until) + self.latency
+        byte_time = self.BITS_PER_BYTE / self.baudrate
+
+        for frame in self._split_frames(bytes(data)):
+            t += len(frame) * byte_time + self.processing_time
+            response = protocol.insert_packet_into_frame(self._handle(frame, t))
+            self._rx.extend(response)
+            self._rx_times.extend(t + byte_time * np.arange(1, len(response) + 1))
+            t += len(response) * byte_time
+
+        self._busy_until = t
+
+    def recv(self, num_bytes):
+        if len(self._rx) < num_bytes:
+            raise links.LinkError("recv timeout")
+
+        sleep(max(0.0, self._rx_times[num_bytes - 1] - perf_counter()))
+
+        data = self._rx[:num_bytes]
+        del self._rx[:num_bytes]
+        del self._rx_times[:num_bytes]
+        return data
+
+    def recv_until(self, bs):
+        return self.recv(self._rx.index(bs) + len(bs))
+
+    @staticmethod
+    def _split_frames(data):
+        while data:
+            packet_len = int.from_bytes(data[1 : 1 + protocol.LEN_FIELD_SIZE], protocol.BO)
+            frame_len = 1 + protocol.LEN_FIELD_SIZE + 1 + packet_len + 1
+            yield data[:frame_len]
+            data = data[frame_len:]
+
+    def _handle(self, frame, t):
+        packet_type = frame[1 + protocol.LEN_FIELD_SIZE]
+        segment = frame[2 + protocol.LEN_FIELD_SIZE : -1]
+        addr = segment[0]
+
+        if packet_type == protocol.REG_WRITE_REQUEST:
+            rv = protocol.unpack_reg_val(segment)
+            self._reg_vals[addr] = rv.val
+
+            if self.timing is not None and addr == regmap.get_reg_addr("main_control"):
+                self.timing.handle_main_control(rv.val, t)
+
+            return protocol.RegWriteResponse(rv)
+        elif packet_type == protocol.REG_READ_REQUEST:
+            if self.timing is not None and addr == regmap.STATUS_REG.addr:
+                enc_val = regmap.STATUS_REG.encode(self.timing.get_status(t))
+            else:
+                enc_val = self._reg_vals.get(addr, bytes(protocol.REG_SIZE))
+
+            return protocol.RegReadResponse(protocol.RegVal(addr, enc_val))
+        elif packet_type == protocol.BUF_READ_REQUEST:
+            return bytearray([protocol.BUF_READ_RESPONSE, addr]) + bytes(2 * self.data_length)
+        else:
+            raise protocol.ProtocolError("unknown packet type")
+
+
+class FakeFT4222Device:
+    """Stand-in for libft4222.Device, answering SPI transfers as the module would."""
+
+    def __init__(self, mode, data_length=1000, timing=None, transfer_time=0.0):
+        self._mode = mode
+        self._data_length = data_length
+        self._timing = timing  # DATA_READY always set when active if None
+        self.transfer_time = transfer_time  # per transfer, as the USB round trip
+        self.num_transfers = 0
+        self._reg_vals = {}
+        self._request = None
+        self._set_reg("data_length", data_length)
+        self._buffer = bytearray("v" + SDK_VERSION, "ascii")
+        self._set_reg("output_buffer_length", len(self._buffer))
+        self._set_reg("status", 0)
+
+    def __getattr__(self, name):
+        # Opening and configuring the device
+        return lambda *args, **kwargs: None
+
+    def spi_master_single_write(self, data, is_end_transaction=True):
+        self._transfer()
+
+        if self._request is not None and self._request[0] == protocol.REG_WRITE_REQUEST:
+            self._write_reg(self._request[1], bytes(data))
+            self._request = None
+        else:
+            self._request = (data[0], data[1])
+
+    def spi_master_single_read(self, num_bytes, is_end_transaction=True):
+        self._transfer()
+        return self._respond(num_bytes)
+
+    def spi_master_single_read_write(self, write_data, is_end_transaction=True):
+        self._transfer()
+        response = self._respond(len(write_data))
+        self._request = (write_data[0], write_data[1])
+        return response
+
+    def _transfer(self):
+        self.num_transfers += 1
+
+        if self.transfer_time:
+            sleep(self.transfer_time)
+
+    def _respond(self, num_bytes):
+        request_type, addr = self._request
+        self._request = None
+
+        if request_type == protocol.REG_READ_REQUEST:
+            if self._timing is not None and self._timing.active and addr == regmap.STATUS_REG.addr:
+                return regmap.STATUS_REG.encode(self._timing.get_status(perf_counter()))
+
+            return self._reg_vals.get(addr, bytes(protocol.REG_SIZE))
+        else:
+            return self._buffer[:num_bytes]
+
+    def _set_reg(self, name, val):
+        reg = regmap.get_reg(name, self._mode)
+        self._reg_vals[reg.addr] = reg.encode(val)
+
+    def _write_reg(self, addr, enc_val):
+        self._reg_vals[addr] = enc_val
+
+        if addr != regmap.get_reg_addr("main_control"):
+            return
+
+        cmd = regmap.get_reg("main_control").decode(enc_val).name.lower()
+        flags = regmap.STATUS_FLAGS
+
+        if self._timing is not None:
+            self._timing.handle_main_control(enc_val, perf_counter())
+
+        if cmd == "stop":
+            self._set_reg("status", 0)
+        elif cmd == "create":
+            self._set_reg("status", flags.CREATED)
+            self._set_reg("output_buffer_length", 2 * self._data_length)
+            self._buffer = bytearray(2 * self._data_length)
+        elif cmd == "activate":
+            self._set_reg("status", flags.CREATED | flags.ACTIVATED | flags.DATA_READY)
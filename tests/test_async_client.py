@@ -0,0 +1,177 @@
+import asyncio
+
+import numpy as np
+import pytest
+
+import acconeer.exptool as et
+from acconeer.exptool.clients.base import ClientError
+from acconeer.exptool.clients.json.async_client import AsyncSocketClient
+from acconeer.exptool.clients.mock.server import MockStreamingServer
+
+
+NUM_FRAMES = 10
+
+
+@pytest.fixture
+def server():
+    server = MockStreamingServer("127.0.0.1", 0, frame_pool_size=10)
+    server.start_thread()
+    yield server
+    server.stop_thread()
+
+
+def get_client(port, **kwargs):
+    client = AsyncSocketClient("127.0.0.1", **kwargs)
+    client.PORT = port
+    return client
+
+
+def get_config(mode="envelope", sensors=[1]):
+    config = et.configs.MODE_TO_CONFIG_CLASS_MAP[et.modes.get_mode(mode)]()
+    config.sensor = sensors
+    config.update_rate = 200
+    return config
+
+
+@pytest.mark.parametrize(
+    "mode, sensors",
+    [("envelope", [1]), ("envelope", [1, 2]), ("iq", [1]), ("sparse", [1]), ("power_bins", [1])],
+)
+def test_stream(server, mode, sensors):
+    config = get_config(mode, sensors)
+
+    async def stream():
+        client = get_client(server.port)
+        info = await client.connect()
+        assert info["board_sensor_count"] == server.num_board_sensors
+
+        session_info = await client.setup_session(config)
+        await client.start_session()
+
+        frames = [await client.get_next() for _ in range(NUM_FRAMES)]
+
+        await client.stop_session()
+        await client.disconnect()
+        return session_info, frames
+
+    session_info, frames = asyncio.run(stream())
+
+    data_length = session_info["data_length"]
+    sensor_shape = () if len(sensors) == 1 else (len(sensors),)
+    if mode == "sparse":
+        # For sparse, data_length counts the points of all sweeps in the frame
+        spf = config.sweeps_per_frame
+        expected_shape = sensor_shape + (spf, data_length // spf)
+    else:
+        expected_shape = sensor_shape + (data_length,)
+
+    sequence_numbers = []
+    for info, data in frames:
+        assert data.shape == expected_shape
+        assert data.dtype == (np.complex128 if mode == "iq" else np.float64)
+
+        infos = [info] if len(sensors) == 1 else info
+        assert len(infos) == len(sensors)
+        sequence_numbers.append(infos[0]["sequence_number"])
+
+    assert sequence_numbers == list(range(1, NUM_FRAMES + 1))
+
+
+def test_async_iteration(server):
+    async def stream():
+        frames = []
+
+        async with get_client(server.port) as client:
+            await client.start_session(get_config())
+
+            async for info, data in client:
+                frames.append((info, data))
+
+                if len(frames) == NUM_FRAMES:
+                    await client.stop_session()
+
+            assert client._connected
+
+        assert not client._connected
+        return frames
+
+    frames = asyncio.run(stream())
+
+    assert [info["sequence_number"] for info, _ in frames] == list(range(1, NUM_FRAMES + 1))
+
+
+def test_concurrent_clients(server):
+    async def stream(sensor):
+        async with get_client(server.port) as client:
+            await client.start_session(get_config(sensors=[sensor]))
+            infos = [(await client.get_next())[0] for _ in range(NUM_FRAMES)]
+            await client.stop_session()
+
+        return infos
+
+    async def main():
+        return await asyncio.gather(stream(1), stream(2))
+
+    for infos in asyncio.run(main()):
+        assert [info["sequence_number"] for info in infos] == list(range(1, NUM_FRAMES + 1))
+
+
+@pytest.mark.parametrize("unknown_mode", [False, True])
+def test_get_next_out(server, unknown_mode):
+    async def stream():
+        async with get_client(server.port, dtype=None) as client:
+            session_info = await client.start_session(get_config())
+
+            if unknown_mode:
+                # The data is not decoded, as for modes the client does not know about
+                client._mode = None
+                client._payload_size = None
+
+            out = np.zeros(session_info["data_length"], dtype=np.float32)
+            info, data = await client.get_next(out=out)
+            await client.stop_session()
+
+        return out, data
+
+    out, data = asyncio.run(stream())
+
+    assert data is out
+    assert np.any(out != 0)
+
+
+def test_get_next_when_not_streaming(server):
+    async def get_next():
+        async with get_client(server.port) as client:
+            await client.get_next()
+
+    with pytest.raises(ClientError):
+        asyncio.run(get_next())
+
+
+def test_failed_handshake_closes_connection():
+    closed = []
+
+    async def handle_connection(reader, writer):
+        await reader.readline()
+        writer.write(b'{"status":"error","payload_size":0}\n')
+        await writer.drain()
+        closed.append(await reader.read() == b"")
+        writer.close()
+
+    async def connect():
+        server = await asyncio.start_server(handle_connection, "127.0.0.1", 0)
+        client = get_client(server.sockets[0].getsockname()[1])
+
+        async with server:
+            with pytest.raises(ClientError):
+                await client.connect()
+
+            await asyncio.sleep(0.1)
+
+        return client
+
+    client = asyncio.run(connect())
+
+    assert closed == [True]
+    assert client._writer is None
+    assert not client._connected
@@ -0,0 +1,77 @@
+import threading
+from time import sleep
+
+import pytest
+
+from acconeer.exptool.clients.links import LinkError, SerialProcessLink, SharedRingBuffer
+
+
+@pytest.fixture
+def ring():
+    ring = SharedRingBuffer(capacity=64)
+    yield ring
+    ring.close()
+    ring.unlink()
+
+
+def get_link(ring, timeout=1.0):
+    # Read straight from the ring, written to by the test rather than a serial process
+    link = SerialProcessLink()
+    link._ring = ring
+    link.timeout = timeout
+    return link
+
+
+def test_find(ring):
+    ring.write(b"abc|def|")
+
+    assert ring.find(b"|") == (3, 8)
+    assert ring.find(b"|", 4) == (7, 8)
+    assert ring.find(b"def|") == (4, 8)
+    assert ring.find(b"x") == (-1, 8)
+    assert ring.find(b"|", 8) == (-1, 8)
+
+
+def test_find_wrapped(ring):
+    # Move the read position close to the end of the ring, so that the data wraps around
+    ring.write(bytes(60))
+    ring.discard()
+    ring.write(b"abc|def|")
+
+    assert ring.find(b"c|d") == (2, 8)
+    assert ring.find(b"|", 4) == (7, 8)
+
+
+def test_recv_until(ring):
+    link = get_link(ring)
+    ring.write(b"abc|def|gh")
+
+    assert link.recv_until(b"|") == b"abc|"
+    assert link.recv_until(b"|") == b"def|"
+    assert link.recv(2) == b"gh"
+
+
+@pytest.mark.parametrize("delimiter", [b"|", b"<end>"])
+def test_recv_until_split_writes(ring, delimiter):
+    link = get_link(ring)
+    data = b"0123456789" * 3 + delimiter
+    parts = [data[i : i + 3] for i in range(0, len(data), 3)]
+
+    def write():
+        for part in parts:
+            sleep(0.005)
+            ring.write(part)
+
+    writer = threading.Thread(target=write)
+    writer.start()
+
+    assert link.recv_until(delimiter) == data
+    writer.join()
+
+
+def test_recv_until_timeout(ring):
+    link = get_link(ring, timeout=0.05)
+    ring.write(b"abc")
+
+    with pytest.raises(LinkError):
+        link.recv_until(b"|")
@@ -0,0 +1,77 @@
+from copy import deepcopy
+
+import numpy as np
+import pytest
+
+import acconeer.exptool as et
+from acconeer.exptool.clients.mock.client import MockClient
+from acconeer.exptool.clients.multiwrap import MultiClientWrapper
+
+
+class SequencedMockClient(MockClient):
+    """MockClient giving the sequence numbers in the list, with the data filled with them."""
+
+    def __init__(self, sequence_numbers, **kwargs):
+        super().__init__(**kwargs)
+        self.sequence_numbers = sequence_numbers
+
+    def _setup_session(self, config):
+        # MockClient keeps the config, of which the wrapper sets the sensors back afterwards
+        return super()._setup_session(deepcopy(config))
+
+    def _wait_for_frame(self, data_count):
+        pass
+
+    def _mock_frame(self, data_count):
+        info, data = super()._mock_frame(data_count)
+        sequence_number = self.sequence_numbers[data_count - 1]
+
+        for sensor_info in info:
+            sensor_info["sequence_number"] = sequence_number
+
+        return info, np.full_like(data, sequence_number)
+
+
+def get_frames(sequence_numbers, num_frames, **kwargs):
+    config = et.configs.EnvelopeServiceConfig()
+    config.range_interval = [0.2, 0.3]
+    config.sensor = [i + 1 for i in range(len(sequence_numbers))]
+
+    clients = [SequencedMockClient(seqs) for seqs in sequence_numbers]
+    client = MultiClientWrapper(clients, **kwargs)
+    client.start_session(config)
+    frames = [client.get_next() for _ in range(num_frames)]
+    client.disconnect()
+
+    infos = [[info["sequence_number"] for info in infos] for infos, _ in frames]
+    for seqs, (_, data) in zip(infos, frames):
+        assert np.all(data == np.array(seqs)[:, None])
+
+    return infos, client.frames_dropped
+
+
+def test_lock_step_by_default():
+    infos, frames_dropped = get_frames([[1, 2, 3], [3, 4, 5]], 2)
+
+    assert infos == [[1, 3], [2, 4]]
+    assert frames_dropped == 0
+
+
+def test_align_sequence():
+    infos, frames_dropped = get_frames(
+        [[1, 2, 3, 4, 5, 6], [3, 4, 6, 7], [1, 2, 3, 4, 5, 6]], 2, align_sequence=True
+    )
+
+    assert infos == [[3, 3, 3], [4, 4, 4]]
+    assert frames_dropped == 4
+
+
+@pytest.mark.parametrize("kwargs", [{"align_sequence": True}, {"max_skew_s": -1.0}])
+def test_align_gives_up_without_raising(kwargs):
+    # The second client stays behind, however many times it is read. With a negative
+    # max_skew_s, all clients are always behind.
+    num_reads = MultiClientWrapper.MAX_ALIGN_ATTEMPTS + 1
+    infos, frames_dropped = get_frames([[5] * num_reads, [1] * num_reads], 1, **kwargs)
+
+    assert infos == [[5, 1]]
+    assert frames_dropped > 0
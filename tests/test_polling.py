@@ -0,0 +1,123 @@
+import numpy as np
+import pytest
+
+from acconeer.exptool import configs
+from acconeer.exptool.clients.reg import polling, regmap
+from acconeer.exptool.clients.reg.client import PollingUARTClient
+from acconeer.exptool.clients.reg.polling import DataReadyPoller
+from tests import stand_ins
+from tests.stand_ins import DataReadyTiming, ModuleStandInLink
+
+
+NUM_FRAMES = 30
+READ_TIME = 0.1e-3  # of a status read
+
+
+class FakeClock:
+    """Clock which only moves when slept on, so that the tests do not depend on the load."""
+
+    def __init__(self):
+        self.t = 0.0
+
+    def monotonic(self):
+        return self.t
+
+    def sleep(self, secs):
+        assert secs >= 0
+        self.t += secs
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    # Both the poller and the stand-in for the module run on the fake clock
+    clock = FakeClock()
+    monkeypatch.setattr(polling, "monotonic", clock.monotonic)
+    monkeypatch.setattr(polling, "sleep", clock.sleep)
+    monkeypatch.setattr(stand_ins, "perf_counter", clock.monotonic)
+    monkeypatch.setattr(stand_ins, "sleep", clock.sleep)
+    return clock
+
+
+def poll(clock, poller, timing, num_frames=NUM_FRAMES):
+    """Poll frames as the clients do, with the status of the module given by timing."""
+    timing.activate(clock.monotonic())
+
+    for _ in range(num_frames):
+        poller.start()
+
+        while True:
+            poller.wait()
+            clock.sleep(READ_TIME)
+            t = clock.monotonic()
+
+            if timing.get_status(t) & regmap.STATUS_FLAGS.DATA_READY:
+                poller.ready()
+                timing.clear_status(t)
+                break
+
+
+@pytest.mark.parametrize("update_rate", [None, 100])
+def test_periodic(clock, update_rate):
+    timing = DataReadyTiming(period=0.01)
+    poller = DataReadyPoller(update_rate)
+    poll(clock, poller, timing)
+
+    assert poller.frames == NUM_FRAMES
+    # Back to back, it would take some 50 reads per frame
+    assert poller.status_reads_per_frame < 6
+    # Each frame is seen within one read interval of getting ready
+    assert max(timing.latencies) <= poller.MAX_INTERVAL + READ_TIME
+
+
+def test_on_call(clock):
+    timing = DataReadyTiming(measure_time=5e-3)
+    poller = DataReadyPoller(periodic=False)
+    poll(clock, poller, timing)
+
+    assert poller.frames == NUM_FRAMES
+    assert poller.status_reads_per_frame < 6
+    # Each frame is seen within one read interval of getting ready
+    assert max(timing.latencies) <= poller.MAX_INTERVAL + READ_TIME
+
+
+def test_backs_off_without_history(clock):
+    timing = DataReadyTiming(period=0.02)
+    poller = DataReadyPoller()
+    poll(clock, poller, timing, num_frames=1)
+
+    # The intervals double from MIN_INTERVAL up to MAX_INTERVAL, rather than reading back
+    # to back
+    assert poller.status_reads < 20
+    assert timing.latencies[0] <= poller.MAX_INTERVAL + READ_TIME
+
+
+def test_reset(clock):
+    poller = DataReadyPoller(100)
+    poll(clock, poller, DataReadyTiming(period=0.01), num_frames=3)
+    poller.reset()
+
+    assert poller.status_reads == poller.frames == 0
+    assert poller.status_reads_per_frame is None
+
+
+@pytest.mark.parametrize("measure_on_call", [False, True])
+def test_polling_uart_client(clock, measure_on_call):
+    if measure_on_call:
+        timing = DataReadyTiming(measure_time=5e-3)
+    else:
+        timing = DataReadyTiming(period=0.01)
+
+    client = PollingUARTClient(None, measure_on_call=measure_on_call)
+    client._link = ModuleStandInLink(3000000, 0.0, timing=timing)
+    client._connected = True
+    client.supported_modes = client._get_supported_modes()
+
+    config = configs.EnvelopeServiceConfig()
+    config.update_rate = None if measure_on_call else 1 / timing.period
+    client.start_session(config)
+
+    for _ in range(NUM_FRAMES):
+        client.get_next()
+
+    assert client.status_reads_per_frame < 6
+    assert np.median(timing.latencies) < 2 * DataReadyPoller.MAX_INTERVAL
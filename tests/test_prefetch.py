@@ -0,0 +1,163 @@
+import threading
+from time import monotonic, sleep
+
+import numpy as np
+import pytest
+
+import acconeer.exptool as et
+from acconeer.exptool.clients.base import ClientError
+from acconeer.exptool.clients.mock.client import MockClient
+from acconeer.exptool.clients.prefetch import BLOCK, DROP_NEWEST, DROP_OLDEST, PrefetchClient
+
+
+class GatedMockClient(MockClient):
+    """MockClient which gives a frame each time its gate is released.
+
+    The frames are numbered from 1 by sequence_number, and the data is filled with it.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.gate = threading.Semaphore(0)
+
+    def _wait_for_frame(self, data_count):
+        self.gate.acquire()
+
+    def _mock_frame(self, data_count):
+        info, data = super()._mock_frame(data_count)
+        info["sequence_number"] = data_count
+        return info, np.full_like(data, data_count)
+
+
+@pytest.fixture
+def streaming():
+    clients = []
+
+    def start(**kwargs):
+        config = et.configs.EnvelopeServiceConfig()
+        config.range_interval = [0.2, 0.3]
+
+        client = PrefetchClient(GatedMockClient(), **kwargs)
+        client.start_session(config)
+        clients.append(client)
+        return client
+
+    yield start
+
+    for client in clients:
+        # Let the prefetch thread through, wherever it waits
+        client.client.gate.release(client.queue_size + 2)
+        client.disconnect()
+
+
+def wait_until(predicate, timeout=2.0):
+    t0 = monotonic()
+    while not predicate():
+        assert monotonic() - t0 < timeout, "timeout"
+        sleep(1e-3)
+
+
+def receive(client, num_frames):
+    num_received = client.frames_received + num_frames
+    client.client.gate.release(num_frames)
+    wait_until(lambda: client.frames_received == num_received)
+
+
+def get_sequence_numbers(client, num_frames):
+    sequence_numbers = []
+    for _ in range(num_frames):
+        info, data = client.get_next()
+        assert np.all(data == info["sequence_number"])
+        sequence_numbers.append(info["sequence_number"])
+
+    return sequence_numbers
+
+
+def test_drop_oldest(streaming):
+    client = streaming(queue_size=4, policy=DROP_OLDEST)
+    receive(client, 6)
+
+    assert client.frames_dropped == 2
+    assert client.queue_depth == client.max_queue_depth == 4
+    assert get_sequence_numbers(client, 4) == [3, 4, 5, 6]
+    assert client.queue_depth == 0
+
+
+def test_drop_newest(streaming):
+    client = streaming(queue_size=4, policy=DROP_NEWEST)
+    receive(client, 6)
+
+    assert client.frames_dropped == 2
+    assert client.queue_depth == client.max_queue_depth == 4
+    assert get_sequence_numbers(client, 4) == [1, 2, 3, 4]
+
+
+def test_block(streaming):
+    client = streaming(queue_size=4, policy=BLOCK)
+    client.client.gate.release(6)
+    wait_until(lambda: client.frames_received == 4)
+
+    # No frames are read from the wrapped client while the buffer is full
+    sleep(0.05)
+    assert client.frames_received == 4
+    assert client.queue_depth == 4
+
+    assert get_sequence_numbers(client, 1) == [1]
+    wait_until(lambda: client.frames_received == 5)
+    assert get_sequence_numbers(client, 5) == [2, 3, 4, 5, 6]
+
+    assert client.frames_dropped == 0
+    assert client.max_queue_depth == 4
+
+
+def test_get_latest(streaming):
+    client = streaming(queue_size=16)
+    receive(client, 5)
+
+    info, data = client.get_latest()
+
+    assert info["sequence_number"] == 5
+    assert np.all(data == 5)
+    assert client.frames_skipped == 4
+    assert client.queue_depth == 0
+    assert client.max_queue_depth == 5
+
+    receive(client, 2)
+    assert get_sequence_numbers(client, 2) == [6, 7]
+    assert client.frames_skipped == 4
+
+
+def test_get_next_out(streaming):
+    client = streaming(queue_size=4)
+    receive(client, 2)
+
+    _, data = client.get_next()
+    out = np.empty_like(data)
+    info, data = client.get_next(out=out)
+
+    assert data is out
+    assert np.all(out == info["sequence_number"])
+
+
+def test_get_next_timeout(streaming):
+    client = streaming(queue_size=4, timeout=0.05)
+
+    with pytest.raises(ClientError):
+        client.get_next()
+
+
+@pytest.mark.parametrize(
+    "kwargs",
+    [
+        {"policy": "drop_all"},
+        {"queue_size": 0},
+    ],
+)
+def test_bad_arguments(kwargs):
+    with pytest.raises(ValueError):
+        PrefetchClient(MockClient(), **kwargs)
+
+
+def test_wrapped_client_reusing_output():
+    with pytest.raises(ValueError):
+        PrefetchClient(MockClient(reuse_output=True))
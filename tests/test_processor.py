@@ -0,0 +1,507 @@
+import importlib
+from copy import copy
+
+import numpy as np
+import pytest
+
+
+NUM_CASES = 2000
+
+
+@pytest.fixture(params=["processor", "processing"])
+def processor_module(request):
+    return importlib.import_module(request.param)
+
+
+def get_processor(module, data_length=100, **processing_params):
+    et = module.et
+    sensor_config = et.configs.EnvelopeServiceConfig()
+    sensor_config.update_rate = 10
+    session_info = {
+        "range_start_m": 0.2,
+        "range_length_m": data_length * 0.484e-3,
+        "data_length": data_length,
+    }
+
+    processing_config = module.ProcessingConfiguration()
+    for k, v in processing_params.items():
+        setattr(processing_config, k, v)
+
+    return module.Processor(sensor_config, processing_config, session_info)
+
+
+def find_peaks_legacy(sweep, threshold):
+    """Processor.find_peaks as it was written before, looping over the sweep."""
+    if threshold is None or np.all(np.isnan(threshold)):
+        return []
+
+    found_peaks = []
+
+    d = 1
+    N = len(sweep)
+    while d < (N - 1):
+        if np.isnan(threshold[d - 1]):
+            d += 1
+            continue
+
+        if np.isnan(threshold[d + 1]):
+            break
+
+        if sweep[d] <= threshold[d]:
+            d += 2
+            continue
+
+        if sweep[d - 1] <= threshold[d - 1]:
+            d += 1
+            continue
+
+        if sweep[d - 1] >= sweep[d]:
+            d += 1
+            continue
+
+        d_upper = d + 1
+        while True:
+            if (d_upper) >= (N - 1):
+                break
+
+            if np.isnan(threshold[d_upper]):
+                break
+
+            if sweep[d_upper] <= threshold[d_upper]:
+                break
+
+            if sweep[d_upper] > sweep[d]:
+                break
+            elif sweep[d_upper] < sweep[d]:
+                delta = d_upper - d
+                found_peaks.append(d + int(np.ceil((delta - 1) / 2.0)))
+                break
+            else:
+                d_upper += 1
+
+        d = d_upper
+
+    return found_peaks
+
+
+def merge_peaks_legacy(peak_indexes, merge_max_range):
+    """Processor.merge_peaks as it was written before, recounting all neighbors each round."""
+    merged_peaks = copy(peak_indexes)
+
+    while True:
+        num_neighbors = np.zeros(len(merged_peaks))
+        for i, p in enumerate(merged_peaks):
+            num_neighbors[i] = np.sum(np.abs(np.array(merged_peaks) - p) < merge_max_range)
+
+        i_peak = np.argmax(num_neighbors)
+
+        if num_neighbors[i_peak] <= 1:
+            break
+
+        peak = merged_peaks[i_peak]
+
+        remove_mask = np.abs(np.array(merged_peaks) - peak) < merge_max_range
+        peaks_to_remove = np.array(merged_peaks)[remove_mask]
+
+        for p in peaks_to_remove:
+            merged_peaks.remove(p)
+
+        merged_peaks.append(int(round(np.mean(peaks_to_remove))))
+
+        merged_peaks.sort()
+
+    return merged_peaks
+
+
+def calculate_cfar_threshold_legacy(sweep, idx_cfar_pts, alpha, one_side):
+    """Processor.calculate_cfar_threshold as it was written before, looping over the sweep."""
+    threshold = np.full(sweep.shape, np.nan)
+
+    start_idx = np.max(idx_cfar_pts)
+    if one_side:
+        rel_indexes = -idx_cfar_pts
+        end_idx = sweep.size
+    else:
+        rel_indexes = np.concatenate((-idx_cfar_pts, +idx_cfar_pts), axis=0)
+        end_idx = sweep.size - start_idx
+
+    for idx in np.arange(start_idx, end_idx):
+        threshold[int(idx)] = (
+            1.0 / (alpha + 1e-10) * np.mean(sweep[(idx + rel_indexes).astype(int)])
+        )
+
+    return threshold
+
+
+def get_random_case(rng):
+    """Get a random sweep and threshold, with plateaus and sometimes NaN edges as for CFAR.
+
+    The values are small integers, so that plateaus and points equal to the threshold are
+    common.
+    """
+    N = int(rng.integers(1, 40))
+    sweep = rng.integers(0, 6, N).astype(float)
+
+    if rng.random() < 0.5:
+        threshold = np.full(N, float(rng.integers(0, 5)))
+    else:
+        threshold = rng.integers(0, 5, N).astype(float)
+
+    if rng.random() < 0.5:
+        start = int(rng.integers(0, N + 1))
+        end = int(rng.integers(start, N + 1))
+        threshold[:start] = np.nan
+        threshold[end:] = np.nan
+
+    return sweep, threshold
+
+
+def test_find_peaks_matches_legacy(processor_module):
+    processor = get_processor(processor_module)
+    rng = np.random.default_rng(0)
+
+    for i in range(NUM_CASES):
+        sweep, threshold = get_random_case(rng)
+        expected = find_peaks_legacy(sweep, threshold)
+        assert processor.find_peaks(sweep, threshold) == expected, (i, sweep, threshold)
+
+
+def test_find_peaks_batch_matches_legacy(processor_module):
+    processor = get_processor(processor_module)
+    rng = np.random.default_rng(1)
+
+    for i in range(NUM_CASES // 10):
+        N = int(rng.integers(3, 40))
+        cases = [get_random_case(rng) for _ in range(int(rng.integers(1, 10)))]
+        sweeps = np.array([np.resize(sweep, N) for sweep, _ in cases])
+        thresholds = np.array([np.resize(threshold, N) for _, threshold in cases])
+
+        expected = [find_peaks_legacy(s, t) for s, t in zip(sweeps, thresholds)]
+        assert processor.find_peaks_batch(sweeps, thresholds) == expected, i
+
+
+@pytest.mark.parametrize(
+    "sweep, expected",
+    [
+        ([0, 5, 6, 5, 0], [2]),  # three points above threshold
+        ([0, 5, 6, 0, 0], []),  # only two, the peak is not closed
+        ([0, 0, 6, 5, 0], []),  # only two, the peak is not opened
+        ([0, 5, 7, 7, 7, 7, 5, 0], [4]),  # middle of a plateau, rounding up
+        ([0, 5, 7, 7, 7, 5, 0], [3]),
+        ([0, 5, 7, 7, 7, 7, 0], []),  # plateau not closed above threshold
+    ],
+)
+def test_find_peaks_rules(processor_module, sweep, expected):
+    processor = get_processor(processor_module)
+    sweep = np.array(sweep, dtype=float)
+    threshold = np.full(len(sweep), 4.0)
+
+    assert processor.find_peaks(sweep, threshold) == expected
+    assert find_peaks_legacy(sweep, threshold) == expected
+
+
+def test_find_peaks_nan_edges(processor_module):
+    processor = get_processor(processor_module)
+    sweep = np.array([0, 5, 6, 5, 0, 5, 6, 5, 0, 5, 6, 5, 0], dtype=float)
+    threshold = np.full(len(sweep), 4.0)
+    threshold[:5] = np.nan
+    threshold[-3:] = np.nan
+
+    # The threshold must be defined on both sides of a peak
+    assert processor.find_peaks(sweep, threshold) == [6]
+    assert processor.find_peaks(sweep, np.full(len(sweep), np.nan)) == []
+
+
+def test_merge_peaks_matches_legacy(processor_module):
+    processor = get_processor(processor_module)
+    rng = np.random.default_rng(2)
+
+    for i in range(NUM_CASES):
+        num_peaks = int(rng.integers(2, 30))  # only called with more than one peak
+        peaks = sorted(rng.choice(100, num_peaks, replace=False).tolist())
+        merge_max_range = float(rng.integers(1, 10))
+
+        expected = merge_peaks_legacy(peaks, merge_max_range)
+        assert processor.merge_peaks(peaks, merge_max_range) == expected, (i, peaks)
+
+
+@pytest.mark.parametrize("cfar_one_sided", [False, True])
+@pytest.mark.parametrize("cfar_window_cm, cfar_guard_cm", [(3, 12), (10, 4), (0.1, 1)])
+def test_cfar_threshold_matches_legacy(
+    processor_module, cfar_one_sided, cfar_window_cm, cfar_guard_cm
+):
+    threshold_type = processor_module.ProcessingConfiguration.ThresholdType.CFAR
+    processor = get_processor(
+        processor_module,
+        1000,
+        threshold_type=threshold_type,
+        cfar_one_sided=cfar_one_sided,
+        cfar_window_cm=cfar_window_cm,
+        cfar_guard_cm=cfar_guard_cm,
+    )
+    rng = np.random.default_rng(4)
+
+    for _ in range(10):
+        sweep = rng.normal(1000, 100, 1000)
+        cfar_args = (sweep, processor.idx_cfar_pts, processor.cfar_sensitivity, cfar_one_sided)
+        expected = calculate_cfar_threshold_legacy(*cfar_args)
+
+        # Bit-identical, not only close, since the means are taken in the same order
+        np.testing.assert_array_equal(processor.calculate_cfar_threshold(*cfar_args), expected)
+        np.testing.assert_array_equal(processor.calculate_threshold(sweep), expected)
+
+
+def test_process_threshold_is_cached(processor_module):
+    ThresholdType = processor_module.ProcessingConfiguration.ThresholdType
+    rng = np.random.default_rng(3)
+
+    processor = get_processor(processor_module, 1000, threshold_type=ThresholdType.FIXED)
+    threshold = processor.process(rng.normal(1000, 100, 1000), {})["threshold"]
+    assert not threshold.flags.writeable
+    assert processor.process(rng.normal(1000, 100, 1000), {})["threshold"] is threshold
+
+    # The CFAR threshold is a view of the cached buffer, valid until the next call
+    processor = get_processor(processor_module, 1000, threshold_type=ThresholdType.CFAR)
+    sweep = rng.normal(1000, 100, 1000)
+    threshold = processor.process(sweep, {})["threshold"]
+    assert not threshold.flags.writeable
+    cfar_args = (sweep, processor.idx_cfar_pts, processor.cfar_sensitivity, False)
+    np.testing.assert_array_equal(threshold, calculate_cfar_threshold_legacy(*cfar_args))
+
+    out_data = processor.process(rng.normal(1000, 100, 1000), {})
+    assert np.shares_memory(out_data["threshold"], threshold)
+    np.testing.assert_array_equal(threshold, out_data["threshold"])
+
+
+@pytest.mark.parametrize(
+    "param, value",
+    [
+        ("threshold_type", "CFAR"),
+        ("fixed_threshold", 1000),
+        ("cfar_guard_cm", 5),
+        ("cfar_window_cm", 5),
+        ("cfar_one_sided", True),
+        ("data_length", 500),
+    ],
+)
+def test_threshold_cache_rebuilt_on_change(processor_module, param, value):
+    ThresholdType = processor_module.ProcessingConfiguration.ThresholdType
+    threshold_type = ThresholdType.CFAR if param.startswith("cfar") else ThresholdType.FIXED
+    processor = get_processor(processor_module, 1000, threshold_type=threshold_type)
+    processing_config = processor_module.ProcessingConfiguration()
+    processing_config.threshold_type = threshold_type
+
+    def get_cached_arrays():
+        if processor.threshold_type is ThresholdType.FIXED:
+            return [processor.fixed_threshold]
+        return [processor.cfar_threshold, processor.cfar_windows, processor.cfar_window_idxs]
+
+    # Parameters that the cache does not depend on leave it as it is
+    cached_arrays = get_cached_arrays()
+    processing_config.cfar_sensitivity = 0.1
+    processing_config.nbr_average = 2
+    processor.update_processing_config(processing_config)
+    assert all(a is b for a, b in zip(get_cached_arrays(), cached_arrays))
+
+    if param == "data_length":
+        processor.num_depths = value
+        processor.update_threshold_cache()
+    else:
+        if param == "threshold_type":
+            value = ThresholdType[value]
+        setattr(processing_config, param, value)
+        processor.update_processing_config(processing_config)
+
+    assert not any(a is b for a, b in zip(get_cached_arrays(), cached_arrays))
+
+    sweep = np.random.default_rng(7).normal(1000, 100, processor.num_depths)
+    threshold = processor.calculate_threshold(sweep)
+    assert threshold.shape == sweep.shape
+    if processor.threshold_type is ThresholdType.FIXED:
+        np.testing.assert_array_equal(threshold, processing_config.fixed_threshold)
+    else:
+        cfar_args = (sweep, processor.idx_cfar_pts, processor.cfar_sensitivity)
+        expected = calculate_cfar_threshold_legacy(*cfar_args, processor.cfar_one_sided)
+        np.testing.assert_array_equal(threshold, expected)
+
+
+class ListPeakHistory:
+    """The peak history of Processor.process as it was kept before, in lists."""
+
+    def __init__(self):
+        self.sweep_idx = []
+        self.dist = []
+
+    def append(self, sweep_idx, dist):
+        self.sweep_idx.append(sweep_idx)
+        self.dist.append(dist)
+
+    def remove_old(self, sweep_index, max_age):
+        while len(self.sweep_idx) > 0 and sweep_index - self.sweep_idx[0] > max_age:
+            self.sweep_idx.pop(0)
+            self.dist.pop(0)
+
+
+def test_peak_history_wraps_around():
+    hist = importlib.import_module("processor").PeakHistory(4)
+    expected = ListPeakHistory()
+
+    for sweep_idx in range(50):
+        hist.append(sweep_idx, 0.5 * sweep_idx)
+        expected.append(sweep_idx, 0.5 * sweep_idx)
+        hist.remove_older_than(sweep_idx - 2)
+        expected.remove_old(sweep_idx, 2)
+
+        np.testing.assert_array_equal(hist.sweep_idx, expected.sweep_idx)
+        np.testing.assert_array_equal(hist.dist, expected.dist)
+        sweep_times = (np.array(expected.sweep_idx) - sweep_idx) / 10
+        np.testing.assert_array_equal(hist.sweep_times(sweep_idx, 10), sweep_times)
+
+    # Never more than four points at a time, so the head went round without growing
+    assert hist.capacity == 4
+
+    for sweep_idx in range(50, 60):
+        hist.append(sweep_idx, 0.5 * sweep_idx)
+        expected.append(sweep_idx, 0.5 * sweep_idx)
+
+    assert hist.capacity == 16
+    np.testing.assert_array_equal(hist.sweep_idx, expected.sweep_idx)
+    np.testing.assert_array_equal(hist.dist, expected.dist)
+
+
+def test_process_history_matches_lists():
+    module = importlib.import_module("processor")
+    threshold_type = module.ProcessingConfiguration.ThresholdType.FIXED
+    processor = get_processor(
+        module, 200, nbr_average=2, history_length_s=3, threshold_type=threshold_type
+    )
+    max_age = processor.history_length_s * processor.f
+    rng = np.random.default_rng(5)
+    depths = np.arange(200)
+
+    hists = {key: ListPeakHistory() for key in ["main_peak", "minor_peaks", "above_thres"]}
+
+    for sweep_index in range(300):
+        peaks = rng.choice(200, int(rng.integers(0, 4)), replace=False)
+        sweep = rng.normal(200, 20, 200)
+        for d in peaks:
+            sweep += rng.uniform(500, 3000) * np.exp(-(((depths - d) / 5) ** 2))
+
+        out_data = processor.process(sweep, {})
+        found_peaks = out_data["found_peaks"]
+
+        if found_peaks is not None:
+            r = processor.r
+            for i, p in enumerate(found_peaks):
+                hists["main_peak" if i == 0 else "minor_peaks"].append(sweep_index, r[p])
+
+            first_point = processor.find_first_point_above_threshold(
+                out_data["last_mean_sweep"], out_data["threshold"]
+            )
+            if first_point is not None:
+                hists["above_thres"].append(sweep_index, r[first_point])
+
+            for hist in hists.values():
+                hist.remove_old(sweep_index, max_age)
+
+        for key, hist in hists.items():
+            sweep_s = (np.array(hist.sweep_idx) - sweep_index) / processor.f
+            np.testing.assert_array_equal(out_data[key + "_hist_sweep_s"], sweep_s)
+            np.testing.assert_array_equal(out_data[key + "_hist_dist"], np.array(hist.dist))
+
+    # The main peak history is trimmed well before it fills up, and wraps around in place
+    assert len(hists["main_peak"].sweep_idx) > 0
+    assert processor.main_peak_hist.capacity == 17
+
+
+@pytest.mark.parametrize("threshold_type", ["FIXED", "CFAR"])
+@pytest.mark.parametrize("nbr_average", [1, 3])
+def test_process_lean_matches_process(processor_module, threshold_type, nbr_average):
+    threshold_type = processor_module.ProcessingConfiguration.ThresholdType[threshold_type]
+    kwargs = dict(nbr_average=nbr_average, threshold_type=threshold_type)
+    processor = get_processor(processor_module, 1000, **kwargs)
+    lean_processor = get_processor(processor_module, 1000, **kwargs)
+    rng = np.random.default_rng(6)
+    depths = np.arange(1000)
+
+    num_means = num_means_with_peaks = 0
+    for sweep_index in range(60):
+        sweep = rng.normal(200, 20, 1000)
+        for d in rng.choice(1000, 3, replace=False):
+            sweep += rng.uniform(500, 3000) * np.exp(-(((depths - d) / 20) ** 2))
+
+        out_data = processor.process(sweep, {})
+        result = lean_processor.process_lean(sweep)
+
+        if out_data["found_peaks"] is None:
+            assert result is None
+            continue
+
+        assert result.sweep_index == out_data["sweep_index"] == sweep_index
+        assert result.found_peaks == out_data["found_peaks"]
+        np.testing.assert_array_equal(result.distances, processor.r[out_data["found_peaks"]])
+        np.testing.assert_array_equal(lean_processor.last_mean_sweep, out_data["last_mean_sweep"])
+        num_means += 1
+        num_means_with_peaks += len(result.found_peaks) > 0
+
+    assert num_means == 60 // nbr_average
+    assert num_means_with_peaks > num_means // 2
+
+
+@pytest.mark.parametrize("threshold_type", ["FIXED", "CFAR"])
+@pytest.mark.parametrize("nbr_average", [1, 3, 5])
+def test_process_batch_matches_process(processor_module, threshold_type, nbr_average):
+    threshold_type = processor_module.ProcessingConfiguration.ThresholdType[threshold_type]
+    kwargs = dict(nbr_average=nbr_average, threshold_type=threshold_type, history_length_s=3)
+    processor = get_processor(processor_module, 1000, **kwargs)
+    batch_processor = get_processor(processor_module, 1000, **kwargs)
+    rng = np.random.default_rng(8)
+    depths = np.arange(1000)
+
+    sweeps = rng.normal(200, 20, (300, 1000))
+    for sweep in sweeps:
+        for d in rng.choice(1000, 3, replace=False):
+            sweep += rng.uniform(500, 3000) * np.exp(-(((depths - d) / 20) ** 2))
+
+    # Uneven blocks, starting and ending within averaged sweeps
+    block_sizes = [1, 4, 0, 7, 2, 13, 5, 30, 3, 1, 100]
+    block_sizes.append(len(sweeps) - sum(block_sizes))
+
+    start = 0
+    for block_size in block_sizes:
+        block = sweeps[start : start + block_size]
+        result = batch_processor.process_batch(block, [{}] * block_size)
+
+        expected = [processor.process(sweep, {}) for sweep in block]
+        expected = [out_data for out_data in expected if out_data["found_peaks"] is not None]
+        found_peaks = [out_data["found_peaks"] for out_data in expected]
+
+        assert result["sweep_index"].tolist() == [out_data["sweep_index"] for out_data in expected]
+        assert result["num_found_peaks"].tolist() == [len(peaks) for peaks in found_peaks]
+        assert result["found_peaks"].tolist() == [p for peaks in found_peaks for p in peaks]
+        main_peak_dist = [processor.r[peaks[0]] if peaks else np.nan for peaks in found_peaks]
+        np.testing.assert_array_equal(result["main_peak_dist"], main_peak_dist)
+
+        for j, out_data in enumerate(expected):
+            np.testing.assert_array_equal(result["last_mean_sweep"][j], out_data["last_mean_sweep"])
+
+        # The averaging carries over to the next call in the same state
+        assert batch_processor.sweeps_since_mean == processor.sweeps_since_mean
+        assert batch_processor.sweep_index == processor.sweep_index
+        np.testing.assert_array_equal(
+            batch_processor.current_mean_sweep, processor.current_mean_sweep
+        )
+        np.testing.assert_array_equal(batch_processor.last_mean_sweep, processor.last_mean_sweep)
+
+        # Only processor.py keeps a history
+        for hist in ["main_peak_hist", "minor_peaks_hist", "above_thres_hist"]:
+            if hasattr(processor, hist):
+                batch_hist = getattr(batch_processor, hist)
+                expected_hist = getattr(processor, hist)
+                np.testing.assert_array_equal(batch_hist.sweep_idx, expected_hist.sweep_idx)
+                np.testing.assert_array_equal(batch_hist.dist, expected_hist.dist)
+
+        start += block_size
+
+    assert start == len(sweeps)
+    assert len(result["sweep_index"]) > 0
@@ -0,0 +1,178 @@
+import numpy as np
+import pytest
+
+import acconeer.exptool as et
+from acconeer.exptool.recording import StreamingRecorder
+
+
+def get_recorder(path):
+    sensor_config = et.configs.EnvelopeServiceConfig()
+    session_info = {"range_start_m": 0.2, "range_length_m": 0.1, "data_length": 10}
+    return StreamingRecorder(path, sensor_config=sensor_config, session_info=session_info)
+
+
+def test_data_info_round_trip(tmp_path):
+    path = tmp_path / "record.h5"
+    data = np.arange(10, dtype=float)
+
+    with get_recorder(path) as recorder:
+        # Known keys are typed by DATA_INFO_DTYPES rather than by the first value
+        recorder.sample({"sequence_number": 1, "server_time": 1, "gain": 0.5}, data)
+        recorder.sample({"sequence_number": 2, "server_time": 2.5, "gain": 1}, data)
+
+    record = et.recording.load(path)
+    assert record.data_info == [
+        [{"sequence_number": 1, "server_time": 1.0, "gain": 0.5}],
+        [{"sequence_number": 2, "server_time": 2.5, "gain": 1.0}],
+    ]
+
+
+@pytest.mark.parametrize(
+    "first_info, info",
+    [
+        ({"counter": 1}, {"counter": 1.5}),  # float for an int column
+        ({"flag": True}, {"flag": 2}),  # int for a bool column
+        ({"data_saturated": False}, {"data_saturated": 0.5}),
+        ({"a": 1, "b": 2}, {"a": 1}),  # missing key
+        ({"a": 1}, {"a": 1, "b": 2}),  # unexpected key
+    ],
+)
+def test_data_info_mismatch_raises(tmp_path, first_info, info):
+    data = np.arange(10, dtype=float)
+
+    with get_recorder(tmp_path / "record.h5") as recorder:
+        recorder.sample(first_info, data)
+
+        with pytest.raises(ValueError):
+            recorder.sample(info, data)
+
+
+def save_record(path, fmt):
+    """Save a recording of 25 samples in the format fmt, and get its filename."""
+    sensor_config = et.configs.EnvelopeServiceConfig()
+    session_info = {"range_start_m": 0.2, "range_length_m": 0.1, "data_length": 10}
+    rng = np.random.default_rng(0)
+    data = rng.integers(0, 1000, (25, 1, 10))
+    data_info = [[{"sequence_number": i, "data_saturated": i % 3 == 0}] for i in range(25)]
+
+    if fmt == "streaming":
+        filename = path / "record.h5"
+        with StreamingRecorder(
+            filename, sensor_config=sensor_config, session_info=session_info, chunk_size=10
+        ) as recorder:
+            for info, sweep in zip(data_info, data):
+                recorder.sample(info[0], sweep[0].astype(float))
+
+        return filename
+
+    record = et.recording.Record(
+        mode=et.Mode.ENVELOPE,
+        sensor_config_dump=sensor_config._dumps(),
+        session_info=session_info,
+        data=data,
+        data_info=data_info,
+        timestamp="2020-01-01T00:00:00",
+        sample_times=100.0 + 0.1 * np.arange(25),
+    )
+
+    if fmt == "npz_uncompressed":
+        filename = path / "record.npz"
+        np.savez(filename, **et.recording.pack(record))
+    else:
+        filename = path / "record.{}".format(fmt)
+        et.recording.save(filename, record)
+
+    return filename
+
+
+def assert_records_equal(record, expected):
+    assert record.mode == expected.mode
+    assert record.sensor_config_dump == expected.sensor_config_dump
+    assert record.session_info == expected.session_info
+    assert record.timestamp == expected.timestamp
+    assert record.data.dtype == expected.data.dtype
+    np.testing.assert_array_equal(record.data, expected.data)
+    assert record.data_info == expected.data_info
+    np.testing.assert_array_equal(record.sample_times, expected.sample_times)
+
+
+RECORD_FORMATS = ["h5", "streaming", "npz", "npz_uncompressed"]
+
+
+@pytest.mark.parametrize("fmt", RECORD_FORMATS)
+def test_lazy_record_round_trip(tmp_path, fmt):
+    filename = save_record(tmp_path, fmt)
+    expected = et.recording.load(filename)
+
+    with et.recording.load_lazy(filename) as lazy:
+        assert len(lazy) == 25
+
+        if fmt == "npz":
+            # Compressed, the data is not read until it is needed
+            assert lazy._data is None
+        elif fmt == "npz_uncompressed":
+            assert isinstance(lazy._data, np.memmap)
+
+        assert_records_equal(lazy.load(), expected)
+        assert lazy.data_info == expected.data_info
+        np.testing.assert_array_equal(lazy.sample_times, expected.sample_times)
+
+
+@pytest.mark.parametrize("fmt", RECORD_FORMATS)
+@pytest.mark.parametrize(
+    "key",
+    [
+        slice(3, 17, 4),
+        slice(None, None, 3),
+        slice(-10, None),
+        slice(-12, -2, 5),
+        slice(20, 5),
+        slice(30, 40),
+    ],
+)
+def test_lazy_record_slice(tmp_path, fmt, key):
+    filename = save_record(tmp_path, fmt)
+    expected = et.recording.load(filename)
+
+    with et.recording.load_lazy(filename) as lazy:
+        record = lazy[key]
+
+    assert record.data.dtype == expected.data.dtype
+    np.testing.assert_array_equal(record.data, expected.data[key])
+    assert record.data_info == expected.data_info[key]
+    np.testing.assert_array_equal(record.sample_times, expected.sample_times[key])
+
+
+@pytest.mark.parametrize("fmt", RECORD_FORMATS)
+def test_lazy_record_index(tmp_path, fmt):
+    filename = save_record(tmp_path, fmt)
+    expected = et.recording.load(filename)
+
+    with et.recording.load_lazy(filename) as lazy:
+        for i in [0, 7, -1, -25]:
+            data_info, data = lazy[i]
+            assert data_info == expected.data_info[i]
+            np.testing.assert_array_equal(data, expected.data[i])
+
+        with pytest.raises(IndexError):
+            lazy[25]
+
+        with pytest.raises(ValueError):
+            lazy[::-1]
+
+
+@pytest.mark.parametrize("fmt", RECORD_FORMATS)
+def test_lazy_record_iteration(tmp_path, fmt):
+    filename = save_record(tmp_path, fmt)
+    expected = et.recording.load(filename)
+
+    # Read in chunks, the last of which is not full
+    with et.recording.LazyRecord(filename, chunk_size=7) as lazy:
+        samples = list(lazy)
+
+    assert len(samples) == 25
+    for (data_info, data), expected_data_info, expected_data in zip(
+        samples, expected.data_info, expected.data
+    ):
+        assert data_info == expected_data_info
+        np.testing.assert_array_equal(data, expected_data)
@@ -0,0 +1,176 @@
+import multiprocessing as mp
+
+import pytest
+
+from acconeer.exptool import configs
+from acconeer.exptool.clients.base import ClientError
+from acconeer.exptool.clients.reg import protocol, regmap
+from acconeer.exptool.clients.reg.client import PollingUARTClient, SPICommProcess
+from acconeer.exptool.modes import Mode
+from tests.stand_ins import FakeFT4222Device, ModuleStandInLink
+
+
+class RecordingLink(ModuleStandInLink):
+    """ModuleStandInLink which keeps the register writes of each send, as (addr, enc_val).
+
+    A write to fail_addr is answered with another value, as if it failed.
+    """
+
+    def __init__(self, fail_addr=None):
+        super().__init__(baudrate=3000000, latency=0.0, processing_time=0.0)
+        self.fail_addr = fail_addr
+        self.sends = []
+
+    def send(self, data):
+        self.sends.append([])
+        super().send(data)
+
+    def _handle(self, frame, t):
+        response = super()._handle(frame, t)
+
+        if isinstance(response, protocol.RegWriteResponse):
+            addr, enc_val = response.reg_val
+            self.sends[-1].append((addr, enc_val))
+
+            if addr == self.fail_addr:
+                failed_reg_val = protocol.RegVal(addr, b"\xff" * len(enc_val))
+                response = protocol.RegWriteResponse(failed_reg_val)
+
+        return response
+
+
+def get_client(link):
+    client = PollingUARTClient(None)
+    client._link = link
+    client._connected = True
+    return client
+
+
+def get_main_control_write(cmd):
+    reg = regmap.get_reg("main_control")
+    return (reg.addr, reg.encode(cmd))
+
+
+def test_setup_creates_session_after_config_writes():
+    link = RecordingLink()
+    get_client(link)._setup_session(configs.EnvelopeServiceConfig())
+
+    writes = [write for send in link.sends for write in send]
+    create = get_main_control_write("create")
+
+    # The session is created last, on its own
+    assert writes[-1] == create
+    assert writes.count(create) == 1
+    assert [send for send in link.sends if create in send] == [[create]]
+    assert len(writes) > 2
+
+
+def test_setup_does_not_create_session_after_failed_write():
+    link = RecordingLink(fail_addr=regmap.get_reg_addr("streaming_control"))
+
+    with pytest.raises(ClientError):
+        get_client(link)._setup_session(configs.EnvelopeServiceConfig())
+
+    writes = [write for send in link.sends for write in send]
+    assert get_main_control_write("create") not in writes
+
+
+class ModeProbeLink(RecordingLink):
+    """RecordingLink on which selecting one of unsupported_modes sets ERROR_SET_MODE."""
+
+    def __init__(self, unsupported_modes):
+        super().__init__()
+        self.unsupported_modes = unsupported_modes
+
+    def _handle(self, frame, t):
+        response = super()._handle(frame, t)
+
+        if isinstance(response, protocol.RegWriteResponse):
+            if response.reg_val in [get_mode_selection_write(m) for m in self.unsupported_modes]:
+                status = regmap.STATUS_FLAGS.ERROR_SET_MODE
+            elif response.reg_val == get_main_control_write("clear_status"):
+                status = regmap.STATUS_FLAGS(0)
+            else:
+                return response
+
+            self._reg_vals[regmap.STATUS_REG.addr] = regmap.STATUS_REG.encode(status)
+
+        return response
+
+
+def get_mode_selection_write(mode):
+    reg = regmap.get_reg("mode_selection")
+    return (reg.addr, reg.encode(mode))
+
+
+def test_supported_modes_clears_status_on_errors_only():
+    link = ModeProbeLink([Mode.POWER_BINS, Mode.IQ])
+
+    assert get_client(link)._get_supported_modes() == {Mode.ENVELOPE, Mode.SPARSE}
+
+    # Once before probing, then right after each failed mode selection
+    clear = get_main_control_write("clear_status")
+    writes = [write for send in link.sends for write in send]
+    assert writes == [
+        clear,
+        get_mode_selection_write(Mode.POWER_BINS),
+        clear,
+        get_mode_selection_write(Mode.ENVELOPE),
+        get_mode_selection_write(Mode.IQ),
+        clear,
+        get_mode_selection_write(Mode.SPARSE),
+    ]
+
+
+class SPIRecordingDevice(FakeFT4222Device):
+    """FakeFT4222Device which keeps the names of the transfer methods called."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.transfers = []
+
+    def spi_master_single_write(self, data, is_end_transaction=True):
+        self.transfers.append("write")
+        return super().spi_master_single_write(data, is_end_transaction)
+
+    def spi_master_single_read(self, num_bytes, is_end_transaction=True):
+        self.transfers.append("read")
+        return super().spi_master_single_read(num_bytes, is_end_transaction)
+
+    def spi_master_single_read_write(self, write_data, is_end_transaction=True):
+        self.transfers.append("read_write")
+        return super().spi_master_single_read_write(write_data, is_end_transaction)
+
+
+def get_spi_frame(full_duplex):
+    """Get a frame from SPICommProcess, run in this process, and the transfers of the frame."""
+    device = SPIRecordingDevice(Mode.ENVELOPE, data_length=100)
+    device._set_reg("data_saturated", True)
+
+    proc = SPICommProcess(None, None, None, mp.Array("q", 2), full_duplex)
+    proc.dev = device
+    proc.update_state(Mode.ENVELOPE, None, 200)
+    proc.write_reg("main_control", "create", do_log=False)
+    proc.write_reg("main_control", "activate", do_log=False)
+    device.transfers.clear()
+
+    return proc.get_next(), device.transfers, len(proc.info_addrs)
+
+
+def test_spi_frame_one_request_at_a_time_by_default():
+    segment, transfers, num_info_regs = get_spi_frame(full_duplex=False)
+
+    # Status, buffer, data info and clearing the status, each written and then read
+    assert transfers == ["write", "read"] * (num_info_regs + 2) + ["write", "write"]
+
+    stream_data = protocol.unpack_stream_data_segment(segment)
+    assert len(stream_data.buffer) == 200
+    assert len(stream_data.result_info) == num_info_regs
+
+
+def test_spi_frame_full_duplex():
+    segment, transfers, num_info_regs = get_spi_frame(full_duplex=True)
+
+    assert "read_write" in transfers
+    assert len(transfers) < 2 * (num_info_regs + 3)
+    assert segment == get_spi_frame(full_duplex=False)[0]
@@ -0,0 +1,151 @@
+import os
+
+import numpy as np
+import pytest
+
+import acconeer.exptool as et
+import replay
+from processing import Processor
+
+
+def get_record(num_sweeps=50, data_length=1000, sample_times=True):
+    sensor_config = et.configs.EnvelopeServiceConfig()
+    sensor_config.update_rate = 10
+    session_info = {
+        "range_start_m": 0.2,
+        "range_length_m": data_length * 0.484e-3,
+        "data_length": data_length,
+    }
+
+    rng = np.random.default_rng(0)
+    depths = np.arange(data_length)
+    data = rng.normal(200, 20, (num_sweeps, 1, data_length))
+    for sweep in data[:, 0]:
+        for d in rng.choice(data_length, 3, replace=False):
+            sweep += rng.uniform(500, 3000) * np.exp(-(((depths - d) / 20) ** 2))
+
+    return et.recording.Record(
+        mode=et.Mode.ENVELOPE,
+        sensor_config_dump=sensor_config._dumps(),
+        session_info=session_info,
+        data=data,
+        data_info=[[{"sequence_number": i}] for i in range(num_sweeps)],
+        sample_times=100.0 + 0.1 * np.arange(num_sweeps) if sample_times else None,
+    )
+
+
+def test_expand_grid():
+    grid = {"nbr_average": [1, 5], "peak_sorting_type": ["CLOSEST", "STRONGEST"]}
+
+    assert replay.expand_grid(grid) == [
+        {"nbr_average": 1, "peak_sorting_type": "CLOSEST"},
+        {"nbr_average": 1, "peak_sorting_type": "STRONGEST"},
+        {"nbr_average": 5, "peak_sorting_type": "CLOSEST"},
+        {"nbr_average": 5, "peak_sorting_type": "STRONGEST"},
+    ]
+    assert replay.expand_grid({}) == [{}]
+
+
+@pytest.mark.parametrize(
+    "s, expected",
+    [
+        ("5", 5),
+        ("0.5", 0.5),
+        ("true", True),
+        ('"5"', "5"),
+        ("CFAR", "CFAR"),
+        ("", ""),
+    ],
+)
+def test_parse_value(s, expected):
+    value = replay.parse_value(s)
+    assert value == expected
+    assert type(value) is type(expected)
+
+
+@pytest.mark.parametrize(
+    "num_files, num_param_sets, num_workers, expected_chunk_sizes",
+    [
+        (1, 1, 4, [1]),
+        (2, 1, 4, [1, 1]),
+        (1, 5, 2, [3, 2]),
+        (1, 5, 8, [1, 1, 1, 1, 1]),
+        (2, 6, 4, [3, 3, 3, 3]),
+        (4, 3, 2, [3, 3, 3, 3]),
+    ],
+)
+def test_get_jobs(num_files, num_param_sets, num_workers, expected_chunk_sizes):
+    filenames = ["site_{}.h5".format(i) for i in range(num_files)]
+    param_sets = [{"nbr_average": i + 1} for i in range(num_param_sets)]
+    jobs = replay.get_jobs(filenames, param_sets, "out", num_workers)
+
+    assert [len(job_param_sets) for _, job_param_sets, _ in jobs] == expected_chunk_sizes
+
+    # Every recording gets every parameter set exactly once, each in a table of its own
+    for filename in filenames:
+        file_jobs = [job for job in jobs if job[0] == filename]
+        assert [params for job in file_jobs for params in job[1]] == param_sets
+
+    out_filenames = [out_filename for job in jobs for out_filename in job[2]]
+    assert len(set(out_filenames)) == num_files * num_param_sets
+
+    if num_param_sets == 1:
+        assert out_filenames[0] == os.path.join("out", "site_0.csv")
+    else:
+        assert out_filenames[1] == os.path.join("out", "site_0_p001.csv")
+
+
+def test_get_jobs_same_stem():
+    filenames = [os.path.join("a", "site.h5"), os.path.join("b", "site.h5"), "other.npz"]
+    jobs = replay.get_jobs(filenames, [{}], "out", 1)
+
+    assert [out_filenames for _, _, out_filenames in jobs] == [
+        [os.path.join("out", "a_site.csv")],
+        [os.path.join("out", "b_site.csv")],
+        [os.path.join("out", "other.csv")],
+    ]
+
+    with pytest.raises(ValueError):
+        replay.get_jobs(["site.h5", "site.h5"], [{}], "out", 1)
+
+
+@pytest.mark.parametrize("nbr_average", [1, 3])
+def test_replay_record(nbr_average):
+    record = get_record()
+    params = {"nbr_average": nbr_average, "threshold_type": "FIXED"}
+    table = replay.replay_record(record, params)
+
+    processor = Processor(
+        record.sensor_config, replay.get_processing_config(params), record.session_info
+    )
+    expected = [processor.process(sweep[0], {}) for sweep in record.data]
+    expected = [out_data for out_data in expected if out_data["found_peaks"] is not None]
+
+    sweep_idxs = [out_data["sweep_index"] for out_data in expected]
+    assert table["sweep_index"].tolist() == sweep_idxs
+    np.testing.assert_array_equal(table["sample_time"], record.sample_times[sweep_idxs])
+
+    # One array of distances per averaged sweep, the main peak first
+    assert len(table["found_peaks_dist_m"]) == len(expected)
+    for j, out_data in enumerate(expected):
+        dists = processor.r[out_data["found_peaks"]]
+        np.testing.assert_array_equal(table["found_peaks_dist_m"][j], dists)
+        assert table["num_found_peaks"][j] == len(dists)
+        if len(dists) > 0:
+            assert table["main_peak_dist_m"][j] == dists[0]
+        else:
+            assert np.isnan(table["main_peak_dist_m"][j])
+
+    assert np.count_nonzero(table["num_found_peaks"]) > len(expected) // 2
+
+
+def test_replay_record_without_sample_times():
+    table = replay.replay_record(get_record(sample_times=False), {"nbr_average": 1})
+    assert len(table["sample_time"]) == 50
+    assert np.all(np.isnan(table["sample_time"]))
+
+    # Sample times which do not match the sweeps are left out rather than misaligned
+    record = get_record()
+    record.sample_times = record.sample_times[:-1]
+    table = replay.replay_record(record, {"nbr_average": 1})
+    assert np.all(np.isnan(table["sample_time"]))